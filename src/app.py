@@ -1,21 +1,224 @@
 # python-chess: https://python-chess.readthedocs.io/en/latest/
 # Flask: https://flask.palletsprojects.com/en/3.0.x/
 
+import hashlib
+import itertools
+import json
+import os
+import secrets
+import sys
+from collections import OrderedDict
+from collections.abc import Generator
 from enum import StrEnum
-from random import randint
-from time import sleep
+from random import choices, randint
+from threading import BoundedSemaphore, Lock, Thread, Timer
+from time import monotonic, perf_counter, sleep
 
-from chess import STARTING_FEN, Board
-from chess.engine import Limit, SimpleEngine
-from chess.polyglot import open_reader  # type: ignore
-from flask import Flask, redirect, render_template, request
+from chess import STARTING_FEN, Board, Move
+from chess.engine import EngineError, InfoDict, Limit, SimpleAnalysisResult, SimpleEngine
+from chess.polyglot import zobrist_hash  # type: ignore
+from flask import Flask, Response, g, make_response, redirect, render_template, request, send_file, stream_with_context
+
+from engines.book_index import open_index, raw_move_uci
+from hibernation import GameStore
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, exposition
+from spectators import Hub
+from sprites import COMPRESSED_VARIANTS, SPRITES_DIRECTORY, load_manifest
+from strength import LEVELS, TIME_LIMIT, level_limit, level_options, load_ratings
+from supervisor import Supervisor
+from tracing import Span, tracer_from_config
 
 app = Flask(__name__)
 
+opening_book = open_index()  # every bundled book merged into one memory-mapped index, shared by all games
+
+EXPLORER_PLIES = 3  # book positions up to this many half moves deep are precomputed at startup
+EXPLORER_CACHE_SIZE = 100000  # explored positions kept in the cache, the least recently requested are dropped beyond it
+EXPLORER_MAX_AGE = 86400  # seconds browsers and CDNs may cache an answer, answers only change when the index does
+explorer_cache: OrderedDict[tuple[int, str], bytes] = OrderedDict()  # (zobrist key, canonical book mix) -> JSON response body, least recently used first
+explorer_lock = Lock()
+
+sprite_sheets = load_manifest()  # piece theme -> file name of its sprite sheet, rebuilt at startup when the images change
+SPRITE_MAX_AGE = 31536000  # sheets are named by their content, so browsers may keep them for a year without asking again
+
+THINK_TIMES = (1, 3, 5, 10, 30)  # the game settings form's think-times, others are labeled "other" in the metrics
+OTHER_LABEL = "other"  # metric label of settings the form doesn't offer, so that clients can't add series at will
+
+THINKING_INTERVAL = 0.25  # minimum seconds between engine thinking updates streamed to the browser
+
+PONDER_TIMEOUT = 60  # seconds an engine may ponder while waiting for the user before it is stopped
+ponder_slots = BoundedSemaphore(max(1, (os.cpu_count() or 2) // 2))  # engines allowed to ponder at the same time
+
+class Ponder:
+    """An engine thinking on the user's time about the position after the user's expected reply."""
+
+    def __init__(self, engine: SimpleEngine, board: Board, move: Move, game_id: str) -> None:
+        # The caller must hold one of the ponder slots, which is released once pondering stops
+        self.position = board.copy()
+        self.position.push(move)
+        self.analysis: SimpleAnalysisResult = engine.analysis(self.position, game=game_id)
+        self.lock = Lock()
+        self.stopped = False
+        self.timer = Timer(PONDER_TIMEOUT, self.stop)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def hit(self, time_limit: float) -> SimpleAnalysisResult:
+        # The user played the expected move: the search carries on for the usual think-time from now on
+        self.timer.cancel()
+        self.timer = Timer(time_limit, self.stop)
+        self.timer.daemon = True
+        self.timer.start()
+        return self.analysis
+
+    def stop(self) -> None:
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        self.timer.cancel()
+        try:
+            self.analysis.stop()
+        except EngineError:  # the engine has exited, so it has stopped pondering anyway
+            pass
+        ponder_slots.release()
+
+ENGINE_MEMORY_LIMIT = int(os.environ.get("WEBCHESS_ENGINE_MEMORY_LIMIT", "2048")) * 1024 * 1024  # bytes of address space per engine process, 0 for no limit
+ENGINE_CPU_LIMIT = int(os.environ.get("WEBCHESS_ENGINE_CPU_LIMIT", "3600"))  # seconds of CPU time per engine process, 0 for no limit
+WATCHDOG_MARGIN = float(os.environ.get("WEBCHESS_WATCHDOG_MARGIN", "5"))  # seconds past the think-time before a search is killed
+ENGINE_ATTEMPTS = 2  # searches per move, each one after the first on a new process of the engine
+ENGINE_POOL_SIZE = int(os.environ.get("WEBCHESS_ENGINE_POOL", "2"))  # idle engines of each kind kept for new games
+supervisor = Supervisor(ENGINE_MEMORY_LIMIT, ENGINE_CPU_LIMIT, WATCHDOG_MARGIN, ENGINE_POOL_SIZE)
+
+ENGINE_COMMANDS = {  # the game settings form's engines -> the command and working directory that start them
+    "simPLY_chess": ([sys.executable, "-E", "-S", "-m", "simPLY_chess"], "engines"),  # as a module so its bytecode is cached
+    "komodo": (r"engines/komodo14", None),
+    "stockfish": (r"engines/stockfish16", None),
+}
+if any(name.startswith("WEBCHESS_STUB_") for name in os.environ):  # only offered to load tests, which configure it this way
+    ENGINE_COMMANDS["stub"] = ([sys.executable, "-E", "-m", "stub_engine"], "engines")
+
+HASH_SNAPSHOTS = 16  # released engines save their tables to this many snapshot files in turn, overwriting the oldest
+hash_snapshot_turns = itertools.count()
+
+GAME_COOKIE = "game"  # holds the id of the browser's game
+HIBERNATE_AFTER = float(os.environ.get("WEBCHESS_HIBERNATE_AFTER", "120"))  # seconds without a request before a game is hibernated
+HIBERNATE_INTERVAL = 10  # seconds between looks for idle games
+GAME_MAX_AGE = 604800  # seconds a hibernated game is kept for its player to come back to
+
+spectator_hub = Hub()  # the live games' moves and engine thinking, sent to everyone watching
+
+strength_ratings = load_ratings()  # engine -> level -> the Elo calibrate.py measured it playing at
+
+class Game:
+    """A user's game against an engine. It stays in memory while it is played and is hibernated to disk after being idle
+    for a while, which gives its engine back until the game's next move wakes it up. Its moves are published to the
+    spectators of its watch id, which is derived from the (secret) game id so that it can be shared without giving the
+    game away. Games on a strength level search a fixed amount per move (see strength.py) instead of for `time_limit`
+    seconds."""
+
+    def __init__(self, game_id: str, opponent: str, color: str, book_mix: None | str, time_limit: int, ponder: bool, level: None | int, moves: None | list[Move] = None) -> None:
+        self.id = game_id
+        self.watch_id = hashlib.sha256(game_id.encode()).hexdigest()[:16]
+        self.opponent = opponent if opponent in ENGINE_COMMANDS else "stockfish"
+        self.color = color
+        self.book_mix = book_mix
+        self.level = level if level in LEVELS else None
+        self.time_limit = time_limit if self.level is None else TIME_LIMIT
+        self.board = Board(STARTING_FEN)
+        self.sans: list[str] = []  # the moves so far, as spectators joining the game are sent them
+        for move in moves or []:
+            if not self.board.is_legal(move):
+                raise ValueError(f"illegal move {move} in hibernated game {game_id}")
+            self.sans.append(self.board.san_and_push(move))
+
+        command, cwd = ENGINE_COMMANDS[self.opponent]
+        self.engine: SimpleEngine = supervisor.acquire(command, cwd)
+        self.engine_name = self.engine.id.get("name", "unknown")
+        self.ponder = ponder and "Ponder" in self.engine.options and self.level is None  # engines able to ponder can be stopped mid-search, levels don't depend on the user's think-time
+        self.pondering: None | Ponder = None
+        self.requests = 0  # requests for the game in progress, it isn't hibernated while there are any
+        self.last_active = monotonic()
+        self.ended = False  # replaced by a new game, the engine is released once the last request is done
+        self.channel = spectator_hub.open(self.watch_id, self.snapshot)
+
+    def settings(self) -> dict:
+        return {"engine": self.opponent, "color": self.color, "book": self.book_mix, "time": self.time_limit, "ponder": self.ponder, "level": self.level}
+
+    def snapshot(self) -> dict:
+        return {
+            "white": "Player" if self.color == "white" else self.engine_name,
+            "black": "Player" if self.color == "black" else self.engine_name,
+            "moves": self.sans,
+            "fen": self.board.fen(en_passant="fen"),
+            "result": self.board.result(),
+        }
+
+    def push(self, move: Move) -> str:
+        # Plays a move (already checked to be legal) and returns it in SAN
+        with self.channel.update():
+            san = self.board.san_and_push(move)
+            self.sans.append(san)
+        if self.channel.subscribers > 0:
+            self.channel.publish("move", {"move": san, "ply": len(self.sans), "fen": self.board.fen(en_passant="fen")})
+        return san
+
+    def stop_pondering(self) -> None:
+        if self.pondering is not None:
+            self.pondering.stop()
+            self.pondering = None
+
+    def release(self) -> None:
+        self.stop_pondering()
+        if not self.engine.returncode.done() and "SaveHash" in self.engine.options and "HashFile" in self.engine.options:
+            try:
+                # The game's searches go into the shared snapshot when hash_snapshot.py next merges. They are saved to a
+                # fixed set of files in turn rather than one per engine process, so the files don't pile up
+                hash_file = f"app-{next(hash_snapshot_turns) % HASH_SNAPSHOTS}.tt"
+                self.engine.configure({"HashFile": hash_file, "SaveHash": None})
+            except (EngineError, TimeoutError):
+                pass
+        supervisor.release(self.engine)
+        if self.ended:
+            self.channel.close()
+        else:
+            spectator_hub.detach(self.channel)
+
+games: dict[str, Game] = {}  # games in memory by id, the others are hibernated in the store
+games_lock = Lock()
+game_store = GameStore()
+
+def live_games() -> int:
+    with games_lock:
+        return sum(not game.board.is_game_over() for game in games.values())
+
+request_seconds = Histogram("webchess_request_duration_seconds", "Time spent answering HTTP requests, including streamed bodies.", ("endpoint", "method", "status"))
+move_seconds = Histogram("webchess_move_duration_seconds", "Time spent finding the server's move, book probe and search included.", ("engine", "think_time"))
+search_seconds = Histogram("webchess_search_duration_seconds", "Time spent in engine searches.", ("engine", "think_time"))
+book_probe_seconds = Histogram("webchess_book_probe_duration_seconds", "Time spent probing the opening book for a move.", ("book",))
+book_probes = Counter("webchess_book_probes_total", "Opening book probes by whether the book had a move.", ("book", "result"))
+ponder_results = Counter("webchess_ponder_total", "Engine turns that found the engine pondering, by whether the user played the expected move.", ("result",))
+errors = Counter("webchess_errors_total", "Error responses by error code.", ("code",))
+engine_nodes = Counter("webchess_engine_nodes_total", "Nodes searched by the engines.", ("engine",))
+engine_depth = Gauge("webchess_engine_depth", "Depth reached by the engine's last search.", ("engine",))
+engine_nps = Gauge("webchess_engine_nps", "Nodes per second of the engine's last search.", ("engine",))
+hibernations = Counter("webchess_game_hibernations_total", "Games hibernated to disk and woken up again.", ("event",))
+Gauge("webchess_active_games", "Games in progress that are in memory.", function=live_games)
+Gauge("webchess_hibernated_games", "Games hibernated to disk.", function=lambda: len(game_store))
+
+TRACE_SINK = os.environ.get("WEBCHESS_TRACE", "")  # JSONL file or OTLP/HTTP collector endpoint, tracing is off if empty
+TRACE_SAMPLE_RATE = float(os.environ.get("WEBCHESS_TRACE_SAMPLE_RATE", "1"))  # share of moves traced at random
+TRACE_SLOW_MOVE = float(os.environ.get("WEBCHESS_TRACE_SLOW_MOVE", "0")) or None  # moves slower than this are always traced
+tracer = tracer_from_config(TRACE_SINK, TRACE_SAMPLE_RATE, TRACE_SLOW_MOVE)
+
 class Error(StrEnum):
     INVALID_CONTENT_TYPE = "invalid_content_type"
     MISSING_MOVE = "missing_move"
     INVALID_MOVE = "invalid_move"
+    INVALID_FEN = "invalid_fen"
+    INVALID_BOOK = "invalid_book"
+    NO_GAME = "no_game"
+    ENGINE_FAILURE = "engine_failure"
 
     def __str__(self) -> str:
         if self == Error.INVALID_CONTENT_TYPE:
@@ -24,20 +227,51 @@ class Error(StrEnum):
             return "Expected move in request body"
         elif self == Error.INVALID_MOVE:
             return "Invalid user move"
+        elif self == Error.INVALID_FEN:
+            return "Invalid FEN in query string"
+        elif self == Error.INVALID_BOOK:
+            return "Unknown opening book in query string"
+        elif self == Error.NO_GAME:
+            return "No game in progress, start a new one"
+        elif self == Error.ENGINE_FAILURE:
+            return "The engine failed to move, start a new game"
         else:
             raise ValueError("Unknown Error StrEnum value")
 
 
+@app.before_request
+def start_timer():
+    g.request_start = perf_counter()
+    if request.endpoint == "move":
+        g.trace = tracer.start("move", route=request.path, method=request.method)
+
+@app.after_request
+def observe_request(response: Response) -> Response:
+    # Streamed responses are only finished once their body has been sent, so they are timed when the response closes
+    labels = {"endpoint": request.endpoint or "none", "method": request.method, "status": response.status_code}
+    start = g.request_start
+    response.call_on_close(lambda: request_seconds.observe(perf_counter() - start, **labels))
+    if "trace" in g:
+        g.trace.set(status=response.status_code)
+        response.call_on_close(g.trace.end)  # a streamed move is only traced completely once it has been sent
+    if "game" in g:
+        game = g.game
+        response.call_on_close(lambda: finish_game_request(game))  # likewise, the game is in use until then
+    return response
+
+@app.teardown_request
+def trace_error(exception: None | BaseException):
+    if exception is not None and "trace" in g:
+        g.trace.error = f"{type(exception).__name__}: {exception}"
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html", levels=LEVELS)
 
 @app.route("/play", methods=["GET", "POST"])
 def play():
-    global board, engine, book_path, time_limit
-
     if request.method == "POST":
-        board = Board(STARTING_FEN)
+        end_game(request.cookies.get(GAME_COOKIE, ""))
 
         piece_theme = request.form.get("piece-theme", "neo")
 
@@ -45,19 +279,11 @@ def play():
         if color == "random":
             color = ["white", "black"][randint(0, 100) % 2]
 
-        opponent = request.form.get("engine", "stockfish")
-        if opponent == "simPLY_chess":
-            engine = SimpleEngine.popen_uci(r"engines/simPLY_chess.py")
-        elif opponent == "komodo":
-            engine = SimpleEngine.popen_uci(r"engines/komodo14")
-        else:
-            engine = SimpleEngine.popen_uci(r"engines/stockfish16")
-
-        opening_book = request.form.get("opening-book", "no-book")
-        if opening_book == "no-book":
-            book_path = None
+        book_mix = request.form.get("opening-book", "no-book")
+        if book_mix == "no-book":
+            book_mix = None
         else:
-            book_path = r"engines/opening-books/" + opening_book
+            book_mix = opening_book.mix_name(book_mix) or OTHER_LABEL  # unknown books have no moves either way
 
         time = request.form.get("think-time", "1")
         try:
@@ -65,58 +291,415 @@ def play():
         except ValueError:
             time_limit = 1
 
-        return render_template("play.html", engine=engine.id["name"], position=board.fen(en_passant="fen"), orientation=color, theme=piece_theme)  # type: ignore
+        level = request.form.get("strength", "full")
+        level = int(level) if level.isdigit() else None
+
+        game = Game(secrets.token_urlsafe(16), request.form.get("engine", "stockfish"), color, book_mix, time_limit, request.form.get("ponder", "off") == "on", level)
+        with games_lock:
+            games[game.id] = game
+
+        sprite = f"/sprites/{sprite_sheets[piece_theme]}" if piece_theme in sprite_sheets else ""
+        engine_name = game.engine.id["name"]
+        if game.level is not None:
+            rating = strength_ratings.get(game.opponent, {}).get(str(game.level))
+            engine_name += f" (level {game.level}{f', {rating} Elo' if rating is not None else ''})"
+        response = make_response(render_template("play.html", engine=engine_name, position=game.board.fen(en_passant="fen"), orientation=color, theme=piece_theme, sprite=sprite, watch=game.watch_id))  # type: ignore
+        response.set_cookie(GAME_COOKIE, game.id, max_age=GAME_MAX_AGE, httponly=True, samesite="Lax")
+        return response
 
     return redirect("/")
 
 
 @app.route("/move", methods=["POST"])
 def move():
-    global board
+    trace: Span = g.trace
+    with trace.child("validate") as validate:
+        if request.content_type != 'application/json':
+            return error_response(Error.INVALID_CONTENT_TYPE), 400
 
-    if request.content_type != 'application/json':
-        return error_response(Error.INVALID_CONTENT_TYPE), 400
+        game = open_game(request.cookies.get(GAME_COOKIE, ""))
+        if game is None:
+            return error_response(Error.NO_GAME), 400
+        board = game.board
 
-    request_body = request.get_json()
+        request_body = request.get_json()
 
-    client_san_move = request_body.get("move")
-    if client_san_move is None:
-        if (board.fen(en_passant="fen") == STARTING_FEN and board.ply() == 0):  # type: ignore
-            return {"move": server_turn(), "fen": board.fen(en_passant="fen")}  # type: ignore
+        client_san_move = request_body.get("move")
+        validate.set(move=str(client_san_move))
+        if client_san_move is None:
+            if (board.fen(en_passant="fen") == STARTING_FEN and board.ply() == 0):  # type: ignore
+                validate.end()
+                return server_response(game, trace)
 
-        return error_response(Error.MISSING_MOVE), 400
+            return error_response(Error.MISSING_MOVE), 400
 
-    client_move = board.parse_san(client_san_move)
-    if client_move not in board.legal_moves:
-        response =  error_response(Error.INVALID_MOVE)
-        response["fen"] = board.fen(en_passant="fen")  # type: ignore
-        return response, 400
+        client_move = board.parse_san(client_san_move)
+        if client_move not in board.legal_moves:
+            response =  error_response(Error.INVALID_MOVE)
+            response["fen"] = board.fen(en_passant="fen")  # type: ignore
+            return response, 400
 
-    board.push(client_move)  # type: ignore
-    return {"move": server_turn(), "fen": board.fen(en_passant="fen")}  # type: ignore
+    game.push(client_move)  # type: ignore
+    return server_response(game, trace)
 
-def server_turn() -> None | str:
-    global board, engine, book_path, time_limit
+@app.route("/explore")
+def explore():
+    mix = opening_book.mix_name(request.args.get("book", "all"))  # so that equivalent mixes share cache entries and ETags
+    if mix is None:
+        return error_response(Error.INVALID_BOOK), 400
+    try:
+        explored_board = Board(request.args.get("fen", STARTING_FEN))
+    except ValueError:
+        return error_response(Error.INVALID_FEN), 400
 
-    if board.is_game_over():
+    key = zobrist_hash(explored_board)
+    etag = f"{opening_book.version}-{key:016x}-{mix}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(explore_position(explored_board, key, mix), mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = EXPLORER_MAX_AGE
+    return response
+
+@app.route("/sprites/<name>")
+def sprite(name):
+    if name not in sprite_sheets.values():
+        return Response(status=404)
+
+    # Send the precompressed copy of the sheet the browser prefers, falling back to the sheet itself
+    path = os.path.join(SPRITES_DIRECTORY, name)
+    encoding = None
+    for candidate, extension in sorted(COMPRESSED_VARIANTS.items(), key=lambda variant: -request.accept_encodings[variant[0]]):
+        if request.accept_encodings[candidate] > 0 and os.path.exists(path + extension):
+            encoding = candidate
+            path += extension
+            break
+    response = send_file(path, mimetype="image/svg+xml", conditional=True, max_age=SPRITE_MAX_AGE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/watch/<watch_id>")
+def watch(watch_id):
+    if spectator_hub.get(watch_id) is None:
+        return Response("No game in progress to watch", status=404, mimetype="text/plain")
+
+    piece_theme = request.args.get("theme", "neo")
+    sprite = f"/sprites/{sprite_sheets[piece_theme]}" if piece_theme in sprite_sheets else ""
+    return render_template("watch.html", watch=watch_id, theme=piece_theme, sprite=sprite)
+
+@app.route("/watch/<watch_id>/events")
+def watch_events(watch_id):
+    # Every spectator of a game reads the same encoded events, see spectators.py
+    channel = spectator_hub.get(watch_id)
+    if channel is None:
+        return Response(status=404)
+    return Response(channel.stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics")
+def metrics():
+    return Response(exposition(), content_type=CONTENT_TYPE)
+
+def open_game(game_id: str) -> None | Game:
+    # Returns the game with the given id, waking it up if it is hibernated, and counts the request towards it
+    with games_lock:
+        game = games.get(game_id)
+    if game is None:
+        try:
+            hibernated = game_store.load(game_id)
+        except ValueError:  # not a game id at all
+            return None
+        if hibernated is None:
+            return None
+        settings, moves = hibernated
+        try:
+            game = Game(game_id, settings["engine"], settings.get("color", "white"), settings["book"], settings["time"], settings["ponder"], settings.get("level"), moves)
+        except (KeyError, ValueError):
+            return None
+        hibernations.inc(event="woken")
+        with games_lock:
+            woken = games.setdefault(game_id, game)
+            if woken is game:
+                game_store.remove(game_id)  # until it is hibernated again
+        if woken is not game:  # another request woke it up first
+            game.release()
+            game = woken
+
+    with games_lock:
+        game.requests += 1
+        game.last_active = monotonic()
+    g.game = game
+    return game
+
+def finish_game_request(game: Game) -> None:
+    with games_lock:
+        game.requests -= 1
+        game.last_active = monotonic()
+        release = game.ended and game.requests == 0
+    if release:
+        game.release()
+
+def end_game(game_id: str) -> None:
+    with games_lock:
+        game = games.pop(game_id, None)
+        release = game is not None and game.requests == 0
+        if game is not None:
+            game.ended = True
+    game_store.remove(game_id)
+    if release:
+        game.release()  # type: ignore
+
+def hibernate_idle_games() -> None:
+    while True:
+        sleep(HIBERNATE_INTERVAL)
+        # The games are saved outside the lock, so that moves in other games don't wait for the disk
+        with games_lock:
+            idle = [(game, game.last_active, game.settings(), list(game.board.move_stack)) for game in games.values() if game.requests == 0 and monotonic() - game.last_active >= HIBERNATE_AFTER]
+        hibernated = []
+        for game, last_active, settings, moves in idle:
+            try:
+                game_store.save(game.id, settings, moves)
+            except OSError:  # kept in memory until it can be hibernated
+                continue
+            with games_lock:
+                if games.get(game.id) is game and game.requests == 0 and game.last_active == last_active:
+                    del games[game.id]
+                    hibernated.append(game)
+                    continue
+            game_store.remove(game.id)  # the game was played or ended while it was being saved
+        for game in hibernated:
+            game.release()
+            hibernations.inc(event="hibernated")
+        game_store.expire(GAME_MAX_AGE)
+
+def server_response(game: Game, trace: Span):
+    # Clients that accept server-sent events get the engine's thinking while it searches, streamed over the same
+    # request that is waiting for the move anyway, so watching the engine think costs no extra worker or engine time
+    if request.accept_mimetypes.best_match(["application/json", "text/event-stream"]) == "text/event-stream":
+        return Response(stream_with_context(server_turn_events(game, trace)), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    try:
+        server_move = server_turn(game, trace)
+    except (EngineError, TimeoutError) as error:
+        # The user's move has been played, so the client gets the position to carry on from
+        trace.error = f"{type(error).__name__}: {error}"
+        return {**error_response(Error.ENGINE_FAILURE), "fen": game.board.fen(en_passant="fen")}, 503  # type: ignore
+    return {"move": server_move, "fen": game.board.fen(en_passant="fen")}  # type: ignore
+
+def server_turn(game: Game, trace: Span) -> None | str:
+    turn = engine_turn(game, trace)
+    while True:
+        try:
+            game.channel.publish("info", next(turn))
+        except StopIteration as stop:
+            return stop.value
+
+def server_turn_events(game: Game, trace: Span) -> Generator[str, None, None]:
+    turn = engine_turn(game, trace)
+    while True:
+        try:
+            info = next(turn)
+        except StopIteration as stop:
+            yield server_sent_event("move", {"move": stop.value, "fen": game.board.fen(en_passant="fen")})  # type: ignore
+            return
+        except (EngineError, TimeoutError) as error:
+            # The response has already started, so the failure is sent as an event instead of an error status
+            trace.error = f"{type(error).__name__}: {error}"
+            response = error_response(Error.ENGINE_FAILURE)
+            response["fen"] = game.board.fen(en_passant="fen")  # type: ignore
+            yield server_sent_event("error", response)
+            return
+        game.channel.publish("info", info)
+        yield server_sent_event("info", info)
+
+def engine_turn(game: Game, trace: Span) -> Generator[dict, None, None | str]:
+    board = game.board
+    with trace.child("game_over") as span:
+        game_over = board.is_game_over()
+        span.set(game_over=game_over)
+    if game_over:
+        game.stop_pondering()
         return None
 
+    start = perf_counter()
+    game.engine = supervisor.revive(game.engine)  # the engine crashed or was killed since the last move
+    think_time = game.time_limit if game.time_limit in THINK_TIMES else OTHER_LABEL
+    labels = {"engine": game.engine.id.get("name", "unknown"), "think_time": think_time if game.level is None else f"level {game.level}"}
+    trace.set(**labels)
+
     move_object = None
-    if book_path is not None:
-        with open_reader(book_path) as reader:
-            try:
-                move_object = reader.weighted_choice(board).move
-            except IndexError:
-                move_object = None
+    if game.book_mix is not None:
+        with trace.child("book_probe", book=game.book_mix) as span:
+            move_object = book_move(board, game.book_mix)
+            span.set(hit=move_object is not None)
 
+    principal_variation = []
     if move_object is None:
-        move_object = engine.play(board, Limit(time=time_limit, depth=30)).move
+        with trace.child("engine_search", **labels) as span:
+            search_start = perf_counter()
+            for attempt in range(1, ENGINE_ATTEMPTS + 1):
+                try:
+                    with supervisor.watch(game.engine, game.time_limit):
+                        if game.pondering is not None and game.pondering.position == board:
+                            ponder_results.inc(result="hit")
+                            span.set(ponder="hit")
+                            analysis = game.pondering.hit(game.time_limit)
+                        else:
+                            if game.pondering is not None:
+                                ponder_results.inc(result="miss")
+                                span.set(ponder="miss")
+                            game.stop_pondering()
+                            # Engines from the pool start a new game, and are given the game's strength before every search
+                            # since restarted engines lose their options. No depth limit next to the time limit:
+                            # Komodo searches on to the depth and ignores the time
+                            limit = Limit(time=game.time_limit) if game.level is None else level_limit(game.opponent, game.level)
+                            analysis = game.engine.analysis(board, limit, game=game.id, options=level_options(game.engine.options, game.level))
+                        with analysis:
+                            principal_variation = yield from stream_thinking(board, game.engine, analysis, span)
+                            move_object = analysis.wait().move
+                    if move_object is None or move_object not in board.legal_moves:
+                        raise EngineError(f"engine played {move_object} in {board.fen()}")
+                    break
+                except (EngineError, TimeoutError) as error:
+                    # The engine crashed, was killed by the watchdog or answered nonsense: search again on a new process
+                    span.set(failures=attempt, failure=f"{type(error).__name__}: {error}")
+                    game.stop_pondering()
+                    game.engine = supervisor.restart(game.engine)
+                    if attempt == ENGINE_ATTEMPTS:
+                        raise
+            search_seconds.observe(perf_counter() - search_start, **labels)
+            game.stop_pondering()
     else:
+        game.stop_pondering()
         sleep(0.1)
 
-    server_move = board.san(move_object)  # type: ignore
-    board.push(move_object)  # type: ignore
+    with trace.child("render"):
+        server_move = game.push(move_object)  # type: ignore
+    move_seconds.observe(perf_counter() - start, **labels)
+
+    # Think about the position after the user's expected reply (the second move of the principal variation) until the
+    # user moves, as long as a ponder slot is free
+    if game.ponder and len(principal_variation) >= 2 and principal_variation[0] == move_object and not board.is_game_over():
+        if ponder_slots.acquire(blocking=False):
+            game.pondering = Ponder(game.engine, board, principal_variation[1], game.id)
     return server_move
 
+def stream_thinking(board: Board, engine: SimpleEngine, analysis: SimpleAnalysisResult, span: Span) -> Generator[dict, None, list[Move]]:
+    # Coalesce the engine's info lines so that at most a few updates per second reach the browser
+    pending = None
+    last_update = 0.0
+    principal_variation = []
+    search: dict = {}  # the latest depth, nodes and nps reported by the engine
+    for info in analysis:
+        search.update((key, info[key]) for key in ("depth", "seldepth", "nodes", "nps") if key in info)
+        if "score" not in info and "pv" not in info:
+            continue
+        principal_variation = info.get("pv", principal_variation)
+        pending = info
+        if monotonic() - last_update >= THINKING_INTERVAL:
+            yield thinking(board, pending)
+            pending = None
+            last_update = monotonic()
+    if pending is not None:
+        yield thinking(board, pending)
+
+    name = engine.id.get("name", "unknown")
+    if "depth" in search:
+        engine_depth.set(search["depth"], engine=name)
+    if "nps" in search:
+        engine_nps.set(search["nps"], engine=name)
+    engine_nodes.inc(search.get("nodes", 0), engine=name)
+    span.set(**search)
+    return principal_variation
+
+def thinking(board: Board, info: InfoDict) -> dict:
+    update: dict = {key: info[key] for key in ("depth", "seldepth", "nodes", "nps", "time") if key in info}
+    if "score" in info:
+        score = info["score"].white()
+        update["score"] = score.score()
+        update["mate"] = score.mate()
+    if "pv" in info:
+        try:
+            update["pv"] = board.variation_san(info["pv"])
+        except ValueError:  # the engine sent an illegal principal variation
+            pass
+    return update
+
+def server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def book_move(board: Board, mix: str) -> None | Move:
+    with book_probe_seconds.time(book=mix):
+        entries = book_moves(board, zobrist_hash(board), mix)
+    book_probes.inc(book=mix, result="hit" if entries else "miss")
+    if len(entries) == 0:
+        return None
+
+    return choices([entry[0] for entry in entries], weights=[entry[1] for entry in entries])[0]
+
+def book_moves(board: Board, key: int, mix: str) -> list[tuple[Move, int, int]]:
+    moves: list[tuple[Move, int, int]] = []
+    for raw_move, weight, learn in opening_book.entries(key, opening_book.mix(mix)):
+        try:
+            moves.append((board.parse_uci(raw_move_uci(raw_move)), weight, learn))
+        except ValueError:  # hash collision, the move isn't legal in this position
+            continue
+    return moves
+
+def explore_position(board: Board, key: int, mix: str) -> bytes:
+    with explorer_lock:
+        body = explorer_cache.get((key, mix))
+        if body is not None:
+            explorer_cache.move_to_end((key, mix))
+            return body
+
+    moves = book_moves(board, key, mix)
+    total_weight = sum(weight for _, weight, _ in moves)
+    candidates = []
+    for move, weight, learn in sorted(moves, key=lambda entry: entry[1], reverse=True):
+        board.push(move)
+        children = len(book_moves(board, zobrist_hash(board), mix))
+        board.pop()
+        candidates.append({
+            "uci": move.uci(),
+            "san": board.san(move),
+            "weight": weight,
+            "learn": learn,
+            "share": weight / total_weight,
+            "children": children,
+        })
+    body = json.dumps({"key": f"{key:016x}", "book": mix, "total_weight": total_weight, "moves": candidates}).encode()
+    with explorer_lock:
+        explorer_cache[(key, mix)] = body
+        if len(explorer_cache) > EXPLORER_CACHE_SIZE:
+            explorer_cache.popitem(last=False)
+    return body
+
+def precompute_explorer(plies: int, mix: str) -> None:
+    positions = [Board()]
+    seen: set[int] = set()
+    for _ in range(plies + 1):
+        next_positions = []
+        for position in positions:
+            key = zobrist_hash(position)
+            if key in seen:
+                continue
+            seen.add(key)
+            explore_position(position, key, mix)
+            for move, _, _ in book_moves(position, key, mix):
+                next_position = position.copy(stack=False)
+                next_position.push(move)
+                next_positions.append(next_position)
+        positions = next_positions
+
 def error_response(error: Error) -> dict[str, str]:
+    errors.inc(code=error.value)
     return {"error_code": error.value, "error_msg": str(error)}
+
+
+precompute_explorer(EXPLORER_PLIES, "all")
+Thread(target=hibernate_idle_games, name="game hibernation", daemon=True).start()
@@ -0,0 +1,103 @@
+"""Compares the mailbox and bitboard backends of simPLY_chess through its UCI loop: perft node counts and the nodes of a fixed
+depth search (both of which must match), and the speed of each. Run from within the `src` directory, e.g.
+`python benchmarks/backends.py --perft-depth 3 --search-depth 4`."""
+
+import argparse
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+ENGINE_DIRECTORY: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "engines")
+ENGINE_COMMAND: list[str] = [sys.executable, "-E", "-S", "-m", "simPLY_chess"]
+BACKENDS: tuple[str, ...] = ("mailbox", "bitboard")
+
+# Perft test positions from https://www.chessprogramming.org/Perft_Results, none of which are in the opening books
+POSITIONS: dict[str, str] = {
+    "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "endgame": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "promotions": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "middlegame": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+}
+
+
+class Engine:
+    """A simPLY_chess process using one backend."""
+
+    def __init__(self, backend: str) -> None:
+        self.process = subprocess.Popen(ENGINE_COMMAND, cwd=ENGINE_DIRECTORY, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.send(f"uci\nsetoption name Backend value {backend}\nisready")
+        self.read_until("readyok")
+
+    def send(self, commands: str) -> None:
+        assert self.process.stdin is not None
+        self.process.stdin.write(commands + "\n")
+        self.process.stdin.flush()
+
+    def read_until(self, prefix: str) -> list[str]:
+        """Returns every line the engine sends up to and including the first one starting with `prefix`."""
+        assert self.process.stdout is not None
+        lines: list[str] = []
+        for line in self.process.stdout:
+            lines.append(line.strip())
+            if line.startswith(prefix):
+                return lines
+        raise RuntimeError(f"simPLY_chess exited before sending {prefix}")
+
+    def perft(self, fen: str, depth: int) -> tuple[int, float]:
+        """Returns the leaf node count and the seconds taken."""
+        self.send(f"position fen {fen}\nperft {depth}")
+        start: float = perf_counter()
+        lines: list[str] = self.read_until("Nodes searched")
+        return int(lines[-1].split()[-1]), perf_counter() - start
+
+    def search(self, fen: str, depth: int) -> tuple[int, float, str]:
+        """Returns the nodes searched over every iteration, the seconds taken and the best move."""
+        self.send(f"position fen {fen}\ngo depth {depth} movetime 600000")
+        start: float = perf_counter()
+        lines: list[str] = self.read_until("bestmove")
+        elapsed: float = perf_counter() - start
+        nodes: int = sum(int(line.split()[line.split().index("nodes") + 1]) for line in lines if line.startswith("info depth"))
+        return nodes, elapsed, lines[-1].split()[1]
+
+    def quit(self) -> None:
+        self.send("quit")
+        self.process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares the speed of simPLY_chess's mailbox and bitboard backends.")
+    parser.add_argument("--perft-depth", type=int, default=3)
+    parser.add_argument("--search-depth", type=int, default=4)
+    parser.add_argument("--positions", nargs="+", choices=list(POSITIONS), default=list(POSITIONS))
+    arguments = parser.parse_args()
+
+    engines: dict[str, Engine] = {backend: Engine(backend) for backend in BACKENDS}
+    totals: dict[str, list[float]] = {backend: [0, 0, 0, 0] for backend in BACKENDS}  # perft nodes and time, search nodes and time
+    print(f"{'position':<11} {'backend':<9} {'perft nodes':>12} {'perft nps':>10} {'search nodes':>13} {'search nps':>11} {'bestmove':>9}")
+    for name in arguments.positions:
+        fen: str = POSITIONS[name]
+        perft_counts: set[int] = set()
+        search_counts: set[int] = set()
+        for backend, engine in engines.items():
+            perft_nodes, perft_time = engine.perft(fen, arguments.perft_depth)
+            search_nodes, search_time, best_move = engine.search(fen, arguments.search_depth)
+            perft_counts.add(perft_nodes)
+            search_counts.add(search_nodes)
+            for i, value in enumerate((perft_nodes, perft_time, search_nodes, search_time)):
+                totals[backend][i] += value
+            print(f"{name:<11} {backend:<9} {perft_nodes:>12} {perft_nodes / perft_time:>10.0f} {search_nodes:>13} {search_nodes / search_time:>11.0f} {best_move:>9}")
+        if len(perft_counts) > 1:
+            print(f"{name:<11} perft node counts differ between backends", file=sys.stderr)
+        if len(search_counts) > 1:
+            print(f"{name:<11} search node counts differ between backends", file=sys.stderr)
+    for engine in engines.values():
+        engine.quit()
+
+    perft_speeds: dict[str, float] = {backend: total[0] / total[1] for backend, total in totals.items()}
+    search_speeds: dict[str, float] = {backend: total[2] / total[3] for backend, total in totals.items()}
+    print(f"\nbitboard vs mailbox: {perft_speeds['bitboard'] / perft_speeds['mailbox']:.1f}x perft nps, {search_speeds['bitboard'] / search_speeds['mailbox']:.1f}x search nps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Times each step app.py takes per move outside of the engine search (parsing and checking the user's move, the game
+over check, the opening book probe, rendering the server's move and the FEN), and the whole of that path, over a corpus
+of game positions. Results can be saved as a baseline (`--save`) which later runs are compared against, failing if a
+step got slower than the threshold allows. Run from within the `src` directory, e.g. `python benchmarks/helpers.py`
+or `python benchmarks/helpers.py --pgn games.pgn --save`. Baselines are only comparable on the same machine."""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+from collections.abc import Callable
+from importlib.metadata import version
+from time import perf_counter_ns
+
+import chess
+import chess.pgn
+
+SOURCE_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import app  # opens the book index and precomputes the explorer, like the server does on startup
+
+BASELINE_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers-baseline.json")
+
+
+class Turn:
+    """A position from a game with the user's move from it and the server's reply, as app.py sees them."""
+
+    __slots__ = ("board", "user_move", "user_san", "reply")
+
+    def __init__(self, board: chess.Board, user_move: chess.Move, reply: chess.Move) -> None:
+        self.board: chess.Board = board
+        self.user_move: chess.Move = user_move
+        self.user_san: str = board.san(user_move)
+        self.reply: chess.Move = reply
+
+
+def book_games(count: int, plies: int, seed: int) -> list[list[chess.Move]]:
+    """Plays games that follow the opening books by weight for as long as they can and then go on with random moves."""
+    rng: random.Random = random.Random(seed)
+    games: list[list[chess.Move]] = []
+    for _ in range(count):
+        board: chess.Board = chess.Board()
+        while len(board.move_stack) < plies and not board.is_game_over():
+            entries = app.book_moves(board, app.zobrist_hash(board), "all")
+            if entries:
+                board.push(rng.choices([entry[0] for entry in entries], weights=[entry[1] for entry in entries])[0])
+            else:
+                board.push(rng.choice(list(board.legal_moves)))
+        games.append(board.move_stack)
+    return games
+
+
+def pgn_games(path: str) -> list[list[chess.Move]]:
+    """Reads the main line of every game in a PGN file."""
+    games: list[list[chess.Move]] = []
+    with open(path) as file:
+        while (game := chess.pgn.read_game(file)) is not None:
+            games.append(list(game.mainline_moves()))
+    return games
+
+
+def corpus(games: list[list[chess.Move]]) -> list[Turn]:
+    """Turns games into the positions before each move that has a reply, with the game's moves on the board's stack."""
+    turns: list[Turn] = []
+    for moves in games:
+        board: chess.Board = chess.Board()
+        for move, reply in zip(moves, moves[1:]):
+            turns.append(Turn(board.copy(), move, reply))
+            board.push(move)
+    return turns
+
+
+def non_engine_path(turn: Turn, mix: str) -> None:
+    """The work move() and server_turn() do for one user move when the engine's reply is already known."""
+    board: chess.Board = turn.board
+    client_move: chess.Move = board.parse_san(turn.user_san)
+    if client_move not in board.legal_moves:
+        raise ValueError(f"{turn.user_san} is illegal in {board.fen()}")
+    board.push(client_move)
+    if not board.is_game_over():
+        app.book_move(board, mix)
+        board.san(turn.reply)
+        board.push(turn.reply)
+        board.fen(en_passant="fen")
+        board.pop()
+    board.pop()
+
+
+def steps(mix: str) -> dict[str, Callable[[Turn], object]]:
+    """Every timed step, by name."""
+    return {
+        "parse_san": lambda turn: turn.board.parse_san(turn.user_san),
+        "legal_move_check": lambda turn: turn.user_move in turn.board.legal_moves,
+        "push_pop": lambda turn: (turn.board.push(turn.user_move), turn.board.pop()),
+        "is_game_over": lambda turn: turn.board.is_game_over(),
+        "zobrist_hash": lambda turn: app.zobrist_hash(turn.board),
+        "book_probe": lambda turn: app.book_move(turn.board, mix),
+        "san": lambda turn: turn.board.san(turn.user_move),
+        "fen": lambda turn: turn.board.fen(en_passant="fen"),
+        "non_engine_path": lambda turn: non_engine_path(turn, mix),
+    }
+
+
+def time_step(step: Callable[[Turn], object], turns: list[Turn], repeats: int) -> float:
+    """Returns the median over the repeats of the mean nanoseconds per call over the corpus."""
+    timings: list[float] = []
+    for _ in range(repeats):
+        start: int = perf_counter_ns()
+        for turn in turns:
+            step(turn)
+        timings.append((perf_counter_ns() - start) / len(turns))
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Times app.py's per-move work outside of the engine search.")
+    parser.add_argument("--pgn", help="games to take the positions from, instead of games played from the opening books")
+    parser.add_argument("--games", type=int, default=40, help="games to play from the opening books")
+    parser.add_argument("--plies", type=int, default=80, help="length of the games played from the opening books")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--book", default="all", help="book mix to probe")
+    parser.add_argument("--repeats", type=int, default=7, help="timed passes over the corpus per step")
+    parser.add_argument("--steps", nargs="+", help="only time these steps")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline to compare against and to save to")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown over the baseline counted as a regression")
+    arguments = parser.parse_args()
+
+    turns: list[Turn] = corpus(pgn_games(arguments.pgn) if arguments.pgn else book_games(arguments.games, arguments.plies, arguments.seed))
+    baseline: dict[str, float] = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)["results"]
+
+    timed_steps: dict[str, Callable[[Turn], object]] = steps(arguments.book)
+    for name in arguments.steps or []:
+        if name not in timed_steps:
+            parser.error(f"unknown step {name}, choose from {', '.join(timed_steps)}")
+    results: dict[str, float] = {}
+    print(f"{len(turns)} positions, python {platform.python_version()}, python-chess {version('chess')}")
+    print(f"{'step':<17} {'ns/call':>10} {'baseline':>10} {'change':>8}")
+    regressions: list[str] = []
+    for name, step in timed_steps.items():
+        if arguments.steps and name not in arguments.steps:
+            continue
+        step(turns[0])  # warm up caches and lazily built tables
+        results[name] = time_step(step, turns, arguments.repeats)
+        line: str = f"{name:<17} {results[name]:>10.0f}"
+        if name in baseline:
+            change: float = results[name] / baseline[name] - 1
+            line += f" {baseline[name]:>10.0f} {change:>+8.1%}"
+            if change > arguments.threshold:
+                line += "  regression"
+                regressions.append(name)
+        print(line)
+
+    if arguments.save:
+        with open(arguments.baseline, "w") as file:
+            json.dump({"python": platform.python_version(), "chess": version("chess"), "positions": len(turns), "results": results}, file, indent=2)
+        print(f"saved the baseline to {arguments.baseline}")
+    if regressions and not arguments.save:
+        print(f"slower than the baseline by more than {arguments.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
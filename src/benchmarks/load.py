@@ -0,0 +1,240 @@
+"""Load tests app.py by simulating browsers that each play games through the same requests as `static/script.js`: the
+game settings form posted to `/play`, then one `/move` per user move (`serverTurn()`), asking for the engine's thinking
+as server-sent events. Reports the latency percentiles, errors and throughput for every engine and opening book
+setting. Run from within the `src` directory, e.g. `python benchmarks/load.py --serve --browsers 8 --duration 30`, which
+starts app.py with the deterministic stub engine (engines/stub_engine.py) configured by the `--stub-*` arguments, or
+point `--url` at a running server."""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from time import perf_counter, sleep
+
+import chess
+
+SOURCE_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENT_ACCEPT: str = "text/event-stream, application/json;q=0.9"  # what serverTurn() asks for
+
+
+class Results:
+    """Latencies and errors collected by the browsers of one setting."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.move_latencies: list[float] = []
+        self.play_latencies: list[float] = []
+        self.errors: dict[str, int] = {}
+        self.games: int = 0
+
+    def error(self, kind: str) -> None:
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+class Browser:
+    """One simulated browser with its own cookies, so that servers keeping a game per session can tell them apart."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        self.url: str = url.rstrip("/")
+        self.timeout: float = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def play(self, settings: dict[str, str]) -> int:
+        """Posts the game settings form and returns the status code."""
+        request = urllib.request.Request(f"{self.url}/play", data=urllib.parse.urlencode(settings).encode(), method="POST")
+        with self.opener.open(request, timeout=self.timeout) as response:
+            response.read()
+            return response.status
+
+    def move(self, san: str | None) -> dict:
+        """Sends the user's move (None when the server moves first) and returns the server's move and position (or the
+        error it sent instead), reading the thinking streamed before it like readEvents() does."""
+        request = urllib.request.Request(
+            f"{self.url}/move", data=json.dumps({"move": san}).encode(), method="POST",
+            headers={"Accept": EVENT_ACCEPT, "Content-Type": "application/json"},
+        )
+        with self.opener.open(request, timeout=self.timeout) as response:
+            if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                return json.loads(response.read())
+            event: str = "message"
+            for raw_line in response:
+                line: str = raw_line.decode().rstrip("\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event in ("move", "error"):
+                    return json.loads(line[5:])
+        raise ValueError("the event stream ended without a move")
+
+
+def play_games(browser: Browser, settings: dict[str, str], moves: int, deadline: float, rng: random.Random, results: Results) -> None:
+    """Plays games with random user moves until the deadline, recording each request."""
+    for game in itertools.count():
+        if perf_counter() >= deadline:
+            return
+        color: str = ("white", "black")[game % 2]
+        start: float = perf_counter()
+        try:
+            status: int = browser.play(settings | {"color": color})
+        except (urllib.error.URLError, OSError) as error:
+            results.error(f"play {type(error).__name__}")
+            sleep(0.1)
+            continue
+        with results.lock:
+            results.play_latencies.append(perf_counter() - start)
+            results.games += 1
+        if status != 200:
+            results.error(f"play {status}")
+            continue
+
+        board: chess.Board = chess.Board()
+        user_moves: int = 0
+        user_turn: bool = color == "white"
+        while not board.is_game_over() and user_moves < moves and perf_counter() < deadline:
+            san: str | None = None
+            if user_turn:
+                user_move: chess.Move = rng.choice(list(board.legal_moves))
+                san = board.san(user_move)
+                board.push(user_move)
+                user_moves += 1
+            user_turn = True
+            start = perf_counter()
+            try:
+                reply: dict = browser.move(san)
+            except urllib.error.HTTPError as error:
+                results.error(f"move {error.code}")
+                break
+            except (urllib.error.URLError, OSError, ValueError) as error:
+                results.error(f"move {type(error).__name__}")
+                break
+            if "error_code" in reply:
+                results.error(f"move {reply['error_code']}")
+                break
+            with results.lock:
+                results.move_latencies.append(perf_counter() - start)
+            if reply.get("move") is not None:
+                try:
+                    board.push_san(reply["move"])
+                except ValueError:
+                    results.error("illegal server move")
+                    break
+            if reply.get("fen") != board.fen(en_passant="fen"):
+                results.error("out of sync")  # another browser changed the game, or the server lost it
+                break
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Returns the nearest-rank percentile of the given values (0 if there are none)."""
+    if len(values) == 0:
+        return 0
+    ordered: list[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def run_setting(url: str, settings: dict[str, str], browsers: int, duration: float, moves: int, timeout: float, seed: int) -> tuple[Results, float]:
+    """Runs the given number of browsers in parallel for `duration` seconds and returns their results and the time taken,
+    which can run over the duration while the last requests finish."""
+    results: Results = Results()
+    start: float = perf_counter()
+    threads: list[threading.Thread] = [
+        threading.Thread(target=play_games, args=(Browser(url, timeout), settings, moves, start + duration, random.Random(seed + i), results))
+        for i in range(browsers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, perf_counter() - start
+
+
+def free_port() -> int:
+    """Returns a port nothing is listening on."""
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+def serve(arguments: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """Starts app.py on a free port with the stub engine configured by the arguments, and returns it once it answers."""
+    port: int = free_port()
+    environment: dict[str, str] = os.environ | {
+        "WEBCHESS_STUB_THINK_TIME": str(arguments.stub_think_time),
+        "WEBCHESS_STUB_MOVE_CHOICE": arguments.stub_move_choice,
+        "WEBCHESS_STUB_FAILURE_RATE": str(arguments.stub_failure_rate),
+        "WEBCHESS_STUB_FAILURE": arguments.stub_failure,
+        "WEBCHESS_STUB_SEED": str(arguments.seed),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"],
+        cwd=SOURCE_DIRECTORY, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url: str = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            with urllib.request.urlopen(f"{url}/", timeout=1) as response:
+                response.read()
+            return server, url
+        except (urllib.error.URLError, OSError):
+            if server.poll() is not None:
+                break
+            sleep(0.1)
+    server.kill()
+    raise RuntimeError("app.py did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures the latency, errors and throughput of app.py under load.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to test, unless --serve is given")
+    parser.add_argument("--serve", action="store_true", help="start app.py on a free port for the test")
+    parser.add_argument("--browsers", type=int, default=4, help="concurrent simulated browsers")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run each setting for")
+    parser.add_argument("--moves", type=int, default=20, help="user moves per game before starting a new one")
+    parser.add_argument("--engines", nargs="+", default=["stub"], help="engines to test (the form's values, e.g. simPLY_chess)")
+    parser.add_argument("--books", nargs="+", default=["no-book", "main"], help="opening book settings to test")
+    parser.add_argument("--think-time", default="1", help="the form's think-time, in seconds")
+    parser.add_argument("--ponder", choices=("off", "on"), default="off")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a request counts as failed")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the user moves and the stub engine")
+    parser.add_argument("--stub-think-time", type=int, default=50, help="milliseconds the stub engine thinks per move")
+    parser.add_argument("--stub-move-choice", choices=("first", "last", "random"), default="random")
+    parser.add_argument("--stub-failure-rate", type=float, default=0, help="share of the stub engine's searches that fail")
+    parser.add_argument("--stub-failure", choices=("crash", "hang", "illegal"), default="crash")
+    arguments = parser.parse_args()
+
+    server: subprocess.Popen | None = None
+    url: str = arguments.url
+    if arguments.serve:
+        server, url = serve(arguments)
+    try:
+        print(f"{'engine':<13} {'book':<17} {'games':>6} {'moves':>6} {'moves/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'play p50':>9} {'errors':>7}")
+        failures: dict[str, dict[str, int]] = {}
+        for engine, book in itertools.product(arguments.engines, arguments.books):
+            settings: dict[str, str] = {"engine": engine, "opening-book": book, "think-time": arguments.think_time, "ponder": arguments.ponder, "piece-theme": "neo"}
+            results, elapsed = run_setting(url, settings, arguments.browsers, arguments.duration, arguments.moves, arguments.timeout, arguments.seed)
+            latencies: list[float] = results.move_latencies
+            print(
+                f"{engine:<13} {book:<17} {results.games:>6} {len(latencies):>6} {len(latencies) / elapsed:>8.1f} "
+                f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                f"{percentile(results.play_latencies, 0.50) * 1000:>9.1f} {sum(results.errors.values()):>7}"
+            )
+            if results.errors:
+                failures[f"{engine} {book}"] = results.errors
+        for setting, errors in failures.items():
+            print(f"\n{setting} errors: " + ", ".join(f"{kind} {count}" for kind, count in sorted(errors.items())))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measures how long simPLY_chess takes from being spawned until it answers `readyok`, for each way of launching it.
+Run from within the `src` directory, e.g. `python benchmarks/startup.py --runs 20`."""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+ENGINE_DIRECTORY: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "engines")
+
+# Launch mode -> (command, working directory)
+LAUNCH_MODES: dict[str, tuple[list[str], str]] = {
+    "uv": ([os.path.join(ENGINE_DIRECTORY, "simPLY_chess.py")], ENGINE_DIRECTORY),  # the script's uv shebang
+    "script": ([sys.executable, os.path.join(ENGINE_DIRECTORY, "simPLY_chess.py")], ENGINE_DIRECTORY),
+    "module": ([sys.executable, "-E", "-S", "-m", "simPLY_chess"], ENGINE_DIRECTORY),  # how app.py and tournament.py start it
+}
+
+
+def spawn_to_ready(command: list[str], directory: str) -> tuple[float, float]:
+    """Starts the engine and returns the seconds until `uciok` and until `readyok`."""
+    start: float = perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+    assert process.stdin is not None and process.stdout is not None
+    process.stdin.write("uci\nisready\n")
+    process.stdin.flush()
+    uciok: float = 0.0
+    for line in process.stdout:
+        if line.strip() == "uciok":
+            uciok = perf_counter() - start
+        elif line.strip() == "readyok":
+            break
+    else:
+        raise RuntimeError(f"{' '.join(command)} exited before readyok")
+    ready: float = perf_counter() - start
+    process.stdin.write("quit\n")
+    process.stdin.flush()
+    process.wait()
+    return uciok, ready
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures simPLY_chess startup time from spawn to readyok.")
+    parser.add_argument("--runs", type=int, default=10, help="timed starts per launch mode")
+    parser.add_argument("--modes", nargs="+", choices=list(LAUNCH_MODES), default=list(LAUNCH_MODES))
+    arguments = parser.parse_args()
+
+    print(f"{'mode':<8} {'uciok ms':>10} {'readyok ms':>11} {'min ms':>8} {'max ms':>8}")
+    for mode in arguments.modes:
+        command, directory = LAUNCH_MODES[mode]
+        if mode == "uv" and shutil.which("uv") is None:
+            print(f"{mode:<8} skipped, uv is not installed")
+            continue
+        spawn_to_ready(command, directory)  # warm up the OS file cache and write the bytecode cache
+        timings: list[tuple[float, float]] = [spawn_to_ready(command, directory) for _ in range(arguments.runs)]
+        uciok: list[float] = [timing[0] * 1000 for timing in timings]
+        ready: list[float] = [timing[1] * 1000 for timing in timings]
+        print(f"{mode:<8} {statistics.median(uciok):>10.1f} {statistics.median(ready):>11.1f} {min(ready):>8.1f} {max(ready):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
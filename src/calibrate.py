@@ -0,0 +1,127 @@
+# python-chess: https://python-chess.readthedocs.io/en/latest/
+# Elo: https://www.chessprogramming.org/Match_Statistics
+# Performance rating: https://en.wikipedia.org/wiki/Performance_rating_(chess)
+
+import argparse
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+
+from chess.engine import SimpleEngine
+
+from strength import LEVELS, level_limit, level_options, load_ratings, save_ratings
+from tournament import ENGINES, OPENING_BOOKS, Adjudication, GameJob, MatchScore, Player, TimeControl, book_openings, engine_command, expected_score, play_game, score_statistics
+
+
+def engine_options(engine: str) -> dict:
+    """Starts the engine just long enough to read the UCI options it supports."""
+    command, directory = engine_command(engine)
+    with SimpleEngine.popen_uci(command, cwd=directory) as process:
+        return dict(process.options)
+
+
+def level_player(engine: str, level: int, options: dict) -> Player:
+    """Returns the engine as app.py plays it on the given level."""
+    limit = level_limit(engine, level)
+    return Player(engine, TimeControl(nodes=limit.nodes, depth=limit.depth), tuple(level_options(options, level).items()))
+
+
+def performance_rating(score: float, opponents: list[float]) -> float:
+    """Returns the rating at which the expected score against the given opponents (one rating per game) is `score`, a
+    share of the games between 0 and 1."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    low, high = min(opponents) - 2000, max(opponents) + 2000
+    for _ in range(60):  # bisection, the expected score only grows with the rating
+        middle = (low + high) / 2
+        if sum(expected_score(middle - opponent) for opponent in opponents) / len(opponents) < score:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def level_rating(match: MatchScore, opponents: list[float]) -> tuple[float, float, float]:
+    """Returns the performance rating of a level with its 95% confidence interval as (elo, lower, upper)."""
+    score, variance = score_statistics(match)
+    margin = 1.959964 * math.sqrt(variance / match.games)
+    return performance_rating(score, opponents), performance_rating(score - margin, opponents), performance_rating(score + margin, opponents)
+
+
+########
+# MAIN #
+########
+
+def main() -> None:
+    """Plays each strength level of an engine against an anchor engine limited to known Elo ratings and saves the Elo
+    every level performed at in strength.json."""
+    parser = argparse.ArgumentParser(description="Measure the Elo of an engine's strength levels against an anchor of known strength.")
+    parser.add_argument("engine", choices=sorted(ENGINES), help="engine whose levels are calibrated")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(LEVELS), help="levels to calibrate (default: all)")
+    parser.add_argument("--anchor", default="stockfish", help="engine name or path of the anchor, which must support UCI_LimitStrength and UCI_Elo")
+    parser.add_argument("--anchor-elo", type=int, nargs="+", default=[1400, 1800, 2200, 2600], help="UCI_Elo ratings the anchor plays at, games are spread evenly across them")
+    parser.add_argument("--anchor-tc", default="movetime=0.1", help="time control of the anchor, UCI_Elo is only meaningful if the anchor gets enough time")
+    parser.add_argument("--games", type=int, default=40, help="games per level, rounded up to an even number per anchor rating")
+    parser.add_argument("--concurrency", type=int, default=2, help="number of games played in parallel")
+    parser.add_argument("--book", action="append", help="PolyGlot book for openings (default: all bundled books)")
+    parser.add_argument("--book-plies", type=int, default=8, help="maximum opening length in half moves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pgn", default="calibration.pgn", help="file the games are appended to")
+    parser.add_argument("--dry-run", action="store_true", help="report the ratings without saving them")
+    args = parser.parse_args()
+
+    anchor_options = engine_options(args.anchor)
+    if "UCI_LimitStrength" not in anchor_options or "UCI_Elo" not in anchor_options:
+        parser.error(f"{args.anchor} can't limit its strength to an Elo rating")
+    options = engine_options(args.engine)
+
+    pairs = max(1, math.ceil(args.games / (2 * len(args.anchor_elo))))  # games per level and anchor rating, with both colors
+    openings = book_openings(args.book or sorted(glob(OPENING_BOOKS)), pairs * len(args.anchor_elo), args.book_plies, args.seed) or [()]
+    adjudication = Adjudication()
+    anchor_tc = TimeControl.parse(args.anchor_tc)
+
+    levels: dict[str, int] = {f"{args.engine} level {level}": level for level in args.levels}  # players by name
+    anchors: dict[str, int] = {f"{args.anchor} {elo}": elo for elo in args.anchor_elo}
+    players: dict[str, Player] = {name: level_player(args.engine, level, options) for name, level in levels.items()}
+    players.update((name, Player(args.anchor, anchor_tc, (("UCI_LimitStrength", True), ("UCI_Elo", elo)))) for name, elo in anchors.items())
+
+    jobs: list[GameJob] = []
+    for name in levels:
+        for i, anchor in enumerate(anchors):
+            for pair in range(pairs):  # every opening is played twice with colors reversed
+                opening = openings[(i * pairs + pair) % len(openings)]
+                jobs.append(GameJob(len(jobs), name, anchor, opening, anchor_tc, adjudication, players))
+                jobs.append(GameJob(len(jobs), anchor, name, opening, anchor_tc, adjudication, players))
+
+    matches: dict[int, MatchScore] = {level: MatchScore() for level in args.levels}
+    opponents: dict[int, list[float]] = {level: [] for level in args.levels}
+    with ProcessPoolExecutor(max_workers=args.concurrency) as executor, Path(args.pgn).open("a") as pgn_file:
+        for future in as_completed([executor.submit(play_game, job) for job in jobs]):
+            result = future.result()
+            name, anchor = (result.white, result.black) if result.white in levels else (result.black, result.white)
+            matches[levels[name]].add(result, name)
+            opponents[levels[name]].append(anchors[anchor])
+            pgn_file.write(result.pgn + "\n\n")
+            pgn_file.flush()
+            print(f"{result.white} - {result.black}: {result.result} ({result.termination})", flush=True)
+
+    ratings = load_ratings()
+    measured = ratings.setdefault(args.engine, {})
+    print()
+    for level in args.levels:
+        match = matches[level]
+        elo, lower, upper = level_rating(match, opponents[level])
+        print(f"Level {level}: {match.wins} - {match.losses} - {match.draws}, Elo {elo:.0f} [{lower:.0f}, {upper:.0f}] (95%)")
+        if math.isfinite(elo):
+            measured[str(level)] = round(elo)
+        else:  # won or lost every game, the anchor ratings don't reach far enough
+            print(f"Level {level} isn't saved, calibrate it against anchor ratings closer to its strength")
+    if not args.dry_run:
+        save_ratings(ratings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# Retrograde analysis: https://www.chessprogramming.org/Retrograde_Analysis
+# Endgame bitbases: https://www.chessprogramming.org/Endgame_Bitbases
+
+"""Endgame tables of simPLY_chess for the three-piece endings where one side has a king and a pawn, rook or queen
+against a lone king, generated by retrograde analysis: starting from every checkmate, positions are resolved backwards
+one ply at a time, so each position gets the exact distance to mate with best play. Promotions look their result up in
+the king and queen or king and rook table, which are generated first. Each position takes one byte, 0 for a draw or
+one more than the number of plies until the side with the extra piece mates, and only one half (pawn endings) or one
+quarter (the others) of the board is stored for the stronger king or the pawn, the rest being mirror images. Endings
+with a knight or bishop, or two kings, are drawn and need no table.
+
+The tables are kept in `bitbases.bb`, which the engine memory-maps on "isready" and probes in its search, so that
+every engine process shares the same pages. Only uses the standard library and bitboards.py's attack tables. Run
+directly to generate the file, which takes about ten seconds."""
+
+import mmap
+import os
+import struct
+import time
+
+BITBASES_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitbases.bb")
+
+MAGIC: bytes = b"WCBB"
+VERSION: int = 1
+HEADER_STRUCT: struct.Struct = struct.Struct(">4sH")  # magic, version
+
+# The extra piece of each ending, in the order they are generated and stored (promotions need the rook and queen tables)
+ENDINGS: tuple[str, ...] = ("R", "Q", "P")
+PAWN_SQUARES: int = 24  # files a to d, ranks 2 to 7
+TABLE_SIZES: dict[str, int] = {"R": 2 * 16 * 64 * 64, "Q": 2 * 16 * 64 * 64, "P": 2 * 64 * 64 * PAWN_SQUARES}
+
+DRAW: int = 0
+MAX_PLIES: int = 254  # longest distance to mate a byte can hold
+
+
+def piece_attacks(piece: str, square: int, occupied: int) -> int:
+    """Returns the squares attacked by a white pawn, rook or queen on the given square."""
+    import bitboards
+    if piece == "P":
+        return bitboards.PAWN_ATTACKS[bitboards.WHITE][square]
+    if piece == "R":
+        return bitboards.rook_attacks(square, occupied)
+    return bitboards.rook_attacks(square, occupied) | bitboards.bishop_attacks(square, occupied)
+
+
+def squares(bitboard: int) -> list[int]:
+    found: list[int] = []
+    while bitboard:
+        bit: int = bitboard & -bitboard
+        bitboard ^= bit
+        found.append(bit.bit_length() - 1)
+    return found
+
+
+##############
+# GENERATION #
+##############
+
+# During generation positions are indexed by (side to move, stronger king, weaker king, extra piece), the stronger side
+# being white with 0 to move and the weaker side 1, on squares numbered from 0 (a1) to 63 (h8)
+
+def full_index(weak_to_move: int, strong_king: int, weak_king: int, square: int) -> int:
+    return ((weak_to_move * 64 + strong_king) * 64 + weak_king) * 64 + square
+
+
+def generate(piece: str, tables: dict[str, bytearray]) -> bytearray:
+    """Returns the distance to mate of every position of the ending with the given extra piece, indexed by
+    full_index(). `tables` holds the endings generated before, for promotions."""
+    import bitboards  # imported here since only generation needs it, not the engine probing the tables
+    king_attacks: list[int] = bitboards.KING_ATTACKS
+    values: bytearray = bytearray(2 * 64 ** 3)
+    # Legal moves of each position with the weaker side to move that aren't yet known to lose, 255 if it can draw
+    moves_left: bytearray = bytearray(2 * 64 ** 3)
+    buckets: list[list[int]] = [[] for _ in range(MAX_PLIES + 1)]  # positions to resolve by distance to mate
+    # Squares the weaker king can't move to, by stronger king and extra piece: those attacked by either
+    guarded: list[int] = [0] * 4096
+    for strong_king in range(64):
+        for square in range(64):
+            if square == strong_king or piece == "P" and not 8 <= square < 56:
+                continue
+            guarded[strong_king * 64 + square] = guard = piece_attacks(piece, square, 1 << strong_king) | king_attacks[strong_king]
+            for weak_king in range(64):
+                if weak_king == strong_king or weak_king == square or king_attacks[strong_king] >> weak_king & 1:
+                    continue
+                index: int = full_index(1, strong_king, weak_king, square)
+                escapes: int = king_attacks[weak_king] & ~guard
+                if escapes >> square & 1 or (escapes == 0 and not guard >> weak_king & 1):  # the piece can be taken, or stalemate
+                    moves_left[index] = 255
+                elif escapes:
+                    moves_left[index] = escapes.bit_count()
+                else:  # checkmate
+                    buckets[0].append(index)
+                if piece == "P" and square >= 48 and not guard >> weak_king & 1:  # promotions with the stronger side to move
+                    promotion: int = square + 8
+                    if promotion != strong_king and promotion != weak_king:
+                        for promoted in ("Q", "R"):
+                            value: int = tables[promoted][full_index(1, strong_king, weak_king, promotion)]
+                            if value != DRAW:
+                                buckets[value].append(full_index(0, strong_king, weak_king, square))
+
+    for distance in range(MAX_PLIES):
+        for index in buckets[distance]:
+            if values[index] != DRAW:  # already resolved closer to mate
+                continue
+            values[index] = distance + 1
+            square, weak_king, strong_king, weak_to_move = index & 63, index >> 6 & 63, index >> 12 & 63, index >> 18
+            occupied: int = 1 << strong_king | 1 << weak_king | 1 << square
+            if weak_to_move:  # lost, so every move of the stronger side to here wins
+                for origin in squares(king_attacks[strong_king] & ~occupied & ~king_attacks[weak_king]):
+                    if not guarded[origin * 64 + square] >> weak_king & 1:
+                        buckets[distance + 1].append(full_index(0, origin, weak_king, square))
+                if piece == "P":
+                    origins: int = 0
+                    if square >= 16 and not occupied >> (square - 8) & 1:
+                        origins = 1 << (square - 8)
+                        if 24 <= square < 32 and not occupied >> (square - 16) & 1:  # double push from the second rank
+                            origins |= 1 << (square - 16)
+                else:
+                    origins = piece_attacks(piece, square, occupied) & ~occupied
+                for origin in squares(origins):
+                    if not guarded[strong_king * 64 + origin] >> weak_king & 1:
+                        buckets[distance + 1].append(full_index(0, strong_king, weak_king, origin))
+            else:  # won, so the weaker side loses once every one of its moves leads to a win like this
+                for origin in squares(king_attacks[weak_king] & ~occupied & ~king_attacks[strong_king]):
+                    predecessor: int = full_index(1, strong_king, origin, square)
+                    if moves_left[predecessor] == 0 or moves_left[predecessor] == 255:
+                        continue
+                    moves_left[predecessor] -= 1
+                    if moves_left[predecessor] == 0:
+                        buckets[distance + 1].append(predecessor)
+    return values
+
+
+def compact(piece: str, values: bytearray) -> bytearray:
+    """Keeps the positions with the pawn on files a to d, or the stronger king on a1 to d4, in the order of
+    table_index()."""
+    table: bytearray = bytearray(TABLE_SIZES[piece])
+    for weak_to_move in range(2):
+        for strong_king in range(64):
+            for weak_king in range(64):
+                for square in range(64):
+                    index: int | None = table_index(piece, weak_to_move, strong_king, weak_king, square)
+                    if index is not None and ((square & 7) < 4 if piece == "P" else (strong_king & 7) < 4 and strong_king >> 3 < 4):
+                        table[index] = values[full_index(weak_to_move, strong_king, weak_king, square)]
+    return table
+
+
+def table_index(piece: str, weak_to_move: int, strong_king: int, weak_king: int, square: int) -> int | None:
+    """Returns the index of a position in its stored table, mirroring it onto the stored part of the board, or None if
+    the pawn is on the first or last rank."""
+    if piece == "P":
+        if not 8 <= square < 56:
+            return None
+        if square & 7 > 3:
+            strong_king, weak_king, square = strong_king ^ 7, weak_king ^ 7, square ^ 7
+        return ((weak_to_move * 64 + strong_king) * 64 + weak_king) * PAWN_SQUARES + (square >> 3) * 4 - 4 + (square & 7)
+    if strong_king & 7 > 3:
+        strong_king, weak_king, square = strong_king ^ 7, weak_king ^ 7, square ^ 7
+    if strong_king >> 3 > 3:
+        strong_king, weak_king, square = strong_king ^ 56, weak_king ^ 56, square ^ 56
+    return ((weak_to_move * 16 + (strong_king >> 3) * 4 + (strong_king & 7)) * 64 + weak_king) * 64 + square
+
+
+def write_bitbases(path: str, tables: dict[str, bytearray]) -> None:
+    data: bytearray = bytearray(HEADER_STRUCT.pack(MAGIC, VERSION))
+    for piece in ENDINGS:
+        data += tables[piece]
+    temporary: str = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)  # atomic, so processes that have mapped the old file keep reading it unharmed
+
+
+###########
+# PROBING #
+###########
+
+class Bitbases:
+    """The memory-mapped tables of every ending."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.mmap: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) != HEADER_STRUCT.size + sum(TABLE_SIZES.values()) or HEADER_STRUCT.unpack_from(self.mmap, 0) != (MAGIC, VERSION):
+            self.mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} bitbase file")
+        self.path: str = path
+        self.offsets: dict[str, int] = {}
+        offset: int = HEADER_STRUCT.size
+        for piece in ENDINGS:
+            self.offsets[piece] = offset
+            offset += TABLE_SIZES[piece]
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def probe(self, strong_to_move: bool, piece: str, strong_king: int, weak_king: int, square: int) -> tuple[int, int]:
+        """Returns the result of a position where the stronger side has its king and one pawn, knight, bishop, rook or
+        queen, on squares numbered from 0 (a1) to 63 (h8) with its pawn moving up the board, as (1 for a win, 0 for a
+        draw or -1 for a loss of the side to move, plies until checkmate)."""
+        if piece not in self.offsets:  # a knight or bishop can't mate
+            return 0, 0
+        index: int | None = table_index(piece, 0 if strong_to_move else 1, strong_king, weak_king, square)
+        value: int = self.mmap[self.offsets[piece] + index] if index is not None else DRAW
+        if value == DRAW:
+            return 0, 0
+        return (1 if strong_to_move else -1), value - 1
+
+
+def open_bitbases(path: str = BITBASES_PATH) -> Bitbases | None:
+    """Maps the bitbase file at `path`, returning None if there is none or it isn't one."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return Bitbases(path)
+    except (OSError, ValueError):
+        return None
+
+
+def main() -> None:
+    """Generates the tables of every ending and writes them to the bitbase file."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Generates simPLY_chess's three-piece endgame bitbases.")
+    parser.add_argument("--output", default=BITBASES_PATH, help="file the tables are written to")
+    arguments = parser.parse_args()
+
+    full_tables: dict[str, bytearray] = {}
+    tables: dict[str, bytearray] = {}
+    for piece in ENDINGS:
+        start: float = time.perf_counter()
+        full_tables[piece] = generate(piece, full_tables)
+        tables[piece] = compact(piece, full_tables[piece])
+        wins: int = sum(1 for value in full_tables[piece][:64 ** 3] if value != DRAW)
+        longest: int = max(full_tables[piece][:64 ** 3]) - 1
+        print(f"K{piece}K: {wins} positions won with the stronger side to move, mate in at most {longest} plies ({time.perf_counter() - start:.1f}s)")
+    write_bitbases(arguments.output, tables)
+    print(f"Written to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,976 @@
+# Bitboards: https://www.chessprogramming.org/Bitboards
+
+"""Bitboard backend for simPLY_chess, selected with the UCI option `Backend`. The board is held as twelve piece
+bitboards in Python ints (bit 0 is a1, bit 63 is h8), with knight, king and pawn attacks precomputed for every square
+and sliding attacks found along precomputed rays. It evaluates and searches like the mailbox backend in
+simPLY_chess.py, whose piece-square tables, hash keys and search constants it is configured with by `configure()`, but
+counts material and game phase with popcounts instead of scanning the board."""
+
+import sys
+import time
+from collections.abc import Callable
+from types import ModuleType
+
+##################################
+# CONSTANTS AND GLOBAL VARIABLES #
+##################################
+
+WHITE: int = 0
+BLACK: int = 1
+
+# Piece types, pieces are indexed by color * 6 + piece type
+PAWN: int = 0
+KNIGHT: int = 1
+BISHOP: int = 2
+ROOK: int = 3
+QUEEN: int = 4
+KING: int = 5
+PIECE_SYMBOLS: str = "PNBRQKpnbrqk"
+PIECE_NAMES: tuple[str, ...] = ("PAWN", "KNIGHT", "BISHOP", "ROOK", "QUEEN", "KING")  # as in the engine's table names
+
+FILE_A: int = 0x0101010101010101
+FILE_H: int = FILE_A << 7
+RANK_1: int = 0xFF
+RANK_3: int = RANK_1 << 16
+RANK_6: int = RANK_1 << 40
+RANK_8: int = RANK_1 << 56
+FULL_BOARD: int = (1 << 64) - 1
+
+SQUARE_NAMES: list[str] = [file + rank for rank in "12345678" for file in "abcdefgh"]
+
+# Castling rights, a move from or to a square keeps only the rights in CASTLING_RIGHTS_KEPT for that square
+WHITE_KINGSIDE: int = 1
+WHITE_QUEENSIDE: int = 2
+BLACK_KINGSIDE: int = 4
+BLACK_QUEENSIDE: int = 8
+CASTLING_RIGHTS_KEPT: list[int] = [15] * 64
+CASTLING_RIGHTS_KEPT[0] = 15 & ~WHITE_QUEENSIDE  # a1
+CASTLING_RIGHTS_KEPT[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # e1
+CASTLING_RIGHTS_KEPT[7] = 15 & ~WHITE_KINGSIDE  # h1
+CASTLING_RIGHTS_KEPT[56] = 15 & ~BLACK_QUEENSIDE  # a8
+CASTLING_RIGHTS_KEPT[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)  # e8
+CASTLING_RIGHTS_KEPT[63] = 15 & ~BLACK_KINGSIDE  # h8
+CASTLING_ROOK_MOVES: dict[int, tuple[int, int]] = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}  # king's end square -> rook's start and end squares
+
+# Moves are packed into integers: bits 0-5 hold the start square, bits 6-11 the end square, bits 12-15 the piece
+# moved, bits 16-19 the piece captured plus one (zero for quiet moves), bits 20-22 the promotion piece type (encoded
+# like PolyGlot) and bits 23-25 flag castling, en passant captures and double pawn pushes
+NULL_MOVE: int = 0
+SQUARE_MASK: int = 0x3F
+END_SHIFT: int = 6
+PIECE_SHIFT: int = 12
+CAPTURE_SHIFT: int = 16
+PROMOTION_SHIFT: int = 20
+CAPTURE_MASK: int = 0xF << CAPTURE_SHIFT
+CASTLING_FLAG: int = 1 << 23
+EN_PASSANT_FLAG: int = 1 << 24
+DOUBLE_PUSH_FLAG: int = 1 << 25
+PROMOTION_TYPES: tuple[int, ...] = (QUEEN, ROOK, BISHOP, KNIGHT)  # in the order moves are generated
+
+
+def step_attacks(square: int, steps: list[tuple[int, int]]) -> int:
+    """Returns the squares reached from the given square by each (file, rank) step that stays on the board."""
+    attacks: int = 0
+    for file_step, rank_step in steps:
+        file: int = square % 8 + file_step
+        rank: int = square // 8 + rank_step
+        if 0 <= file < 8 and 0 <= rank < 8:
+            attacks |= 1 << (rank * 8 + file)
+    return attacks
+
+
+def ray(square: int, file_step: int, rank_step: int) -> int:
+    """Returns the squares from the given square (exclusive) to the edge of the board in one direction."""
+    squares: int = 0
+    file: int = square % 8 + file_step
+    rank: int = square // 8 + rank_step
+    while 0 <= file < 8 and 0 <= rank < 8:
+        squares |= 1 << (rank * 8 + file)
+        file += file_step
+        rank += rank_step
+    return squares
+
+
+KNIGHT_ATTACKS: list[int] = [step_attacks(square, [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]) for square in range(64)]
+KING_ATTACKS: list[int] = [step_attacks(square, [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]) for square in range(64)]
+PAWN_ATTACKS: list[list[int]] = [
+    [step_attacks(square, [(-1, 1), (1, 1)]) for square in range(64)],  # squares attacked by a white pawn
+    [step_attacks(square, [(-1, -1), (1, -1)]) for square in range(64)],  # squares attacked by a black pawn
+]
+
+# Rays in each direction, those towards higher squares are blocked by their least significant blocker and those
+# towards lower squares by their most significant one
+NORTH_RAYS: list[int] = [ray(square, 0, 1) for square in range(64)]
+EAST_RAYS: list[int] = [ray(square, 1, 0) for square in range(64)]
+NORTH_EAST_RAYS: list[int] = [ray(square, 1, 1) for square in range(64)]
+NORTH_WEST_RAYS: list[int] = [ray(square, -1, 1) for square in range(64)]
+SOUTH_RAYS: list[int] = [ray(square, 0, -1) for square in range(64)]
+WEST_RAYS: list[int] = [ray(square, -1, 0) for square in range(64)]
+SOUTH_WEST_RAYS: list[int] = [ray(square, -1, -1) for square in range(64)]
+SOUTH_EAST_RAYS: list[int] = [ray(square, 1, -1) for square in range(64)]
+
+# Manhattan distance between two squares, used for king tropism and the mop-up bonus
+DISTANCES: list[list[int]] = [[abs(a % 8 - b % 8) + abs(a // 8 - b // 8) for b in range(64)] for a in range(64)]
+
+# Masks for the pawn structure: each file, the files next to each, and the squares in front of a pawn of either color
+# on its own and the neighbouring files, where no opponent pawn may stand for it to be passed
+FILE_MASKS: list[int] = [FILE_A << file for file in range(8)]
+ADJACENT_FILE_MASKS: list[int] = [(FILE_MASKS[file - 1] if file > 0 else 0) | (FILE_MASKS[file + 1] if file < 7 else 0) for file in range(8)]
+PASSED_PAWN_MASKS: list[list[int]] = [
+    [(FILE_MASKS[square % 8] | ADJACENT_FILE_MASKS[square % 8]) & (FULL_BOARD << (8 * (square // 8 + 1)) & FULL_BOARD) for square in range(64)],
+    [(FILE_MASKS[square % 8] | ADJACENT_FILE_MASKS[square % 8]) & ((1 << (8 * (square // 8))) - 1) for square in range(64)],
+]
+
+# Filled in by configure() from the engine module
+configured: bool = False
+MIDGAME_VALUES: list[int] = []  # by piece type
+ENDGAME_VALUES: list[int] = []
+PHASE_VALUES: list[int] = []
+TOTAL_PHASE: int = 0
+MIDGAME_TROPISM: list[list[int]] = []  # by piece type and distance
+ENDGAME_TROPISM: list[list[int]] = []
+MOP_UP_SCORE: int = 0
+MIDGAME_PAWN_STRUCTURE: tuple[int, int, list[int]] = (0, 0, [])  # doubled, isolated and passed pawns by rank
+ENDGAME_PAWN_STRUCTURE: tuple[int, int, list[int]] = (0, 0, [])
+CHECKMATE_UPPER: int = 0
+CHECKMATE_LOWER: int = 0
+# Piece-square tables by side-to-move, piece type and square, for the side-to-move's pieces and the opponent's.
+# Like the mailbox, which always looks from the side-to-move's point of view, black's tables are mirrored by file too.
+OWN_MIDGAME_TABLES: list[list[list[int]]] = []
+OWN_ENDGAME_TABLES: list[list[list[int]]] = []
+OPPONENT_MIDGAME_TABLES: list[list[list[int]]] = []
+OPPONENT_ENDGAME_TABLES: list[list[list[int]]] = []
+# PolyGlot hash keys
+PIECE_KEYS: list[list[int]] = []  # by piece and square
+CASTLING_KEYS: list[int] = []  # by castling rights
+EN_PASSANT_KEYS: list[int] = []  # by file
+TURN_KEY: int = 0
+
+# Transposition table, format is {zobrist_key: (best_move, depth, score)}
+TRANSPOSITION_TABLE: dict[int, tuple[int, int, int]] = {}
+# Set by the engine while hash snapshots are in use to a function returning the (snapshot_move, depth, score) of a key
+snapshot_probe: Callable[[int], tuple[int, int, int] | None] | None = None
+# Probe of the engine's endgame bitbases, if they are used: (stronger side to move, extra piece, stronger king, weaker
+# king, extra piece's square) -> (result, plies until checkmate), see bitbases.py
+bitbase_probe: Callable[[bool, str, int, int, int], tuple[int, int]] | None = None
+
+# Evaluation cache and pawn hash table, fixed-size tables whose slots hold the last position (or pawn layout) hashed to
+# them with its evaluation (or pawn structure scores from white's point of view), keyed by the Zobrist key and a
+# Zobrist key of the pawns alone
+EVAL_CACHE_SIZE: int = 1 << 16  # entries, a power of two
+PAWN_HASH_SIZE: int = 1 << 14
+EVAL_CACHE: list[tuple[int, int] | None] = [None] * EVAL_CACHE_SIZE  # format is [(zobrist_key, score)]
+PAWN_HASH: list[tuple[int, int, int] | None] = [None] * PAWN_HASH_SIZE  # format is [(pawn_key, midgame_score, endgame_score)]
+
+# Hash keys of the positions before the current one, in the game and then on the path of the search
+KEY_HISTORY: list[int] = []
+FIFTY_MOVE_PLIES: int = 100
+
+# Search state and counters, reset by iteratively_deepen()
+max_depth: int = 0
+nodes: int = 0
+qnodes: int = 0
+tt_hits: int = 0
+tt_misses: int = 0
+tt_cutoffs: int = 0
+eval_probes: int = 0
+eval_hits: int = 0
+pawn_probes: int = 0
+pawn_hits: int = 0
+start_time: float = 0
+time_limit: float = 0
+node_limit: int = sys.maxsize  # nodes left for the depth being searched
+timeout: bool = False
+
+
+class Board:
+    """A position: the bitboard of each piece, the occupancy of each color, the side to move, the castling rights, the
+    en passant square (-1 if there is none), the PolyGlot hash key and the hash key of its pawns alone."""
+
+    __slots__ = ("pieces", "occupancy", "color", "castling", "en_passant", "key", "pawn_key")
+
+    def __init__(self, pieces: list[int], color: int, castling: int, en_passant: int) -> None:
+        self.pieces: list[int] = pieces
+        self.occupancy: list[int] = [pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5],
+                                     pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]]
+        self.color: int = color
+        self.castling: int = castling
+        self.en_passant: int = en_passant
+        self.key: int = zobrist_hash(self) if configured else 0
+        self.pawn_key: int = pawn_hash(self) if configured else 0
+
+
+def configure(engine: ModuleType) -> None:
+    """Builds the evaluation tables and hash keys from the constants of the simPLY_chess module, so that both backends
+    evaluate and hash positions alike."""
+    global configured, MIDGAME_VALUES, ENDGAME_VALUES, PHASE_VALUES, TOTAL_PHASE, MIDGAME_TROPISM, ENDGAME_TROPISM, MOP_UP_SCORE, CHECKMATE_UPPER, CHECKMATE_LOWER
+    global MIDGAME_PAWN_STRUCTURE, ENDGAME_PAWN_STRUCTURE
+    global OWN_MIDGAME_TABLES, OWN_ENDGAME_TABLES, OPPONENT_MIDGAME_TABLES, OPPONENT_ENDGAME_TABLES, PIECE_KEYS, CASTLING_KEYS, EN_PASSANT_KEYS, TURN_KEY
+    symbols: str = PIECE_SYMBOLS[:6]
+    MIDGAME_VALUES = [engine.MIDGAME_PIECE_VALUES[symbol] for symbol in symbols]
+    ENDGAME_VALUES = [engine.ENDGAME_PIECE_VALUES[symbol] for symbol in symbols]
+    PHASE_VALUES = [0, engine.KNIGHT_PHASE, engine.BISHOP_PHASE, engine.ROOK_PHASE, engine.QUEEN_PHASE, 0]
+    TOTAL_PHASE = engine.TOTAL_PHASE
+    MIDGAME_TROPISM = [[engine.MIDGAME_TROPISM_VALUES[symbol] // distance if distance else 0 for distance in range(15)] for symbol in symbols]
+    ENDGAME_TROPISM = [[engine.ENDGAME_TROPISM_VALUES[symbol] // distance if distance else 0 for distance in range(15)] for symbol in symbols]
+    MOP_UP_SCORE = engine.MOP_UP_SCORE
+    MIDGAME_PAWN_STRUCTURE = (engine.MIDGAME_DOUBLED_PAWN_VALUE, engine.MIDGAME_ISOLATED_PAWN_VALUE, engine.MIDGAME_PASSED_PAWN_VALUES[:])
+    ENDGAME_PAWN_STRUCTURE = (engine.ENDGAME_DOUBLED_PAWN_VALUE, engine.ENDGAME_ISOLATED_PAWN_VALUE, engine.ENDGAME_PASSED_PAWN_VALUES[:])
+    CHECKMATE_UPPER = engine.CHECKMATE_UPPER
+    CHECKMATE_LOWER = engine.CHECKMATE_LOWER
+
+    # The engine's tables list a8 first, so a white piece on a square reads the table at square ^ 56
+    midgame_tables: list[list[int]] = [getattr(engine, f"MIDGAME_{name}_TABLE") for name in PIECE_NAMES]
+    endgame_tables: list[list[int]] = [getattr(engine, f"ENDGAME_{name}_TABLE") for name in PIECE_NAMES]
+    OWN_MIDGAME_TABLES = [[[table[square ^ flip] for square in range(64)] for table in midgame_tables] for flip in (56, 7)]
+    OWN_ENDGAME_TABLES = [[[table[square ^ flip] for square in range(64)] for table in endgame_tables] for flip in (56, 7)]
+    OPPONENT_MIDGAME_TABLES = [[[table[square ^ flip] for square in range(64)] for table in midgame_tables] for flip in (0, 63)]
+    OPPONENT_ENDGAME_TABLES = [[[table[square ^ flip] for square in range(64)] for table in endgame_tables] for flip in (0, 63)]
+
+    hash_values: list[int] = engine.HASH_VALUES
+    PIECE_KEYS = [[hash_values[64 * engine.PIECE_ENCODINGS[symbol] + square] for square in range(64)] for symbol in PIECE_SYMBOLS]
+    CASTLING_KEYS = [0] * 16
+    for rights in range(16):
+        for i in range(4):  # white kingside, white queenside, black kingside, black queenside, as in PolyGlot
+            if rights & (1 << i):
+                CASTLING_KEYS[rights] ^= hash_values[768 + i]
+    EN_PASSANT_KEYS = hash_values[772:780]
+    TURN_KEY = hash_values[780]
+    EVAL_CACHE[:] = [None] * EVAL_CACHE_SIZE  # evaluated with the previous configuration
+    PAWN_HASH[:] = [None] * PAWN_HASH_SIZE
+    configured = True
+
+
+###############
+# BOARD LOGIC #
+###############
+
+def rook_attacks(square: int, occupied: int) -> int:
+    """Returns the squares attacked by a rook on the given square, up to and including the first blocker each way."""
+    attacks: int = NORTH_RAYS[square]
+    blockers: int = attacks & occupied
+    if blockers:
+        attacks ^= NORTH_RAYS[(blockers & -blockers).bit_length() - 1]
+    squares: int = EAST_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= EAST_RAYS[(blockers & -blockers).bit_length() - 1]
+    attacks |= squares
+    squares = SOUTH_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= SOUTH_RAYS[blockers.bit_length() - 1]
+    attacks |= squares
+    squares = WEST_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= WEST_RAYS[blockers.bit_length() - 1]
+    return attacks | squares
+
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    """Returns the squares attacked by a bishop on the given square, up to and including the first blocker each way."""
+    attacks: int = NORTH_EAST_RAYS[square]
+    blockers: int = attacks & occupied
+    if blockers:
+        attacks ^= NORTH_EAST_RAYS[(blockers & -blockers).bit_length() - 1]
+    squares: int = NORTH_WEST_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= NORTH_WEST_RAYS[(blockers & -blockers).bit_length() - 1]
+    attacks |= squares
+    squares = SOUTH_WEST_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= SOUTH_WEST_RAYS[blockers.bit_length() - 1]
+    attacks |= squares
+    squares = SOUTH_EAST_RAYS[square]
+    blockers = squares & occupied
+    if blockers:
+        squares ^= SOUTH_EAST_RAYS[blockers.bit_length() - 1]
+    return attacks | squares
+
+
+def square_attacked(board: Board, square: int, color: int) -> bool:
+    """Finds if the given square is attacked by any piece of the given color."""
+    pieces: list[int] = board.pieces
+    base: int = color * 6
+    if KNIGHT_ATTACKS[square] & pieces[base + KNIGHT] or PAWN_ATTACKS[color ^ 1][square] & pieces[base + PAWN] or KING_ATTACKS[square] & pieces[base + KING]:
+        return True
+    occupied: int = board.occupancy[0] | board.occupancy[1]
+    queens: int = pieces[base + QUEEN]
+    return bool(bishop_attacks(square, occupied) & (pieces[base + BISHOP] | queens) or rook_attacks(square, occupied) & (pieces[base + ROOK] | queens))
+
+
+def attackers(board: Board, square: int, occupied: int) -> int:
+    """Returns the pieces of both colors attacking the given square when only the squares in `occupied` are
+    occupied, so that sliding pieces behind pieces that have left the board are found."""
+    pieces: list[int] = board.pieces
+    return ((PAWN_ATTACKS[BLACK][square] & pieces[PAWN]) | (PAWN_ATTACKS[WHITE][square] & pieces[6 + PAWN])
+            | (KNIGHT_ATTACKS[square] & (pieces[KNIGHT] | pieces[6 + KNIGHT]))
+            | (KING_ATTACKS[square] & (pieces[KING] | pieces[6 + KING]))
+            | (bishop_attacks(square, occupied) & (pieces[BISHOP] | pieces[6 + BISHOP] | pieces[QUEEN] | pieces[6 + QUEEN]))
+            | (rook_attacks(square, occupied) & (pieces[ROOK] | pieces[6 + ROOK] | pieces[QUEEN] | pieces[6 + QUEEN]))) & occupied
+
+
+def in_check(board: Board, color: int) -> bool:
+    """Finds if the king of the given color is in check."""
+    return square_attacked(board, board.pieces[color * 6 + KING].bit_length() - 1, color ^ 1)
+
+
+def piece_on(board: Board, square: int, color: int) -> int:
+    """Returns the piece of the given color on the given square, which must be occupied by one."""
+    pieces: list[int] = board.pieces
+    for piece in range(color * 6, color * 6 + 6):
+        if pieces[piece] >> square & 1:
+            return piece
+    raise ValueError(f"no piece on {SQUARE_NAMES[square]}")
+
+
+def generate_moves(board: Board) -> list[int]:
+    """Generates all pseudo-legal moves for the side to move, except that castling through or out of check is left out.
+    Moves are packed into integers (see NULL_MOVE)."""
+    move_list: list[int] = []
+    us: int = board.color
+    them: int = us ^ 1
+    pieces: list[int] = board.pieces
+    own: int = board.occupancy[us]
+    enemy: int = board.occupancy[them]
+    empty: int = ~(own | enemy) & FULL_BOARD
+    base: int = us * 6
+    pawn: int = base + PAWN
+
+    # Pawn pushes, all at once for every pawn
+    pawns: int = pieces[pawn]
+    if us == WHITE:
+        single_pushes: int = (pawns << 8) & empty
+        double_pushes: int = ((single_pushes & RANK_3) << 8) & empty
+        forward: int = 8
+        last_rank: int = RANK_8
+    else:
+        single_pushes = (pawns >> 8) & empty
+        double_pushes = ((single_pushes & RANK_6) >> 8) & empty
+        forward = -8
+        last_rank = RANK_1
+    while single_pushes:
+        bit: int = single_pushes & -single_pushes
+        single_pushes ^= bit
+        end_square: int = bit.bit_length() - 1
+        move: int = (end_square - forward) | end_square << END_SHIFT | pawn << PIECE_SHIFT
+        if bit & last_rank:
+            for promotion_type in PROMOTION_TYPES:
+                move_list.append(move | promotion_type << PROMOTION_SHIFT)
+        else:
+            move_list.append(move)
+    while double_pushes:
+        bit = double_pushes & -double_pushes
+        double_pushes ^= bit
+        end_square = bit.bit_length() - 1
+        move_list.append((end_square - 2 * forward) | end_square << END_SHIFT | pawn << PIECE_SHIFT | DOUBLE_PUSH_FLAG)
+
+    # Pawn captures
+    while pawns:
+        bit = pawns & -pawns
+        pawns ^= bit
+        start_square: int = bit.bit_length() - 1
+        attacks: int = PAWN_ATTACKS[us][start_square]
+        targets: int = attacks & enemy
+        while targets:
+            target: int = targets & -targets
+            targets ^= target
+            end_square = target.bit_length() - 1
+            move = start_square | end_square << END_SHIFT | pawn << PIECE_SHIFT | (piece_on(board, end_square, them) + 1) << CAPTURE_SHIFT
+            if target & last_rank:
+                for promotion_type in PROMOTION_TYPES:
+                    move_list.append(move | promotion_type << PROMOTION_SHIFT)
+            else:
+                move_list.append(move)
+        if board.en_passant >= 0 and attacks >> board.en_passant & 1:
+            move_list.append(start_square | board.en_passant << END_SHIFT | pawn << PIECE_SHIFT | (them * 6 + PAWN + 1) << CAPTURE_SHIFT | EN_PASSANT_FLAG)
+
+    # Pieces
+    occupied: int = own | enemy
+    not_own: int = ~own & FULL_BOARD
+    for piece in range(base + KNIGHT, base + KING + 1):
+        piece_type: int = piece - base
+        remaining: int = pieces[piece]
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            start_square = bit.bit_length() - 1
+            if piece_type == KNIGHT:
+                attacks = KNIGHT_ATTACKS[start_square]
+            elif piece_type == BISHOP:
+                attacks = bishop_attacks(start_square, occupied)
+            elif piece_type == ROOK:
+                attacks = rook_attacks(start_square, occupied)
+            elif piece_type == QUEEN:
+                attacks = bishop_attacks(start_square, occupied) | rook_attacks(start_square, occupied)
+            else:
+                attacks = KING_ATTACKS[start_square]
+            attacks &= not_own
+            while attacks:
+                target = attacks & -attacks
+                attacks ^= target
+                end_square = target.bit_length() - 1
+                move = start_square | end_square << END_SHIFT | piece << PIECE_SHIFT
+                if target & enemy:
+                    move |= (piece_on(board, end_square, them) + 1) << CAPTURE_SHIFT
+                move_list.append(move)
+
+    # Castling, the king may not start in or pass through check (landing in check is caught like any other move)
+    castling: int = board.castling
+    king: int = base + KING
+    if us == WHITE:
+        if castling & WHITE_KINGSIDE and not occupied & 0x60 and not square_attacked(board, 4, them) and not square_attacked(board, 5, them):
+            move_list.append(4 | 6 << END_SHIFT | king << PIECE_SHIFT | CASTLING_FLAG)
+        if castling & WHITE_QUEENSIDE and not occupied & 0x0E and not square_attacked(board, 4, them) and not square_attacked(board, 3, them):
+            move_list.append(4 | 2 << END_SHIFT | king << PIECE_SHIFT | CASTLING_FLAG)
+    else:
+        if castling & BLACK_KINGSIDE and not occupied & (0x60 << 56) and not square_attacked(board, 60, them) and not square_attacked(board, 61, them):
+            move_list.append(60 | 62 << END_SHIFT | king << PIECE_SHIFT | CASTLING_FLAG)
+        if castling & BLACK_QUEENSIDE and not occupied & (0x0E << 56) and not square_attacked(board, 60, them) and not square_attacked(board, 59, them):
+            move_list.append(60 | 58 << END_SHIFT | king << PIECE_SHIFT | CASTLING_FLAG)
+    return move_list
+
+
+def en_passant_key(board: Board) -> int:
+    """Returns the en passant part of the hash key, which PolyGlot only includes if a pawn can capture en passant."""
+    if board.en_passant >= 0 and PAWN_ATTACKS[board.color ^ 1][board.en_passant] & board.pieces[board.color * 6 + PAWN]:
+        return EN_PASSANT_KEYS[board.en_passant & 7]
+    return 0
+
+
+def make_move(board: Board, move: int) -> Board:
+    """Returns the position after making the given move, updating the hash key incrementally. The move is not checked
+    for legality."""
+    us: int = board.color
+    them: int = us ^ 1
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    piece: int = move >> PIECE_SHIFT & 0xF
+    start_bit: int = 1 << start_square
+    end_bit: int = 1 << end_square
+    pieces: list[int] = board.pieces[:]
+    occupancy: list[int] = board.occupancy[:]
+    key: int = board.key ^ en_passant_key(board)
+    pawn_key: int = board.pawn_key
+
+    pieces[piece] ^= start_bit | end_bit
+    occupancy[us] ^= start_bit | end_bit
+    piece_keys: list[int] = PIECE_KEYS[piece]
+    key ^= piece_keys[start_square] ^ piece_keys[end_square]
+    if piece % 6 == PAWN:
+        pawn_key ^= piece_keys[start_square] ^ piece_keys[end_square]
+    if move & CAPTURE_MASK:
+        captured: int = (move >> CAPTURE_SHIFT & 0xF) - 1
+        captured_square: int = end_square
+        if move & EN_PASSANT_FLAG:
+            captured_square = end_square - 8 if us == WHITE else end_square + 8
+        pieces[captured] ^= 1 << captured_square
+        occupancy[them] ^= 1 << captured_square
+        key ^= PIECE_KEYS[captured][captured_square]
+        if captured % 6 == PAWN:
+            pawn_key ^= PIECE_KEYS[captured][captured_square]
+    promotion_type: int = move >> PROMOTION_SHIFT & 0x7
+    if promotion_type:
+        promoted: int = us * 6 + promotion_type
+        pieces[piece] ^= end_bit
+        pieces[promoted] ^= end_bit
+        key ^= piece_keys[end_square] ^ PIECE_KEYS[promoted][end_square]
+        pawn_key ^= piece_keys[end_square]
+    elif move & CASTLING_FLAG:
+        rook_start, rook_end = CASTLING_ROOK_MOVES[end_square]
+        rook: int = us * 6 + ROOK
+        pieces[rook] ^= (1 << rook_start) | (1 << rook_end)
+        occupancy[us] ^= (1 << rook_start) | (1 << rook_end)
+        key ^= PIECE_KEYS[rook][rook_start] ^ PIECE_KEYS[rook][rook_end]
+
+    new_board: Board = Board.__new__(Board)  # skips __init__(), which would recompute the occupancy and hash key
+    new_board.pieces = pieces
+    new_board.occupancy = occupancy
+    new_board.color = them
+    new_board.castling = board.castling & CASTLING_RIGHTS_KEPT[start_square] & CASTLING_RIGHTS_KEPT[end_square]
+    new_board.en_passant = (start_square + end_square) // 2 if move & DOUBLE_PUSH_FLAG else -1
+    new_board.key = key ^ CASTLING_KEYS[board.castling] ^ CASTLING_KEYS[new_board.castling] ^ TURN_KEY ^ en_passant_key(new_board)
+    new_board.pawn_key = pawn_key
+    return new_board
+
+
+def legal_moves(board: Board) -> list[tuple[int, Board]]:
+    """Returns every legal move for the side to move together with the position it leads to."""
+    moves: list[tuple[int, Board]] = []
+    for move in generate_moves(board):
+        new_board: Board = make_move(board, move)
+        if not in_check(new_board, board.color):
+            moves.append((move, new_board))
+    return moves
+
+
+def perft(depth: int, board: Board) -> int:
+    """Counts the leaf nodes of the tree of legal moves to the given depth, used to verify move generation."""
+    if depth == 0:
+        return 1
+    count: int = 0
+    color: int = board.color
+    for move in generate_moves(board):
+        new_board: Board = make_move(board, move)
+        if not in_check(new_board, color):
+            count += perft(depth - 1, new_board)
+    return count
+
+
+########################
+# EVALUATION FUNCTIONS #
+########################
+
+def game_phase(board: Board) -> int:
+    """Evaluates the current game phase through piece counts."""
+    pieces: list[int] = board.pieces
+    phase: int = TOTAL_PHASE
+    for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN):
+        phase -= (pieces[piece_type] | pieces[piece_type + 6]).bit_count() * PHASE_VALUES[piece_type]
+    return (phase * 256 + (TOTAL_PHASE // 2)) // TOTAL_PHASE
+
+
+def pawn_structure(board: Board) -> tuple[int, int]:
+    """Returns the midgame and endgame scores of the doubled, isolated and passed pawns of the given position from
+    white's point of view, from the pawn hash table if the same pawns were evaluated before."""
+    global pawn_probes, pawn_hits
+    slot: int = board.pawn_key & (PAWN_HASH_SIZE - 1)
+    entry: tuple[int, int, int] | None = PAWN_HASH[slot]
+    pawn_probes += 1
+    if entry is not None and entry[0] == board.pawn_key:
+        pawn_hits += 1
+        return entry[1], entry[2]
+
+    midgame_doubled, midgame_isolated, midgame_passed = MIDGAME_PAWN_STRUCTURE
+    endgame_doubled, endgame_isolated, endgame_passed = ENDGAME_PAWN_STRUCTURE
+    midgame_score: int = 0
+    endgame_score: int = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        pawns: int = board.pieces[color * 6 + PAWN]
+        opponent_pawns: int = board.pieces[(color ^ 1) * 6 + PAWN]
+        for file in range(8):
+            count: int = (pawns & FILE_MASKS[file]).bit_count()
+            if count > 1:
+                midgame_score += sign * (count - 1) * midgame_doubled
+                endgame_score += sign * (count - 1) * endgame_doubled
+            if count and not pawns & ADJACENT_FILE_MASKS[file]:
+                midgame_score += sign * count * midgame_isolated
+                endgame_score += sign * count * endgame_isolated
+        passed_masks: list[int] = PASSED_PAWN_MASKS[color]
+        remaining: int = pawns
+        while remaining:
+            bit: int = remaining & -remaining
+            remaining ^= bit
+            square: int = bit.bit_length() - 1
+            if not passed_masks[square] & opponent_pawns:
+                rank: int = square // 8 if color == WHITE else 7 - square // 8
+                midgame_score += sign * midgame_passed[rank]
+                endgame_score += sign * endgame_passed[rank]
+    PAWN_HASH[slot] = (board.pawn_key, midgame_score, endgame_score)
+    return midgame_score, endgame_score
+
+
+def evaluate_position(board: Board) -> int:
+    """Evaluates the given position for the side-to-move using material values, piece square tables, king tropism,
+    pawn structure and mop-up bonus and interpolating between midgame and endgame scores. Evaluations are kept in the
+    evaluation cache."""
+    global eval_probes, eval_hits
+    slot: int = board.key & (EVAL_CACHE_SIZE - 1)
+    entry: tuple[int, int] | None = EVAL_CACHE[slot]
+    eval_probes += 1
+    if entry is not None and entry[0] == board.key:
+        eval_hits += 1
+        return entry[1]
+
+    us: int = board.color
+    them: int = us ^ 1
+    pieces: list[int] = board.pieces
+    king_square: int = pieces[us * 6 + KING].bit_length() - 1
+    opponent_king_square: int = pieces[them * 6 + KING].bit_length() - 1
+    midgame_score, endgame_score = pawn_structure(board)
+    if us == BLACK:
+        midgame_score, endgame_score = -midgame_score, -endgame_score
+    phase: int = TOTAL_PHASE
+    for color, sign, midgame_tables, endgame_tables, king_distances in (
+        (us, 1, OWN_MIDGAME_TABLES[us], OWN_ENDGAME_TABLES[us], DISTANCES[opponent_king_square]),
+        (them, -1, OPPONENT_MIDGAME_TABLES[us], OPPONENT_ENDGAME_TABLES[us], DISTANCES[king_square]),
+    ):
+        for piece_type in range(6):
+            remaining: int = pieces[color * 6 + piece_type]
+            if not remaining:
+                continue
+            count: int = remaining.bit_count()
+            phase -= count * PHASE_VALUES[piece_type]
+            midgame_table: list[int] = midgame_tables[piece_type]
+            endgame_table: list[int] = endgame_tables[piece_type]
+            midgame_tropism: list[int] = MIDGAME_TROPISM[piece_type]
+            endgame_tropism: list[int] = ENDGAME_TROPISM[piece_type]
+            midgame: int = count * MIDGAME_VALUES[piece_type]
+            endgame: int = count * ENDGAME_VALUES[piece_type]
+            while remaining:
+                bit: int = remaining & -remaining
+                remaining ^= bit
+                square: int = bit.bit_length() - 1
+                distance: int = king_distances[square]
+                midgame += midgame_table[square] + midgame_tropism[distance]
+                endgame += endgame_table[square] + endgame_tropism[distance]
+            midgame_score += sign * midgame
+            endgame_score += sign * endgame
+    mop_up_bonus: int = MOP_UP_SCORE * (14 - DISTANCES[king_square][opponent_king_square]) // 14
+    if endgame_score > 0:
+        endgame_score += mop_up_bonus
+    elif endgame_score < 0:
+        endgame_score -= mop_up_bonus
+    phase = (phase * 256 + (TOTAL_PHASE // 2)) // TOTAL_PHASE
+    score: int = ((midgame_score * (256 - phase)) + (endgame_score * phase)) // 256
+    EVAL_CACHE[slot] = (board.key, score)
+    return score
+
+
+def evaluate_move(move: int, board: Board, phase: int) -> int:
+    """Evaluates the given move for the side-to-move by interpolating between midgame and endgame scores."""
+    us: int = board.color
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    piece_type: int = (move >> PIECE_SHIFT & 0xF) - us * 6
+    own_midgame: list[list[int]] = OWN_MIDGAME_TABLES[us]
+    own_endgame: list[list[int]] = OWN_ENDGAME_TABLES[us]
+    midgame_score: int = own_midgame[piece_type][end_square] - own_midgame[piece_type][start_square]
+    endgame_score: int = own_endgame[piece_type][end_square] - own_endgame[piece_type][start_square]
+    if move & CAPTURE_MASK:
+        captured_type: int = (move >> CAPTURE_SHIFT & 0xF) - 1 - (us ^ 1) * 6
+        captured_square: int = end_square
+        if move & EN_PASSANT_FLAG:
+            captured_square = end_square - 8 if us == WHITE else end_square + 8
+        midgame_score += MIDGAME_VALUES[captured_type] + OPPONENT_MIDGAME_TABLES[us][captured_type][captured_square]
+        endgame_score += ENDGAME_VALUES[captured_type] + OPPONENT_ENDGAME_TABLES[us][captured_type][captured_square]
+    promotion_type: int = move >> PROMOTION_SHIFT & 0x7
+    if promotion_type:
+        midgame_score += own_midgame[promotion_type][end_square] - own_midgame[PAWN][end_square] + MIDGAME_VALUES[promotion_type] - MIDGAME_VALUES[PAWN]
+        endgame_score += own_endgame[promotion_type][end_square] - own_endgame[PAWN][end_square] + ENDGAME_VALUES[promotion_type] - ENDGAME_VALUES[PAWN]
+    elif move & CASTLING_FLAG:
+        rook_start, rook_end = CASTLING_ROOK_MOVES[end_square]
+        midgame_score += own_midgame[ROOK][rook_end] - own_midgame[ROOK][rook_start]
+        endgame_score += own_endgame[ROOK][rook_end] - own_endgame[ROOK][rook_start]
+    return ((midgame_score * (256 - phase)) + (endgame_score * phase)) // 256
+
+
+def static_exchange(move: int, board: Board) -> int:
+    """Static exchange evaluation: the material the side-to-move wins (or loses, if negative) with the given capture
+    once both sides have recaptured on its end square with their least valuable attackers for as long as it pays off.
+    Pieces that are moved off the board reveal the sliding pieces behind them."""
+    pieces: list[int] = board.pieces
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    color: int = board.color ^ 1
+    occupied: int = (board.occupancy[0] | board.occupancy[1]) ^ (1 << start_square)
+    if move & EN_PASSANT_FLAG:
+        occupied ^= 1 << (end_square - 8 if color == BLACK else end_square + 8)
+    gains: list[int] = [MIDGAME_VALUES[(move >> CAPTURE_SHIFT & 0xF) - 1 - color * 6]]
+    attacker_type: int = (move >> PIECE_SHIFT & 0xF) - board.color * 6
+    while True:
+        side_attackers: int = attackers(board, end_square, occupied) & board.occupancy[color]
+        if not side_attackers:
+            break
+        for piece_type in range(6):
+            candidates: int = side_attackers & pieces[color * 6 + piece_type]
+            if candidates:
+                break
+        gains.append(MIDGAME_VALUES[attacker_type] - gains[-1])  # speculative gain if this side recaptures
+        attacker_type = piece_type
+        occupied ^= candidates & -candidates
+        color ^= 1
+    for i in range(len(gains) - 1, 0, -1):  # either side may stop recapturing when it would lose material
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def order_moves(move_list: list[int], board: Board) -> list[int]:
+    """Sorts moves by their basic evaluation, best first. Ties go to the move whose end (then start) square comes first
+    on the mailbox board, which runs from rank 8 to rank 1 as seen by the side to move, so that both backends search
+    the same tree."""
+    phase: int = game_phase(board)
+    flip: int = 0xE38 if board.color == WHITE else 0x1C7  # mirrors the ranks (or the files) of both squares
+    move_list.sort(key=lambda move: evaluate_move(move, board, phase) * 0x1000 - ((move ^ flip) & 0xFFF), reverse=True)
+    return move_list
+
+
+def losing_capture(move: int, board: Board) -> bool:
+    """Finds if the given capture loses material by static exchange evaluation, which is only possible if the
+    capturing piece is worth more than the piece it captures."""
+    if MIDGAME_VALUES[(move >> PIECE_SHIFT & 0xF) % 6] <= MIDGAME_VALUES[((move >> CAPTURE_SHIFT & 0xF) - 1) % 6]:
+        return False
+    return static_exchange(move, board) < 0
+
+
+def order_captures(move_list: list[int], board: Board) -> list[int]:
+    """Moves captures that lose material by static exchange evaluation behind every other move, keeping the order of
+    the moves otherwise."""
+    losing_captures: set[int] = {move for move in move_list if move & CAPTURE_MASK and losing_capture(move, board)}
+    move_list.sort(key=lambda move: move in losing_captures)
+    return move_list
+
+
+################
+# SEARCH LOGIC #
+################
+
+def quiesce(alpha: int, beta: int, board: Board) -> int:
+    """Performs a fail-hard quiescent search (searches captures only until a quiet position is reached) with delta
+    pruning."""
+    global nodes, qnodes, timeout
+    if nodes >= node_limit or time.time() - start_time > time_limit:
+        timeout = True
+        return 0
+
+    nodes += 1
+    qnodes += 1
+    stand_pat: int = evaluate_position(board)
+    if stand_pat >= beta:
+        return stand_pat
+
+    if alpha < stand_pat:
+        alpha = stand_pat
+    us: int = board.color
+    them_base: int = (us ^ 1) * 6
+    for move in order_moves([move for move in generate_moves(board) if move & CAPTURE_MASK], board):
+        delta: int = 200  # delta safety margin to account for potential positional compensation
+        promotion_type: int = move >> PROMOTION_SHIFT & 0x7
+        if stand_pat + ENDGAME_VALUES[(move >> CAPTURE_SHIFT & 0xF) - 1 - them_base] + (ENDGAME_VALUES[promotion_type] if promotion_type else 0) + delta < alpha:  # delta pruning
+            continue
+        if losing_capture(move, board):
+            continue
+        new_board: Board = make_move(board, move)
+        if in_check(new_board, us):  # illegal move
+            continue
+        score: int = -quiesce(-beta, -alpha, new_board)
+        if timeout:
+            return 0
+
+        if score >= beta:
+            return beta  # fail-hard beta cutoff
+
+        if score > alpha:
+            alpha = score
+    return alpha
+
+
+def nega_max(depth: int, alpha: int, beta: int, board: Board, halfmove_clock: int) -> tuple[int, int]:
+    """Performs a fail-hard negamax search with alpha-beta pruning on the given position, returning the best score and
+    move found after the search. Positions below the root that repeat an earlier one or fall under the fifty-move rule
+    are scored as draws."""
+    global nodes, timeout, tt_hits, tt_misses, tt_cutoffs
+    if nodes >= node_limit or time.time() - start_time > time_limit:
+        timeout = True
+        return 0, NULL_MOVE
+
+    if bitbase_probe is not None and depth < max_depth and (board.occupancy[0] | board.occupancy[1]).bit_count() == 3:
+        nodes += 1
+        result, plies = bitbase_result(board)
+        return result * (CHECKMATE_LOWER - (max_depth - depth) - plies), NULL_MOVE
+
+    if depth == 0:
+        return quiesce(alpha, beta, board), NULL_MOVE
+
+    if depth < max_depth and board.key in KEY_HISTORY[max(0, len(KEY_HISTORY) - halfmove_clock):]:  # only positions since the last capture or pawn move can repeat
+        return 0, NULL_MOVE
+    if depth < max_depth and halfmove_clock >= FIFTY_MOVE_PLIES:  # unless the move that reached it gave checkmate
+        if in_check(board, board.color) and len(legal_moves(board)) == 0:
+            return -CHECKMATE_LOWER + max_depth - depth, NULL_MOVE
+        return 0, NULL_MOVE
+
+    # Scores that may depend on the fifty-move rule are kept out of the transposition table since it can't tell them apart
+    near_fifty_moves: bool = halfmove_clock + depth >= FIFTY_MOVE_PLIES
+    table_info: tuple[int, int, int] | None = TRANSPOSITION_TABLE.get(board.key) if not near_fifty_moves else None
+    if table_info is None and not near_fifty_moves and snapshot_probe is not None:
+        table_info = snapshot_entry(board)
+        if table_info is not None:
+            TRANSPOSITION_TABLE[board.key] = table_info
+    if table_info is None:
+        tt_misses += 1
+        table_info = (NULL_MOVE, -1, 0)
+    else:
+        tt_hits += 1
+    if table_info[1] >= depth or table_info[2] >= CHECKMATE_LOWER:  # move is from higher depth or position is checkmate
+        tt_cutoffs += 1
+        return table_info[2], table_info[0]
+
+    nodes += 1
+    move_list: list[int] = order_captures(order_moves(generate_moves(board), board), board)
+    if table_info[0] in move_list:  # basic PV move ordering: transposition table move from lower depth goes first
+        move_list.remove(table_info[0])
+        move_list.insert(0, table_info[0])
+    us: int = board.color
+    any_legal_move: bool = False  # for checkmate and stalemate detection
+    best_move: int = NULL_MOVE
+    for move in move_list:
+        new_board: Board = make_move(board, move)
+        if in_check(new_board, us):  # illegal move
+            continue
+        any_legal_move = True
+        KEY_HISTORY.append(board.key)
+        score: int = -nega_max(depth - 1, -beta, -alpha, new_board, 0 if move & CAPTURE_MASK or (move >> PIECE_SHIFT & 0xF) % 6 == PAWN else halfmove_clock + 1)[0]
+        KEY_HISTORY.pop()
+        if timeout:
+            return 0, NULL_MOVE
+
+        if score >= beta:
+            return beta, best_move  # fail-hard beta cutoff
+
+        if score > alpha:
+            alpha = score
+            best_move = move
+    if not any_legal_move:  # if there are no legal moves, it's either checkmate or stalemate
+        if in_check(board, us):
+            return -CHECKMATE_LOWER + max_depth - depth, NULL_MOVE
+        return 0, NULL_MOVE
+
+    if best_move != NULL_MOVE and not near_fifty_moves:
+        TRANSPOSITION_TABLE[board.key] = (best_move, depth, alpha)
+    return alpha, best_move
+
+
+def bitbase_result(board: Board) -> tuple[int, int]:
+    """Returns the result of a position with three pieces from the engine's bitbases as (1 for a win, 0 for a draw or
+    -1 for a loss of the side to move, plies until checkmate)."""
+    assert bitbase_probe is not None
+    pieces: list[int] = board.pieces
+    extra: int = next(piece for piece in range(12) if piece % 6 != KING and pieces[piece])
+    strong: int = extra // 6
+    flip: int = 0 if strong == WHITE else 56  # the stronger side's pawn moves up the board
+    return bitbase_probe(board.color == strong, PIECE_SYMBOLS[extra % 6], (pieces[strong * 6 + KING].bit_length() - 1) ^ flip,
+                         (pieces[(strong ^ 1) * 6 + KING].bit_length() - 1) ^ flip, (pieces[extra].bit_length() - 1) ^ flip)
+
+
+def principal_variation(length: int, board: Board) -> list[int]:
+    """Uses the transposition table to find the principal variation for the given position as a list of moves."""
+    moves: list[int] = []
+    while len(moves) < length:
+        result: tuple[int, int, int] | None = TRANSPOSITION_TABLE.get(board.key)
+        if result is None:
+            break
+        moves.append(result[0])
+        board = make_move(board, result[0])
+    return moves
+
+
+def iteratively_deepen(depth: int, board: Board, seconds: float, send_response: Callable[[str], None], history: list[int] | None = None, halfmove_clock: int = 0, node_budget: int = 0) -> int:
+    """Wraps the negamax search function in an iterative deepening loop, sending an info line for each completed
+    depth and returning the best move found within the time limit and `node_budget` nodes over all depths (0 for no
+    limit, the first depth is always finished). `history` holds the hash keys of the positions played before this
+    one, for repetition detection."""
+    global max_depth, nodes, qnodes, tt_hits, tt_misses, tt_cutoffs, eval_probes, eval_hits, pawn_probes, pawn_hits, start_time, time_limit, node_limit, timeout
+    qnodes = 0
+    tt_hits = 0
+    tt_misses = 0
+    tt_cutoffs = 0
+    eval_probes = 0
+    eval_hits = 0
+    pawn_probes = 0
+    pawn_hits = 0
+    best_move: int = NULL_MOVE
+    previous_best_move: int = NULL_MOVE
+    start_time = time.time()
+    time_limit = seconds
+    timeout = False
+    KEY_HISTORY[:] = history or []
+    searched: int = 0  # nodes of the finished depths
+    for max_depth in range(1, depth + 1):
+        nodes = 0
+        node_limit = sys.maxsize if max_depth == 1 or node_budget == 0 else node_budget - searched
+        score, best_move = nega_max(max_depth, -CHECKMATE_UPPER, CHECKMATE_UPPER, board, halfmove_clock)
+        if timeout:
+            timeout = False
+            best_move = previous_best_move
+            break
+        pv_string: str = " ".join(move_name(move) for move in principal_variation(max_depth, board))
+        send_response(f"info depth {max_depth} score cp {score} nodes {nodes} time {int(round(time.time() - start_time, 3) * 1000)} pv {pv_string}")
+        if best_move == NULL_MOVE:
+            break
+        previous_best_move = best_move
+        searched += nodes
+    node_limit = sys.maxsize
+    send_response(f"info string eval cache hits {eval_hits}/{eval_probes} ({eval_hits / max(eval_probes, 1):.1%}) pawn hash hits {pawn_hits}/{pawn_probes} ({pawn_hits / max(pawn_probes, 1):.1%})")
+    return best_move
+
+
+#####################
+# UTILITY FUNCTIONS #
+#####################
+
+def move_name(move: int) -> str:
+    """Converts a move to long algebraic notation."""
+    if move == NULL_MOVE:
+        return "(none)"
+    promotion_type: int = move >> PROMOTION_SHIFT & 0x7
+    return SQUARE_NAMES[move & SQUARE_MASK] + SQUARE_NAMES[move >> END_SHIFT & SQUARE_MASK] + (PIECE_SYMBOLS[6 + promotion_type] if promotion_type else "")
+
+
+def snapshot_move(move: int) -> int:
+    """Converts a move to the representation of hash snapshots, which see the board from the side to move's point of
+    view, so black's moves are rotated by 180 degrees."""
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    if (move >> PIECE_SHIFT & 0xF) >= 6:
+        start_square = 63 - start_square
+        end_square = 63 - end_square
+    return start_square | end_square << 6 | (move >> PROMOTION_SHIFT & 0x7) << 12
+
+
+def snapshot_entry(board: Board) -> tuple[int, int, int] | None:
+    """Returns the hash snapshot entry of the given position with its move in our representation, or None if there is
+    none or its move can't be played here (the key collided with another position's)."""
+    assert snapshot_probe is not None
+    entry: tuple[int, int, int] | None = snapshot_probe(board.key)
+    if entry is None:
+        return None
+    for move in generate_moves(board):
+        if snapshot_move(move) == entry[0]:
+            return move, entry[1], entry[2]
+    return None
+
+
+def zobrist_hash(board: Board) -> int:
+    """Calculates the PolyGlot hash key of the given position from scratch."""
+    key: int = CASTLING_KEYS[board.castling] ^ en_passant_key(board) ^ (TURN_KEY if board.color == WHITE else 0)
+    for piece, remaining in enumerate(board.pieces):
+        while remaining:
+            bit: int = remaining & -remaining
+            remaining ^= bit
+            key ^= PIECE_KEYS[piece][bit.bit_length() - 1]
+    return key
+
+
+def pawn_hash(board: Board) -> int:
+    """Calculates the hash key of the pawns of the given position from scratch, from the PolyGlot keys of its pawns."""
+    key: int = 0
+    for piece in (PAWN, 6 + PAWN):
+        remaining: int = board.pieces[piece]
+        while remaining:
+            bit: int = remaining & -remaining
+            remaining ^= bit
+            key ^= PIECE_KEYS[piece][bit.bit_length() - 1]
+    return key
+
+
+def load_fen(fen: str) -> Board:
+    """Creates the position described by the given FEN string."""
+    fields: list[str] = fen.split()
+    pieces: list[int] = [0] * 12
+    for row, rank_pieces in enumerate(fields[0].split("/")):
+        square: int = (7 - row) * 8
+        for symbol in rank_pieces:
+            if symbol.isdigit():
+                square += int(symbol)
+            else:
+                pieces[PIECE_SYMBOLS.index(symbol)] |= 1 << square
+                square += 1
+    castling: int = 0
+    for symbol, rights in (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE)):
+        if symbol in fields[2]:
+            castling |= rights
+    en_passant: int = SQUARE_NAMES.index(fields[3]) if fields[3] != "-" else -1
+    return Board(pieces, WHITE if fields[1] == "w" else BLACK, castling, en_passant)
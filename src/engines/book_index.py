@@ -0,0 +1,212 @@
+# PolyGlot book format: http://hgm.nubati.net/book_format.html
+
+"""Merges every PolyGlot book in `opening-books` into a single key-sorted index so that any mix of books can be probed
+through one memory-mapped file. Shared by app.py and simPLY_chess.py; only uses the standard library so the engine
+stays dependency free (and quick to import, since the engine imports it on every start). Run directly to (re)build the
+index."""
+
+import mmap
+import os
+import random
+import struct
+import sys
+
+BOOKS_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening-books")
+INDEX_PATH: str = os.path.join(BOOKS_DIRECTORY, "books.idx")
+
+MAGIC: bytes = b"WCBI"
+VERSION: int = 1
+HEADER_STRUCT: struct.Struct = struct.Struct(">4sHH")  # magic, version, number of source books
+SOURCE_STRUCT: struct.Struct = struct.Struct(">16sH")  # book name, source weight
+BOOK_ENTRY_STRUCT: struct.Struct = struct.Struct(">QHHI")  # PolyGlot entry: key, raw move, weight, learn
+
+NORMALIZED_WEIGHT: int = 0xFFFF  # the weights of each book's moves in a position are scaled to sum to this value
+
+# Default source weights by book family (the book name without its trailing number), used when merging books
+SOURCE_WEIGHTS: dict[str, int] = {
+    "main": 4,
+    "database": 2,
+    "alternative": 1,
+}
+
+
+def book_family(name: str) -> str:
+    """Returns the family of a book, i.e. its name without the trailing number (e.g. "main5" -> "main")."""
+    return name.rstrip("0123456789")
+
+
+def raw_move_uci(raw_move: int) -> str:
+    """Converts a raw PolyGlot move to UCI notation. Castling stays encoded as the king capturing its own rook
+    (e.g. "e1h1")."""
+    to_square: int = raw_move & 0x3f
+    from_square: int = (raw_move >> 6) & 0x3f
+    promotion: int = (raw_move >> 12) & 0x7
+    uci: str = ""
+    for square in (from_square, to_square):
+        uci += "abcdefgh"[square & 7] + str((square >> 3) + 1)
+    return uci + ("nbrq"[promotion - 1] if promotion else "")
+
+
+def book_name(path: str) -> str:
+    """Returns the name of a book, i.e. its file name without the extension (e.g. "main5")."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def build_index(book_paths: list[str], output: str = INDEX_PATH, weights: dict[str, int] | None = None) -> int:
+    """Merges the given PolyGlot books into a single index written to `output` and returns the number of entries.
+    Duplicate moves are combined, each book's weights are normalized per position, and the result is sorted by key and
+    move. Every entry keeps one weight per source book so that mixes can be chosen when probing."""
+    weights = weights or {}
+    names: list[str] = [book_name(path) for path in book_paths]
+    merged: dict[tuple[int, int], list[int]] = {}  # (key, raw move) -> [learn, weight of each source]
+    for source, path in enumerate(book_paths):
+        positions: dict[int, dict[int, tuple[int, int]]] = {}  # key -> {raw move: (weight, learn)}
+        with open(path, "rb") as file:
+            book: bytes = file.read()
+        for key, raw_move, weight, learn in BOOK_ENTRY_STRUCT.iter_unpack(book):
+            previous_weight, previous_learn = positions.setdefault(key, {}).get(raw_move, (0, 0))
+            positions[key][raw_move] = (previous_weight + weight, previous_learn or learn)
+        for key, moves in positions.items():
+            total: int = sum(weight for weight, _ in moves.values())
+            for raw_move, (weight, learn) in moves.items():
+                normalized: int = weight * NORMALIZED_WEIGHT // total if total > 0 else 0
+                entry: list[int] = merged.setdefault((key, raw_move), [0] + [0] * len(book_paths))
+                entry[0] = entry[0] or learn
+                entry[1 + source] = max(normalized, 1 if weight > 0 else 0)
+
+    record: struct.Struct = struct.Struct(">QHI" + "H" * len(book_paths))
+    data: bytearray = bytearray(HEADER_STRUCT.pack(MAGIC, VERSION, len(book_paths)))
+    for name in names:
+        data += SOURCE_STRUCT.pack(name.encode(), weights.get(name, SOURCE_WEIGHTS.get(book_family(name), 1)))
+    for (key, raw_move), entry in sorted(merged.items()):
+        data += record.pack(key, raw_move, *entry)
+
+    temporary: str = f"{output}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, output)  # atomic, so concurrent readers never see a partial index
+    return len(merged)
+
+
+class BookIndex:
+    """A memory-mapped, merged opening book index."""
+
+    def __init__(self, path: str = INDEX_PATH) -> None:
+        with open(path, "rb") as file:
+            self.mmap: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat: os.stat_result = os.fstat(file.fileno())
+        self.version: str = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"  # changes whenever the index is rebuilt
+        magic, version, source_count = HEADER_STRUCT.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} book index")
+        self.sources: list[str] = []
+        self.source_weights: list[int] = []
+        offset: int = HEADER_STRUCT.size
+        for _ in range(source_count):
+            name, weight = SOURCE_STRUCT.unpack_from(self.mmap, offset)
+            self.sources.append(name.rstrip(b"\0").decode())
+            self.source_weights.append(weight)
+            offset += SOURCE_STRUCT.size
+        self.offset: int = offset
+        self.record: struct.Struct = struct.Struct(">QHI" + "H" * source_count)
+        self.size: int = (len(self.mmap) - offset) // self.record.size
+
+    def __enter__(self) -> "BookIndex":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def mix(self, spec: str) -> list[int]:
+        """Converts a mix such as "main+database" or "all" into a multiplier per source book. Each part of the mix is
+        either a book name (e.g. "main5") or a family of books (e.g. "main"); unselected books get a multiplier of 0."""
+        parts: list[str] = spec.split("+")
+        return [
+            weight if "all" in parts or name in parts or book_family(name) in parts else 0
+            for name, weight in zip(self.sources, self.source_weights)
+        ]
+
+    def mix_name(self, spec: str) -> str | None:
+        """Returns the canonical name of a mix, its parts deduplicated and sorted (or just "all" if it is one of them),
+        or None if a part is neither "all" nor the name or family of a book in the index."""
+        parts: set[str] = set(spec.split("+"))
+        known: set[str] = {"all"} | set(self.sources) | {book_family(name) for name in self.sources}
+        if not parts <= known:
+            return None
+        return "all" if "all" in parts else "+".join(sorted(parts))
+
+    def bisect_key_left(self, key: int) -> int:
+        """Returns the index of the first record with the given key (or where it would be inserted)."""
+        low: int = 0
+        high: int = self.size
+        while low < high:
+            middle: int = (low + high) // 2
+            if struct.unpack_from(">Q", self.mmap, self.offset + middle * self.record.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key: int, mix: list[int]) -> list[tuple[int, int, int]]:
+        """Returns every (raw_move, weight, learn) for the given PolyGlot key with the weights combined according to the
+        mix. Moves that none of the mixed books play are left out."""
+        entries: list[tuple[int, int, int]] = []
+        for i in range(self.bisect_key_left(key), self.size):
+            entry_key, raw_move, learn, *weights = self.record.unpack_from(self.mmap, self.offset + i * self.record.size)
+            if entry_key != key:
+                break
+            weight: int = sum(multiplier * weight for multiplier, weight in zip(mix, weights))
+            if weight > 0:
+                entries.append((raw_move, weight, learn))
+        return entries
+
+    def weighted_choice(self, key: int, mix: list[int], rng: random.Random | None = None) -> int | None:
+        """Selects a random raw move for the given key distributed by its mixed weight, or None if there is none."""
+        entries: list[tuple[int, int, int]] = self.entries(key, mix)
+        if len(entries) == 0:
+            return None
+        return (rng or random).choices([entry[0] for entry in entries], weights=[entry[1] for entry in entries])[0]
+
+
+def book_paths(directory: str = BOOKS_DIRECTORY) -> list[str]:
+    """Returns every PolyGlot book in the given directory."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".bin"))
+
+
+def open_index(path: str = INDEX_PATH, directory: str = BOOKS_DIRECTORY) -> BookIndex:
+    """Opens the book index, (re)building it first if it is missing, outdated, or older than one of the books."""
+    books: list[str] = book_paths(directory)
+    if os.path.exists(path) and all(os.path.getmtime(book) <= os.path.getmtime(path) for book in books):
+        try:
+            index: BookIndex = BookIndex(path)
+        except ValueError:
+            pass
+        else:
+            if index.sources == [book_name(book) for book in books]:
+                return index
+            index.close()
+    build_index(books, path)
+    return BookIndex(path)
+
+
+def main() -> None:
+    """Builds the index from the command line. Source weights can be overridden with arguments like "main5=3"."""
+    weights: dict[str, int] = {}
+    for argument in sys.argv[1:]:
+        name, _, weight = argument.partition("=")
+        weights[name] = int(weight)
+    count: int = build_index(book_paths(), INDEX_PATH, weights)
+    with BookIndex(INDEX_PATH) as index:
+        for name, weight in zip(index.sources, index.source_weights):
+            print(f"{name}: weight {weight}")
+    print(f"{count} entries written to {INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
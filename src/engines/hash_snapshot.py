@@ -0,0 +1,194 @@
+"""Saves simPLY_chess's transposition table to compact, key-sorted snapshots that can be loaded again or probed through
+a memory map, and merges the snapshots of many engine processes into one shared snapshot of their deepest entries.
+Only uses the standard library, like book_index.py. Run directly to merge the snapshots in `hash-snapshots`, either
+once or every so often with `--every`."""
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+SNAPSHOT_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hash-snapshots")
+SHARED_NAME: str = "shared.tt"
+
+MAGIC: bytes = b"WCTT"
+VERSION: int = 1
+HEADER_STRUCT: struct.Struct = struct.Struct(">4sH32s")  # magic, version, name and version of the engine that searched it
+# Moves are stored as from_square | to_square << 6 | promotion << 12 (1 to 4 for knight to queen) with square 0 being
+# a1, from the side to move's point of view: the board is rotated by 180 degrees when black is to move, like the
+# mailbox board of simPLY_chess, so that a move can be stored without knowing whose turn it is
+ENTRY_STRUCT: struct.Struct = struct.Struct(">QHBi")  # PolyGlot key, move, depth, score
+
+MIN_SHARED_DEPTH: int = 2  # entries searched one ply deep are cheap to search again, so they are left out of the shared snapshot
+
+
+def write_snapshot(entries: dict[int, tuple[int, int, int]], path: str, engine: str) -> int:
+    """Writes the given {zobrist_key: (snapshot_move, depth, score)} entries, sorted by key, to a snapshot at `path` and
+    returns the number of entries written."""
+    data: bytearray = bytearray(HEADER_STRUCT.pack(MAGIC, VERSION, engine.encode()))
+    for key, (move, depth, score) in sorted(entries.items()):
+        data += ENTRY_STRUCT.pack(key, move, min(depth, 0xff), score)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary: str = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)  # atomic, so processes that have mapped the old snapshot keep reading it unharmed
+    return len(entries)
+
+
+def read_header(data: bytes | mmap.mmap, path: str) -> str:
+    """Checks the header of a snapshot and returns the engine that searched it."""
+    if len(data) < HEADER_STRUCT.size:
+        raise ValueError(f"{path} is not a version {VERSION} hash snapshot")
+    magic, version, engine = HEADER_STRUCT.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or (len(data) - HEADER_STRUCT.size) % ENTRY_STRUCT.size != 0:
+        raise ValueError(f"{path} is not a version {VERSION} hash snapshot")
+    return engine.rstrip(b"\0").decode()
+
+
+def read_snapshot(path: str) -> tuple[str, dict[int, tuple[int, int, int]]]:
+    """Reads a whole snapshot, returning the engine that searched it and its {zobrist_key: (snapshot_move, depth, score)}
+    entries."""
+    with open(path, "rb") as file:
+        data: bytes = file.read()
+    engine: str = read_header(data, path)
+    entries: dict[int, tuple[int, int, int]] = {
+        key: (move, depth, score) for key, move, depth, score in ENTRY_STRUCT.iter_unpack(memoryview(data)[HEADER_STRUCT.size:])
+    }
+    return engine, entries
+
+
+class Snapshot:
+    """A memory-mapped snapshot, read in place so that every engine process shares the same pages."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.mmap: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat: os.stat_result = os.fstat(file.fileno())
+        self.path: str = path
+        self.version: tuple[int, int, int] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)  # changes whenever the snapshot is replaced
+        try:
+            self.engine: str = read_header(self.mmap, path)
+        except ValueError:
+            self.mmap.close()
+            raise
+        self.size: int = (len(self.mmap) - HEADER_STRUCT.size) // ENTRY_STRUCT.size
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def outdated(self) -> bool:
+        """Returns whether the file at the snapshot's path has been replaced (or removed) since it was mapped."""
+        try:
+            stat: os.stat_result = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self.version
+
+    def probe(self, key: int) -> tuple[int, int, int] | None:
+        """Returns the (snapshot_move, depth, score) stored for the given key, or None if there is none."""
+        low: int = 0
+        high: int = self.size
+        while low < high:
+            middle: int = (low + high) // 2
+            offset: int = HEADER_STRUCT.size + middle * ENTRY_STRUCT.size
+            entry_key, move, depth, score = ENTRY_STRUCT.unpack_from(self.mmap, offset)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return move, depth, score
+        return None
+
+
+def open_snapshot(path: str, engine: str, current: Snapshot | None = None) -> Snapshot | None:
+    """Maps the snapshot at `path` if it was searched by the given engine, returning None if there is no such snapshot.
+    An already mapped snapshot of the same file is kept unless the file has been replaced since."""
+    if current is not None:
+        if current.path == path and not current.outdated():
+            return current
+        current.close()
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot: Snapshot = Snapshot(path)
+    except (OSError, ValueError):
+        return None
+    if snapshot.engine != engine:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def merge_snapshots(paths: list[str], output: str, min_depth: int = MIN_SHARED_DEPTH, max_entries: int = 0) -> tuple[str, int]:
+    """Merges the given snapshots into one at `output`, keeping the deepest entry of each position that was searched to at
+    least `min_depth` and, if `max_entries` is set, only that many of the deepest entries. Snapshots of other engine
+    versions than the newest snapshot's are skipped, since their scores may no longer be right. Returns the engine and
+    the number of entries written."""
+    snapshots: list[tuple[str, dict[int, tuple[int, int, int]]]] = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            snapshots.append(read_snapshot(path))
+        except (OSError, ValueError) as error:
+            print(f"skipping {path}: {error}", file=sys.stderr)
+    if len(snapshots) == 0:
+        return "", 0
+
+    engine: str = snapshots[0][0]
+    merged: dict[int, tuple[int, int, int]] = {}
+    for snapshot_engine, entries in snapshots:
+        if snapshot_engine != engine:
+            continue
+        for key, entry in entries.items():
+            if entry[1] >= min_depth and entry[1] > merged.get(key, (0, -1, 0))[1]:
+                merged[key] = entry
+    if max_entries > 0 and len(merged) > max_entries:
+        merged = dict(sorted(merged.items(), key=lambda item: item[1][1], reverse=True)[:max_entries])
+    return engine, write_snapshot(merged, output, engine)
+
+
+def snapshot_paths(directory: str = SNAPSHOT_DIRECTORY) -> list[str]:
+    """Returns every snapshot in the given directory except the shared one."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".tt") and name != SHARED_NAME)
+
+
+def main() -> None:
+    """Merges the snapshots saved by engine processes (and the previous shared snapshot) into the shared snapshot."""
+    import argparse  # only the merge job needs it, not the engines that import this module
+    parser = argparse.ArgumentParser(description="Merges simPLY_chess hash snapshots into the shared snapshot.")
+    parser.add_argument("--directory", default=SNAPSHOT_DIRECTORY, help="where engine processes save their snapshots")
+    parser.add_argument("--min-depth", type=int, default=MIN_SHARED_DEPTH, help="shallowest search depth kept")
+    parser.add_argument("--max-entries", type=int, default=0, help="keep only this many of the deepest entries (0 keeps all)")
+    parser.add_argument("--remove", action="store_true", help="delete the snapshots of engine processes once merged")
+    parser.add_argument("--every", type=float, default=0, help="merge again after this many seconds, until interrupted")
+    arguments = parser.parse_args()
+
+    output: str = os.path.join(arguments.directory, SHARED_NAME)
+    while True:
+        paths: list[str] = snapshot_paths(arguments.directory)
+        engine, count = merge_snapshots(paths + ([output] if os.path.exists(output) else []), output, arguments.min_depth, arguments.max_entries)
+        print(f"{count} entries from {len(paths)} snapshots ({engine or 'none'}) written to {output}")
+        if arguments.remove:
+            for path in paths:
+                os.remove(path)
+        if arguments.every <= 0:
+            break
+        time.sleep(arguments.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,12 +18,18 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/> #
 #########################################################################
 
+import importlib
 import itertools
-import pathlib
+import math
+import os
 import random
-import struct
 import sys
+import threading
 import time
+from collections import Counter
+from collections.abc import Callable
+
+import book_index  # the bitboard backend, hash snapshots and bitbases are only imported once their options select them
 
 NAME: str = "simPLY_chess"
 AUTHOR: str = "andrewharabor"
@@ -80,7 +86,49 @@ INITIAL_KING_PASSANT: int = 0  # square the king "passes through" when castling
 INITIAL_COLOR: str = "w"  # the current player's color
 
 # Transposition table, used to store previously calculated positions and keep track of the best move
-TRANSPOSITION_TABLE: dict[int, tuple[tuple[int, int, str, str], int, int]] = {}  # format is {zobrist_key: (best_move, depth, score)}
+TRANSPOSITION_TABLE: dict[int, tuple[int, int, int]] = {}  # format is {zobrist_key: (best_move, depth, score)}
+
+# Hash snapshots (see hash_snapshot.py), searched for positions missing from the transposition table: the entries read
+# with "LoadHash" and the memory-mapped snapshot shared by every engine process, named by the "SharedHash" option
+LOADED_HASH: dict[int, tuple[int, int, int]] = {}  # format is {zobrist_key: (snapshot_move, depth, score)}
+SHARED_HASH: "hash_snapshot.Snapshot | None" = None
+
+# Evaluation cache and pawn hash table, fixed-size tables whose slots hold the last position (or pawn layout) hashed to
+# them with its evaluation (or pawn structure scores), replaced by the next one. The mailbox board is its own key: a
+# Zobrist key costs more to compute than an evaluation, and the pawns are kept apart as a string of the board without
+# the other pieces
+EVAL_CACHE_SIZE: int = 1 << 16  # entries, a power of two
+PAWN_HASH_SIZE: int = 1 << 14
+EVAL_CACHE: list[tuple[str, int] | None] = [None] * EVAL_CACHE_SIZE  # format is [(position, score)]
+PAWN_HASH: list[tuple[str, int, int] | None] = [None] * PAWN_HASH_SIZE  # format is [(pawns, midgame_score, endgame_score)]
+PAWNS_ONLY: dict[int, str] = str.maketrans("NBRQKnbrqk", "..........")
+# Probes and hits of each table since the last search started, reported after the search
+eval_probes: int = 0
+eval_hits: int = 0
+pawn_probes: int = 0
+pawn_hits: int = 0
+
+# Endgame tables of the three-piece endings (see bitbases.py), memory-mapped on "isready" unless the "Bitbases" option
+# is off, which give the exact result and distance to mate of those positions without searching them
+BITBASES: "bitbases.Bitbases | None" = None
+
+# Zobrist keys of the positions before the current one, first those played in the game and then those on the path of
+# the search, used to detect repetitions
+KEY_HISTORY: list[int] = []
+FIFTY_MOVE_PLIES: int = 100  # the game is drawn once this many plies are played without a capture or pawn move
+
+# Searches limited by time or nodes (rather than depth) deepen until they run out of either, or reach this depth
+MAX_DEPTH: int = 64
+
+# Profiling of searches with the "profile" command or the --profile flag
+PROFILE_MODES: tuple[str, ...] = ("deterministic", "sampling")  # cProfile or periodic stack samples
+PROFILED_FUNCTIONS: tuple[str, ...] = ("nega_max", "quiesce", "generate_moves", "make_move", "rotate_position", "king_in_check", "evaluate_position", "evaluate_move", "static_exchange", "zobrist_hash")
+SAMPLE_INTERVAL: float = 0.001  # seconds between stack samples in sampling mode
+
+# Board representations to search with, chosen with the "Backend" option: the 10x12 string board below or the
+# bitboards in bitboards.py
+BACKENDS: tuple[str, ...] = ("mailbox", "bitboard")
+BACKEND: str = BACKENDS[0]
 
 # Piece values, piece square tables, and tropism values for the middlegame and endgame
 # Used to evaluate the position in terms of material and piece placement, and king safety
@@ -169,13 +217,22 @@ MIDGAME_KING_TABLE: list[int] = [
      -18,   44,   15,  -66,   10,  -34,   29,   17,
 ]
 
+def pad_table(table: list[int]) -> list[int]:
+    """Pads an 8x8 piece square table with zeros to match the 10x12 board representation."""
+    padded_table: list[int] = [0] * 20
+    for row in range(0, 64, 8):
+        padded_table += [0] + table[row:row + 8] + [0]
+    return padded_table + [0] * 20
+
+
+# Indexed by square of the 10x12 board
 MIDGAME_PIECE_SQUARE_TABLES: dict[str, list[int]] = {
-    "P": MIDGAME_PAWN_TABLE,
-    "N": MIDGAME_KNIGHT_TABLE,
-    "B": MIDGAME_BISHOP_TABLE,
-    "R": MIDGAME_ROOK_TABLE,
-    "Q": MIDGAME_QUEEN_TABLE,
-    "K": MIDGAME_KING_TABLE,
+    "P": pad_table(MIDGAME_PAWN_TABLE),
+    "N": pad_table(MIDGAME_KNIGHT_TABLE),
+    "B": pad_table(MIDGAME_BISHOP_TABLE),
+    "R": pad_table(MIDGAME_ROOK_TABLE),
+    "Q": pad_table(MIDGAME_QUEEN_TABLE),
+    "K": pad_table(MIDGAME_KING_TABLE),
 }
 
 ENDGAME_PAWN_VALUE: int = 115
@@ -263,12 +320,32 @@ ENDGAME_KING_TABLE: list[int] = [
 ]
 
 ENDGAME_PIECE_SQUARE_TABLES: dict[str, list[int]] = {
-    "P": ENDGAME_PAWN_TABLE,
-    "N": ENDGAME_KNIGHT_TABLE,
-    "B": ENDGAME_BISHOP_TABLE,
-    "R": ENDGAME_ROOK_TABLE,
-    "Q": ENDGAME_QUEEN_TABLE,
-    "K": ENDGAME_KING_TABLE,
+    "P": pad_table(ENDGAME_PAWN_TABLE),
+    "N": pad_table(ENDGAME_KNIGHT_TABLE),
+    "B": pad_table(ENDGAME_BISHOP_TABLE),
+    "R": pad_table(ENDGAME_ROOK_TABLE),
+    "Q": pad_table(ENDGAME_QUEEN_TABLE),
+    "K": pad_table(ENDGAME_KING_TABLE),
+}
+
+# Pawn structure values, added for every doubled pawn (one more pawn of the same color on its file), isolated pawn (no
+# pawn of the same color on a neighbouring file) and passed pawn (no opponent pawn in front of it on its own or a
+# neighbouring file, valued by the rank it has reached from its side) of the side to move and subtracted for the
+# opponent's, cached by pawn layout in the pawn hash table
+MIDGAME_DOUBLED_PAWN_VALUE: int = -10
+ENDGAME_DOUBLED_PAWN_VALUE: int = -20
+MIDGAME_ISOLATED_PAWN_VALUE: int = -10
+ENDGAME_ISOLATED_PAWN_VALUE: int = -15
+MIDGAME_PASSED_PAWN_VALUES: list[int] = [0, 5, 10, 15, 25, 40, 60, 0]  # first rank first
+ENDGAME_PASSED_PAWN_VALUES: list[int] = [0, 10, 20, 35, 60, 90, 130, 0]
+# Used for table modules that don't have pawn structure values, as texel.py wrote them before it tuned those too
+DEFAULT_PAWN_STRUCTURE_VALUES: dict[str, int | list[int]] = {
+    "MIDGAME_DOUBLED_PAWN_VALUE": MIDGAME_DOUBLED_PAWN_VALUE,
+    "ENDGAME_DOUBLED_PAWN_VALUE": ENDGAME_DOUBLED_PAWN_VALUE,
+    "MIDGAME_ISOLATED_PAWN_VALUE": MIDGAME_ISOLATED_PAWN_VALUE,
+    "ENDGAME_ISOLATED_PAWN_VALUE": ENDGAME_ISOLATED_PAWN_VALUE,
+    "MIDGAME_PASSED_PAWN_VALUES": MIDGAME_PASSED_PAWN_VALUES[:],
+    "ENDGAME_PASSED_PAWN_VALUES": ENDGAME_PASSED_PAWN_VALUES[:],
 }
 
 MOP_UP_SCORE: int = ENDGAME_PAWN_VALUE * 2 # used to encourage kings to be closer to each other if winning an endgame position
@@ -507,6 +584,25 @@ DECODED_PROMOTION_PIECES: dict[int, str] = {
     4: "Q",
 }
 
+# Moves are packed into integers: bits 0-6 hold the start square, bits 7-13 the end square, bits 14-16 the captured
+# piece, bits 17-19 the promotion piece (encoded like PolyGlot) and bits 20-22 flag castling, en passant captures and
+# double pawn pushes
+NULL_MOVE: int = 0
+SQUARE_MASK: int = 0x7F
+END_SHIFT: int = 7
+CAPTURE_SHIFT: int = 14
+PROMOTION_SHIFT: int = 17
+CAPTURE_MASK: int = 0x7 << CAPTURE_SHIFT
+CASTLING_FLAG: int = 1 << 20
+EN_PASSANT_FLAG: int = 1 << 21
+DOUBLE_PUSH_FLAG: int = 1 << 22
+
+CAPTURED_PIECES: str = ".pnbrqk"  # indexed by captured piece code, 0 for quiet moves
+
+CAPTURE_CODES: dict[str, int] = {piece: code << CAPTURE_SHIFT for code, piece in enumerate(CAPTURED_PIECES)}
+
+PROMOTION_CODES: dict[str, int] = {piece: code << PROMOTION_SHIFT for code, piece in DECODED_PROMOTION_PIECES.items()}
+
 UNICODE_PIECE_SYMBOLS = {
     "R": "♖", "r": "♜",
     "N": "♘", "n": "♞",
@@ -520,10 +616,10 @@ UNICODE_PIECE_SYMBOLS = {
 # BOARD LOGIC #
 ###############
 
-def generate_moves(position: str, castling: list[bool], en_passant: int) -> list[tuple[int, int, str, str]]:
-    """Generates all pseudo-legal moves for a given position. Moves are represented as tuples:
-    (start_square, end_square, piece_captured, promotion_piece)"""
-    move_list: list[tuple[int, int, str, str]] = []
+def generate_moves(position: str, castling: list[bool], en_passant: int) -> list[int]:
+    """Generates all pseudo-legal moves for a given position. Moves are packed into integers (see NULL_MOVE) holding
+    the start square, end square, piece captured, promotion piece and flags."""
+    move_list: list[int] = []
     for start_square in range(len(position)):
         if not position[start_square].isupper():  # piece is not current player's
             continue
@@ -533,34 +629,41 @@ def generate_moves(position: str, castling: list[bool], en_passant: int) -> list
                 piece_captured: str = position[end_square]
                 if piece_captured.isspace() or piece_captured.isupper():  # off the board or ally piece
                     break
+                move: int = start_square | end_square << END_SHIFT | CAPTURE_CODES[piece_captured]
                 if piece_moved == "P":
                     if direction in [NORTH, NORTH + NORTH] and piece_captured != ".":  # pawn push onto occupied square
                         break
-                    if direction == NORTH + NORTH and (start_square < A1 + NORTH or position[start_square + NORTH] != "."):  # double pawn push from invalid rank
-                        break
-                    if direction in [NORTH + WEST, NORTH + EAST] and piece_captured == "." and end_square + SOUTH != en_passant:  # invalid en passant capture
-                        break
+                    if direction == NORTH + NORTH:
+                        if start_square < A1 + NORTH or position[start_square + NORTH] != ".":  # double pawn push from invalid rank
+                            break
+                        move |= DOUBLE_PUSH_FLAG
+                    elif direction != NORTH and piece_captured == ".":
+                        if end_square != en_passant:  # invalid en passant capture
+                            break
+                        move |= EN_PASSANT_FLAG | CAPTURE_CODES["p"]  # a pawn capture, like in the bitboard backend
                     if A8 <= end_square <= H8:  # pawn promotion
                         for promotion_piece in "QRBN":
-                            move_list.append((start_square, end_square, piece_captured, promotion_piece))
+                            move_list.append(move | PROMOTION_CODES[promotion_piece])
                         break
-                move_list.append((start_square, end_square, piece_captured, ""))
+                move_list.append(move)
                 if piece_moved in "PNK" or piece_captured.islower():  # non-sliding piece or capture
                     break
                 if start_square == A1 and position[end_square + EAST] == "K" and castling[0]:  # the piece is a rook on a1, and the king is on e1 with empty squares in between, and queenside castling is allowed
-                    move_list.append((end_square + EAST, end_square + WEST, piece_captured, ""))
+                    move_list.append((end_square + EAST) | (end_square + WEST) << END_SHIFT | CASTLING_FLAG)
                 if  start_square == H1 and position[end_square + WEST] == "K" and castling[1]:  # the piece is a rook on h1, and the king is on e1 with empty squares in between, and kingside castling is allowed
-                    move_list.append((end_square + WEST, end_square + EAST, piece_captured, ""))
-    move_list.sort(key=lambda move: evaluate_move(move, position, en_passant), reverse=True)  # sort moves by basic evaluation
+                    move_list.append((end_square + WEST) | (end_square + EAST) << END_SHIFT | CASTLING_FLAG)
+    phase: int = game_phase(position)
+    # Sort moves by basic evaluation, breaking ties by end and start square so that the bitboard backend searches the same tree
+    move_list.sort(key=lambda move: evaluate_move(move, position, en_passant, phase) * 0x4000 - (move & 0x3FFF), reverse=True)
     return move_list
 
 
-def make_move(move: tuple[int, int, str, str], position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int) -> tuple[str, list[bool], list[bool], int, int]:
+def make_move(move: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int) -> tuple[str, list[bool], list[bool], int, int]:
     """Makes a move on the given position."""
     list_position: list[str] = list(position)
-    start_square: int = move[0]
-    end_square: int = move[1]
-    promotion_piece: str = move[3]
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    promotion_piece: str = DECODED_PROMOTION_PIECES[move >> PROMOTION_SHIFT & 0x7]
     piece_moved: str = list_position[start_square]
     king_passant = 0
     list_position[start_square] = "."
@@ -588,10 +691,8 @@ def make_move(move: tuple[int, int, str, str], position: str, castling: list[boo
             list_position[end_square + SOUTH] = "."
         if A8 <= end_square <= H8:  # pawn promotion
             list_position[end_square] = promotion_piece
-        if end_square - start_square == NORTH + NORTH:  # double pawn push
-            en_passant = end_square + SOUTH
-        else:
-            en_passant = 0
+    # the en passant square only lasts for the reply to a double pawn push
+    en_passant = end_square + SOUTH if piece_moved == "P" and end_square - start_square == NORTH + NORTH else 0
     position = "".join(list_position)
     return position, castling, opponent_castling, en_passant, king_passant
 
@@ -601,7 +702,7 @@ def rotate_position(position: str, castling: list[bool], opponent_castling: list
     Typically called after make_move() since our engine always looks from the current player's point of view."""
     en_passant = 119 - en_passant
     king_passant = 119 - king_passant
-    castling, opponent_castling = opponent_castling, castling
+    castling, opponent_castling = opponent_castling[::-1], castling[::-1]  # the rotation swaps the a-file and h-file rooks
     list_position: list[str] = list(position)
     for i in range(60):  # only need to loop through half the board since we're swapping two squares at a time
         if not list_position[i].isspace():
@@ -628,17 +729,78 @@ def king_in_check(position: str, castling: list[bool], king_passant: int) -> boo
     elif king_passant in [24, 26]:
         original_king_position = 25
         castled = True
-    move_list: list[tuple[int, int, str, str]] = generate_moves(position, castling[:], 0)
+    if castled:  # pawns only show up in the move list when they capture something, so look for any attacker directly
+        board: list[str] = list(position)
+        if least_valuable_attacker(board, original_king_position, "PNBRQK") or least_valuable_attacker(board, king_passant, "PNBRQK"):
+            return True
+    move_list: list[int] = generate_moves(position, castling[:], 0)
     for move in move_list:
-        if move[1] == king_position or move[1] == king_passant:
+        end_square: int = move >> END_SHIFT & SQUARE_MASK
+        if end_square == king_position or end_square == king_passant:
             return True
 
-        if castled and move[1] == original_king_position:
+        if castled and end_square == original_king_position:
             return True
 
     return False
 
 
+def least_valuable_attacker(board: list[str], square: int, pieces: str) -> int:
+    """Finds the least valuable of the given pieces ("PNBRQK" for ours or "pnbrqk" for the opponent's) attacking the
+    given square, returning its square or 0 if there is none."""
+    pawn, knight, bishop, rook, queen, king = pieces
+    for offset in ((SOUTH + WEST, SOUTH + EAST) if pawn == "P" else (NORTH + WEST, NORTH + EAST)):  # where a pawn attacking the square stands
+        if board[square + offset] == pawn:
+            return square + offset
+
+    for offset in PIECE_DIRECTIONS["N"]:
+        if board[square + offset] == knight:
+            return square + offset
+
+    queen_square: int = 0
+    for slider, directions in ((bishop, PIECE_DIRECTIONS["B"]), (rook, PIECE_DIRECTIONS["R"])):
+        for direction in directions:
+            attacker_square: int = square + direction
+            while board[attacker_square] == ".":
+                attacker_square += direction
+            if board[attacker_square] == slider:
+                return attacker_square
+            if board[attacker_square] == queen:
+                queen_square = attacker_square
+    if queen_square != 0:
+        return queen_square
+
+    for offset in PIECE_DIRECTIONS["K"]:
+        if board[square + offset] == king:
+            return square + offset
+    return 0
+
+
+def checkmated(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int) -> bool:
+    """Returns whether the side to move is in check without a legal move."""
+    if not king_in_check(rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)[0], castling[:], 0):
+        return False
+    for move in generate_moves(position, castling[:], en_passant):
+        new_position: tuple[str, list[bool], list[bool], int, int] = rotate_position(*make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant))
+        if not king_in_check(new_position[0], castling[:], new_position[4]):
+            return False
+    return True
+
+
+def perft(depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int) -> int:
+    """Counts the leaf nodes of the tree of legal moves to the given depth, used to verify move generation."""
+    if depth == 0:
+        return 1
+    count: int = 0
+    for move in generate_moves(position, castling[:], en_passant):
+        new_position: tuple[str, list[bool], list[bool], int, int] = make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant)
+        new_position = rotate_position(*new_position)
+        if king_in_check(new_position[0], castling[:], new_position[4]):  # if the move results in our king being in check (illegal move)
+            continue
+        count += perft(depth - 1, *new_position)
+    return count
+
+
 ########################
 # EVALUATION FUNCTIONS #
 ########################
@@ -663,11 +825,70 @@ def interpolate(midgame_score: int, endgame_score: int, phase: int) -> int:
     return ((midgame_score * (256 - phase)) + (endgame_score * phase)) // 256
 
 
+def pawn_counts(pawns: str) -> tuple[int, int, list[int]]:
+    """Counts the doubled pawns, the isolated pawns and the passed pawns on each rank of the side to move, less those of
+    the opponent, on a board where only the pawns (or all pieces) are left."""
+    files: list[list[int]] = [[0] * 10, [0] * 10]  # pawns on each file of the 10x12 board, ours and the opponent's
+    pawn_squares: list[list[int]] = [[], []]
+    for square, piece in enumerate(pawns):
+        if piece == "P" or piece == "p":
+            side: int = 0 if piece == "P" else 1
+            files[side][square % 10] += 1
+            pawn_squares[side].append(square)
+    doubled: int = 0
+    isolated: int = 0
+    passed: list[int] = [0] * 8
+    for side, sign in ((0, 1), (1, -1)):
+        own_files: list[int] = files[side]
+        for file in range(1, 9):
+            if own_files[file] > 1:
+                doubled += sign * (own_files[file] - 1)
+            if own_files[file] and not own_files[file - 1] and not own_files[file + 1]:
+                isolated += sign * own_files[file]
+        for square in pawn_squares[side]:
+            row: int = square // 10
+            file = square % 10
+            # Our pawns move towards the lower rows and the opponent's towards the higher ones
+            if not any(abs(other % 10 - file) <= 1 and (other // 10 < row if side == 0 else other // 10 > row) for other in pawn_squares[1 - side]):
+                passed[9 - row if side == 0 else row - 2] += sign
+    return doubled, isolated, passed
+
+
+def pawn_structure(position: str) -> tuple[int, int]:
+    """Returns the midgame and endgame scores of the pawn structure of the given position for the side to move, from the
+    pawn hash table if the same pawns were evaluated before."""
+    global pawn_probes, pawn_hits
+    pawns: str = position.translate(PAWNS_ONLY)
+    slot: int = hash(pawns) & (PAWN_HASH_SIZE - 1)
+    entry: tuple[str, int, int] | None = PAWN_HASH[slot]
+    pawn_probes += 1
+    if entry is not None and entry[0] == pawns:
+        pawn_hits += 1
+        return entry[1], entry[2]
+
+    doubled, isolated, passed = pawn_counts(pawns)
+    midgame_score: int = doubled * MIDGAME_DOUBLED_PAWN_VALUE + isolated * MIDGAME_ISOLATED_PAWN_VALUE
+    endgame_score: int = doubled * ENDGAME_DOUBLED_PAWN_VALUE + isolated * ENDGAME_ISOLATED_PAWN_VALUE
+    for rank, count in enumerate(passed):
+        midgame_score += count * MIDGAME_PASSED_PAWN_VALUES[rank]
+        endgame_score += count * ENDGAME_PASSED_PAWN_VALUES[rank]
+    PAWN_HASH[slot] = (pawns, midgame_score, endgame_score)
+    return midgame_score, endgame_score
+
+
 def evaluate_position(position: str) -> int:
     """Evaluates the given position for the side-to-move using material values, piece square tables, king tropism,
-    and mop-up bonus and interpolating between midgame and endgame scores."""
-    midgame_score: int = 0
-    endgame_score: int = 0
+    pawn structure and mop-up bonus and interpolating between midgame and endgame scores. Evaluations are kept in the
+    evaluation cache, since the same positions come up again through transpositions and in every iteration."""
+    global eval_probes, eval_hits
+    slot: int = hash(position) & (EVAL_CACHE_SIZE - 1)
+    entry: tuple[str, int] | None = EVAL_CACHE[slot]
+    eval_probes += 1
+    if entry is not None and entry[0] == position:
+        eval_hits += 1
+        return entry[1]
+
+    midgame_score, endgame_score = pawn_structure(position)
     king_square: int = position.find("K") if "K" in position else 0
     opponent_king_square: int = position.find("k") if "k" in position else 0
     for square, piece in enumerate(position):
@@ -686,21 +907,25 @@ def evaluate_position(position: str) -> int:
         endgame_score += mop_up_bonus
     elif endgame_score < 0:
         endgame_score -= mop_up_bonus
-    return interpolate(midgame_score, endgame_score, game_phase(position))
+    score: int = interpolate(midgame_score, endgame_score, game_phase(position))
+    EVAL_CACHE[slot] = (position, score)
+    return score
 
 
-def evaluate_move(move: tuple[int, int, str, str], position: str, en_passant: int) -> int:
-    """Evaluates the given move for the side-to-move by interpolating between midgame and endgame scores."""
-    start_square: int = move[0]
-    end_square: int = move[1]
+def evaluate_move(move: int, position: str, en_passant: int, phase: int = -1) -> int:
+    """Evaluates the given move for the side-to-move by interpolating between midgame and endgame scores. The game
+    phase of the position can be passed in when evaluating many moves from the same position."""
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
     piece_moved: str = position[start_square]
-    piece_captured: str = move[2]
-    promotion_piece: str = move[3]
+    piece_captured: str = CAPTURED_PIECES[move >> CAPTURE_SHIFT & 0x7]
+    promotion_piece: str = DECODED_PROMOTION_PIECES[move >> PROMOTION_SHIFT & 0x7]
     midgame_score: int = MIDGAME_PIECE_SQUARE_TABLES[piece_moved][end_square] - MIDGAME_PIECE_SQUARE_TABLES[piece_moved][start_square]
     endgame_score: int = ENDGAME_PIECE_SQUARE_TABLES[piece_moved][end_square] - ENDGAME_PIECE_SQUARE_TABLES[piece_moved][start_square]
     if piece_captured.islower():  # capture
-        midgame_score += MIDGAME_PIECE_VALUES[piece_captured.upper()] + MIDGAME_PIECE_SQUARE_TABLES[piece_captured.upper()][(11 - (end_square // 10)) * 10 + (end_square % 10)]
-        endgame_score += ENDGAME_PIECE_VALUES[piece_captured.upper()] + ENDGAME_PIECE_SQUARE_TABLES[piece_captured.upper()][(11 - (end_square // 10)) * 10 + (end_square % 10)]
+        captured_square: int = end_square + SOUTH if move & EN_PASSANT_FLAG else end_square
+        midgame_score += MIDGAME_PIECE_VALUES[piece_captured.upper()] + MIDGAME_PIECE_SQUARE_TABLES[piece_captured.upper()][(11 - (captured_square // 10)) * 10 + (captured_square % 10)]
+        endgame_score += ENDGAME_PIECE_VALUES[piece_captured.upper()] + ENDGAME_PIECE_SQUARE_TABLES[piece_captured.upper()][(11 - (captured_square // 10)) * 10 + (captured_square % 10)]
     if piece_moved == "K" and abs(start_square - end_square) == 2:  # castling
         midgame_score += MIDGAME_PIECE_SQUARE_TABLES["R"][(start_square + end_square) // 2] - MIDGAME_PIECE_SQUARE_TABLES["R"][A1 if end_square < start_square else H1]
         endgame_score += ENDGAME_PIECE_SQUARE_TABLES["R"][(start_square + end_square) // 2] - ENDGAME_PIECE_SQUARE_TABLES["R"][A1 if end_square < start_square else H1]
@@ -708,37 +933,112 @@ def evaluate_move(move: tuple[int, int, str, str], position: str, en_passant: in
         if A8 <= end_square <= H8:  # pawn promotion
             midgame_score += MIDGAME_PIECE_SQUARE_TABLES[promotion_piece][end_square] - MIDGAME_PIECE_SQUARE_TABLES["P"][end_square] + MIDGAME_PIECE_VALUES[promotion_piece] - MIDGAME_PIECE_VALUES["P"]
             endgame_score += ENDGAME_PIECE_SQUARE_TABLES[promotion_piece][end_square] - ENDGAME_PIECE_SQUARE_TABLES["P"][end_square] + ENDGAME_PIECE_VALUES[promotion_piece] - ENDGAME_PIECE_VALUES["P"]
-        if end_square + SOUTH == en_passant:
-            midgame_score += MIDGAME_PIECE_SQUARE_TABLES["P"][(11 - ((end_square + SOUTH) // 10)) * 10 + ((end_square + SOUTH) % 10)]
-            endgame_score += ENDGAME_PIECE_SQUARE_TABLES["P"][(11 - ((end_square + SOUTH) // 10)) * 10 + ((end_square + SOUTH) % 10)]
-    return interpolate(midgame_score, endgame_score, game_phase(position))
+    return interpolate(midgame_score, endgame_score, phase if phase >= 0 else game_phase(position))
+
+
+def static_exchange(move: int, position: str) -> int:
+    """Static exchange evaluation: the material the side-to-move wins (or loses, if negative) with the given capture
+    once both sides have recaptured on its end square with their least valuable attackers for as long as it pays off.
+    Pieces that are moved off the board reveal the sliding pieces behind them."""
+    board: list[str] = list(position)
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    gains: list[int] = [MIDGAME_PIECE_VALUES[CAPTURED_PIECES[move >> CAPTURE_SHIFT & 0x7].upper()]]
+    attacker_value: int = MIDGAME_PIECE_VALUES[board[start_square]]
+    board[start_square] = "."
+    if move & EN_PASSANT_FLAG:  # the captured pawn isn't on the end square
+        board[end_square + SOUTH] = "."
+    attackers: tuple[str, str] = ("pnbrqk", "PNBRQK")
+    side: int = 0
+    while True:
+        attacker_square: int = least_valuable_attacker(board, end_square, attackers[side])
+        if attacker_square == 0:
+            break
+        gains.append(attacker_value - gains[-1])  # speculative gain if this side recaptures
+        attacker_value = MIDGAME_PIECE_VALUES[board[attacker_square].upper()]
+        board[attacker_square] = "."
+        side ^= 1
+    for i in range(len(gains) - 1, 0, -1):  # either side may stop recapturing when it would lose material
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def losing_capture(move: int, position: str) -> bool:
+    """Finds if the given capture loses material by static exchange evaluation, which is only possible if the
+    capturing piece is worth more than the piece it captures."""
+    if MIDGAME_PIECE_VALUES[position[move & SQUARE_MASK]] <= MIDGAME_PIECE_VALUES[CAPTURED_PIECES[move >> CAPTURE_SHIFT & 0x7].upper()]:
+        return False
+    return static_exchange(move, position) < 0
+
+
+def order_captures(move_list: list[int], position: str) -> list[int]:
+    """Moves captures that lose material by static exchange evaluation behind every other move, keeping the order of
+    the moves otherwise."""
+    losing_captures: set[int] = {move for move in move_list if move & CAPTURE_MASK and losing_capture(move, position)}
+    move_list.sort(key=lambda move: move in losing_captures)
+    return move_list
 
 
-def principal_variation(length: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> list[tuple[int, int, str, str]]:
+def principal_variation(length: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> list[int]:
     """Uses the transposition table to find the principal variation for the given position as a list of moves."""
     key: int = zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-    result: tuple[tuple[int, int, str, str], int, int] | None = TRANSPOSITION_TABLE.get(key)
+    result: tuple[int, int, int] | None = TRANSPOSITION_TABLE.get(key)
     if result is None or length <= 0:
         return []
 
-    best_move: tuple[int, int, str, str] = result[0]
+    best_move: int = result[0]
     new_position: tuple[str, list[bool], list[bool], int, int] = make_move(best_move, position, castling[:], opponent_castling[:], en_passant, king_passant)
     new_position = rotate_position(*new_position)
     return [best_move] + principal_variation(length - 1, *new_position, "w" if color == "b" else "b")
 
 
+def load_tables(name: str) -> None:
+    """Replaces the piece values, piece square tables, tropism values and pawn structure values with those of a table
+    module written by texel.py, imported by name from the engines directory. Every value is read and checked before any
+    is replaced, so a module that fails to load leaves the evaluation as it was, and pawn structure values the module
+    doesn't have are reset to their defaults. The tables are changed in place so that everything built on them follows,
+    the cached evaluations are dropped and the bitboard backend is configured again before its next search."""
+    tables = importlib.import_module(name)
+    square_tables: dict[str, list[int]] = {}  # global name -> table
+    values: dict[str, dict[str, int]] = {}  # global name -> {piece: value}
+    pawn_structure_values: dict[str, int | list[int]] = {}  # global name -> value
+    for phase in ("MIDGAME", "ENDGAME"):
+        for piece_name in ("PAWN", "KNIGHT", "BISHOP", "ROOK", "QUEEN", "KING"):
+            table: list[int] = list(getattr(tables, f"{phase}_{piece_name}_TABLE"))
+            if len(table) != 64:
+                raise ValueError(f"{name}.{phase}_{piece_name}_TABLE doesn't have 64 squares")
+            square_tables[f"{phase}_{piece_name}_TABLE"] = table
+        for kind in ("PIECE_VALUES", "TROPISM_VALUES"):  # the kings' values cancel out, and stay large enough to tell checkmates apart
+            module_values: dict[str, int] = getattr(tables, f"{phase}_{kind}")
+            values[f"{phase}_{kind}"] = {piece: int(module_values[piece]) for piece in "PNBRQ"}
+        for value_name in ("DOUBLED_PAWN_VALUE", "ISOLATED_PAWN_VALUE"):
+            pawn_structure_values[f"{phase}_{value_name}"] = int(getattr(tables, f"{phase}_{value_name}", DEFAULT_PAWN_STRUCTURE_VALUES[f"{phase}_{value_name}"]))
+        passed_pawn_values: list[int] = list(getattr(tables, f"{phase}_PASSED_PAWN_VALUES", DEFAULT_PAWN_STRUCTURE_VALUES[f"{phase}_PASSED_PAWN_VALUES"]))
+        if len(passed_pawn_values) != 8:
+            raise ValueError(f"{name}.{phase}_PASSED_PAWN_VALUES doesn't have 8 ranks")
+        pawn_structure_values[f"{phase}_PASSED_PAWN_VALUES"] = passed_pawn_values
+
+    for phase, piece_square_tables in (("MIDGAME", MIDGAME_PIECE_SQUARE_TABLES), ("ENDGAME", ENDGAME_PIECE_SQUARE_TABLES)):
+        for piece, piece_name in (("P", "PAWN"), ("N", "KNIGHT"), ("B", "BISHOP"), ("R", "ROOK"), ("Q", "QUEEN"), ("K", "KING")):
+            globals()[f"{phase}_{piece_name}_TABLE"][:] = square_tables[f"{phase}_{piece_name}_TABLE"]
+            piece_square_tables[piece] = pad_table(square_tables[f"{phase}_{piece_name}_TABLE"])
+    for global_name, piece_values in values.items():
+        globals()[global_name].update(piece_values)
+    for global_name, value in pawn_structure_values.items():
+        if isinstance(value, list):
+            globals()[global_name][:] = value
+        else:
+            globals()[global_name] = value
+    EVAL_CACHE[:] = [None] * EVAL_CACHE_SIZE
+    PAWN_HASH[:] = [None] * PAWN_HASH_SIZE
+    if "bitboards" in sys.modules:
+        sys.modules["bitboards"].configured = False
+
+
 ######################################
 # HASHING AND OPENING BOOK FUNCTIONS #
 ######################################
 
-def load_book(book_name: str) -> list[list[int]]:
-    """Loads an opening book and returns it as a list of lists of raw integer data."""
-    with open(f"{pathlib.Path(__file__).resolve().parent}/opening-books/{book_name}.bin", "rb") as file:
-        file_content: bytes = file.read()
-    integer_data: list[int] = list(struct.unpack(">" + ("QHHI" * (len(file_content) // 16)), file_content))
-    return [integer_data[i:i + 4] for i in range(0, len(integer_data), 4)]
-
-
 def zobrist_hash(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> int:
     """Calculates a Zobrist hash for the given position using the PolyGlot book format."""
     if color == "b":
@@ -778,53 +1078,97 @@ def zobrist_hash(position: str, castling: list[bool], opponent_castling: list[bo
     return piece_hash ^ castling_hash ^ en_passant_hash ^ turn_hash
 
 
-def all_entries(opening_book: list[list[int]], position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> list[tuple[tuple[int, int, str, str], int]]:
-    """Returns all entries in the PolyGlot opening book for the given position."""
+def snapshot_move(move: int) -> int:
+    """Converts a move to the representation of hash snapshots, whose squares are numbered from 0 (a1) to 63 (h8)."""
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    start_index: int = 8 * (9 - start_square // 10) + start_square % 10 - 1
+    end_index: int = 8 * (9 - end_square // 10) + end_square % 10 - 1
+    return start_index | end_index << 6 | (move >> PROMOTION_SHIFT & 0x7) << 12
+
+
+def probe_snapshots(key: int) -> tuple[int, int, int] | None:
+    """Returns the (snapshot_move, depth, score) of the given key from the loaded snapshot or else the shared one."""
+    entry: tuple[int, int, int] | None = LOADED_HASH.get(key)
+    if entry is None and SHARED_HASH is not None:
+        entry = SHARED_HASH.probe(key)
+    return entry
+
+
+def snapshot_entry(key: int, position: str, castling: list[bool], en_passant: int) -> tuple[int, int, int] | None:
+    """Returns the hash snapshot entry of the given position with its move in our representation, or None if there is
+    none or its move can't be played here (the key collided with another position's)."""
+    entry: tuple[int, int, int] | None = probe_snapshots(key)
+    if entry is None:
+        return None
+    for move in generate_moves(position, castling[:], en_passant):
+        if snapshot_move(move) == entry[0]:
+            return move, entry[1], entry[2]
+    return None
+
+
+def save_hash(path: str) -> int:
+    """Writes the transposition tables of both backends, together with the loaded snapshot, to a hash snapshot and returns
+    the number of entries. Checkmate scores are left out since they count the moves to mate from the root of the search
+    that stored them."""
+    import hash_snapshot
+    entries: dict[int, tuple[int, int, int]] = dict(LOADED_HASH)
+    tables: list[tuple[dict[int, tuple[int, int, int]], Callable[[int], int]]] = [(TRANSPOSITION_TABLE, snapshot_move)]
+    if "bitboards" in sys.modules:  # the bitboard backend has searched
+        tables.append((sys.modules["bitboards"].TRANSPOSITION_TABLE, sys.modules["bitboards"].snapshot_move))
+    for table, convert in tables:
+        for key, (move, depth, score) in table.items():
+            if abs(score) < CHECKMATE_LOWER and depth > entries.get(key, (NULL_MOVE, 0, 0))[1]:
+                entries[key] = (convert(move), depth, score)
+    return hash_snapshot.write_snapshot(entries, path, f"{NAME} {VERSION}")
+
+
+def load_hash(path: str) -> int:
+    """Reads a hash snapshot saved by this version of the engine, replacing the one loaded before, and returns the number
+    of entries."""
+    global LOADED_HASH
+    import hash_snapshot
+    engine, entries = hash_snapshot.read_snapshot(path)
+    if engine != f"{NAME} {VERSION}":
+        raise ValueError(f"{path} was saved by {engine}")
+    LOADED_HASH = entries
+    return len(entries)
+
+
+def all_entries(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> list[tuple[int, int]]:
+    """Returns all entries in the merged opening book index for the given position, weighted by the book mix."""
     key: int = zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-    entries: list[tuple[tuple[int, int, str, str], int]] = []
-    for entry_key, raw_move, weight, _ in opening_book:
-        if entry_key == key:
-            endian_start_square: int = (raw_move >> 6) & 0x3f
-            endian_end_square: int = raw_move & 0x3f
-            encoded_promotion_piece: int = (raw_move >> 12) & 0x7
-            start_square: int = 10 * (9 - (endian_start_square // 8)) + (endian_start_square % 8) + 1  # convert to our 10x12 representation
-            end_square: int = 10 * (9 - (endian_end_square // 8)) + (endian_end_square % 8) + 1
-            promotion_piece: str = DECODED_PROMOTION_PIECES[encoded_promotion_piece]
-            if color == "b":  # flip move if from black's perspective
-                start_square = 119 - start_square
-                end_square = 119 - end_square
-            if start_square == 95 or start_square == 94:  # adjust castling since PolyGlot represents it as e1h1 or e1a1 (instead of e1g1 or e1c1)
-                if end_square == H1:
-                    end_square = start_square + 2
-                elif end_square == A1:
-                    end_square = start_square - 2
-            move: tuple[int, int, str, str] = (start_square, end_square, position[end_square], promotion_piece)
-            entries.append((move, weight))
+    entries: list[tuple[int, int]] = []
+    for raw_move, weight, _ in OPENING_BOOK.entries(key, BOOK_MIX):
+        endian_start_square: int = (raw_move >> 6) & 0x3f
+        endian_end_square: int = raw_move & 0x3f
+        encoded_promotion_piece: int = (raw_move >> 12) & 0x7
+        start_square: int = 10 * (9 - (endian_start_square // 8)) + (endian_start_square % 8) + 1  # convert to our 10x12 representation
+        end_square: int = 10 * (9 - (endian_end_square // 8)) + (endian_end_square % 8) + 1
+        if color == "b":  # flip move if from black's perspective
+            start_square = 119 - start_square
+            end_square = 119 - end_square
+        if start_square == 95 or start_square == 94:  # adjust castling since PolyGlot represents it as e1h1 or e1a1 (instead of e1g1 or e1c1)
+            if end_square == H1:
+                end_square = start_square + 2
+            elif end_square == A1:
+                end_square = start_square - 2
+        move: int = start_square | end_square << END_SHIFT | CAPTURE_CODES.get(position[end_square], 0) | encoded_promotion_piece << PROMOTION_SHIFT
+        if position[start_square] == "P" and end_square == en_passant:  # encoded like generated en passant captures
+            move |= EN_PASSANT_FLAG | CAPTURE_CODES["p"]
+        entries.append((move, weight))
     return entries
 
 
-def book_entries(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> tuple[tuple[int, int, str, str], tuple[int, int, str, str]]:
-    """Returns the maximum entry and a random entry by weight from the PolyGlot opening book for the given position."""
-
-    total_entries: list[tuple[tuple[int, int, str, str], int]] = []
-
-    for book in OPENING_BOOKS:
-        entries: list[tuple[tuple[int, int, str, str], int]] = all_entries(book, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-        for new_entry in entries:
-            found: bool = False
-            for i, entry in enumerate(total_entries):
-                if entry[0] == new_entry[0]:
-                    total_entries[i] = (entry[0], entry[1] + new_entry[1]) # combine the weights of all opening books
-                    found = True
-                    break
-            if not found:
-                total_entries.append(new_entry) # add new entries to the list if not already present
+def book_entries(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> tuple[int, int]:
+    """Returns the maximum entry and a random entry by weight from the opening book index for the given position."""
+    total_entries: list[tuple[int, int]] = all_entries(position, castling[:], opponent_castling[:], en_passant, king_passant, color)  # weights of all books are already combined
 
     if len(total_entries) == 0:
-        return (0, 0, "", ""), (0, 0, "", "")
+        return NULL_MOVE, NULL_MOVE
 
-    max_entry: tuple[int, int, str, str] = max(total_entries, key=lambda pair: (pair[1], evaluate_move(pair[0], position, en_passant)))[0]
-    weighted_entry: tuple[int, int, str, str] = (0, 0, "", "")
+    max_entry: int = max(total_entries, key=lambda pair: (pair[1], evaluate_move(pair[0], position, en_passant)))[0]
+    weighted_entry: int = NULL_MOVE
     weight_sum: int = sum([entry[1] for entry in total_entries])
     target: int = random.randint(0, weight_sum)
     random.shuffle(total_entries)
@@ -841,32 +1185,71 @@ def book_entries(position: str, castling: list[bool], opponent_castling: list[bo
 # SEARCH LOGIC #
 ################
 
+def probe_bitbases(position: str) -> tuple[int, int]:
+    """Returns the result of a position with three pieces from the bitbases as (1 for a win, 0 for a draw or -1 for a
+    loss of the side to move, plies until checkmate)."""
+    assert BITBASES is not None
+    # Squares numbered from 0 (a1) to 63 (h8) as seen by the side to move, or upside down for the opponent's pieces so
+    # that the stronger side's pawn moves up the board either way
+    squares: dict[str, int] = {piece: 8 * (9 - square // 10) + square % 10 - 1 for square, piece in enumerate(position) if piece.isalpha()}
+    extra: str = next(piece for piece in squares if piece not in "Kk")
+    if extra.isupper():
+        return BITBASES.probe(True, extra, squares["K"], squares["k"], squares[extra])
+    return BITBASES.probe(False, extra.upper(), squares["k"] ^ 56, squares["K"] ^ 56, squares[extra] ^ 56)
+
+
+def bitbase_move(position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> int:
+    """Picks the move of a position in the bitbases without searching: the quickest mate when winning, the longest
+    defence when losing and otherwise a move that keeps the draw, the one the evaluation likes best."""
+    best_move: int = NULL_MOVE
+    best_rank: tuple[int, int] = (-2, 0)
+    best_score: int = 0
+    for move in generate_moves(position, castling[:], en_passant):
+        new_position: tuple[str, list[bool], list[bool], int, int] = make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant)
+        new_position = rotate_position(*new_position)
+        if king_in_check(new_position[0], castling[:], new_position[4]):
+            continue
+        result, plies = probe_bitbases(new_position[0]) if new_position[0].count(".") == 61 else (0, 0)  # or two kings left
+        result, plies = -result, plies + 1
+        rank: tuple[int, int] = (result, -plies if result == 1 else plies if result == -1 else -evaluate_position(new_position[0]))
+        if rank > best_rank:
+            best_move, best_rank, best_score = move, rank, result * (CHECKMATE_LOWER - plies)
+    if best_move != NULL_MOVE:
+        send_response(f"info depth 1 score cp {best_score} nodes 0 time 0 pv {algebraic_notation(best_move, color)}")
+        send_response(f"info string bitbase {('loss', 'draw', 'win')[best_rank[0] + 1]}")
+    return best_move
+
+
 def quiesce(alpha: int, beta: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int) -> int:
     """Performs a fail-hard quiescent search (searches captures only until a quiet position is reached) with delta
     pruning."""
-    global nodes, start_time, time_limit, timeout
-    if time.time() - start_time > time_limit:
+    global nodes, qnodes, start_time, time_limit, timeout
+    if nodes >= node_limit or time.time() - start_time > time_limit:
         timeout = True
         return 0
 
     nodes += 1
+    qnodes += 1
     stand_pat: int = evaluate_position(position)
     if stand_pat >= beta:
         return stand_pat
 
     if alpha < stand_pat:
         alpha = stand_pat
-    move_list: list[tuple[int, int, str, str]] = generate_moves(position, castling[:], en_passant)
+    move_list: list[int] = generate_moves(position, castling[:], en_passant)
     for move in move_list:
-        if not move[2].islower():  # not a capture
+        if not move & CAPTURE_MASK:  # not a capture
+            continue
+        delta: int = 200  # delta safety margin to account for potential positional compensation
+        promotion_piece: str = DECODED_PROMOTION_PIECES[move >> PROMOTION_SHIFT & 0x7]
+        if stand_pat + ENDGAME_PIECE_VALUES[CAPTURED_PIECES[move >> CAPTURE_SHIFT & 0x7].upper()] + (ENDGAME_PIECE_VALUES[promotion_piece] if promotion_piece else 0) + delta < alpha:  # delta pruning
+            continue
+        if losing_capture(move, position):
             continue
         new_position: tuple[str, list[bool], list[bool], int, int] = make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant)
         new_position = rotate_position(*new_position)
         if king_in_check(new_position[0], castling[:], new_position[4]): # if the move results in our king being in check (illegal move)
             continue
-        delta: int = 200  # delta safety margin to account for potential positional compensation
-        if stand_pat + ENDGAME_PIECE_VALUES[move[2].upper()] + (ENDGAME_PIECE_VALUES[move[3]] if move[3].isupper() else 0) + delta < alpha:  # delta pruning
-            continue
         score = -quiesce(-beta, -alpha, *new_position)
         if timeout:
             return 0
@@ -879,41 +1262,66 @@ def quiesce(alpha: int, beta: int, position: str, castling: list[bool], opponent
     return alpha
 
 
-def nega_max(depth: int, alpha: int, beta: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> tuple[int, tuple[int, int, str, str]]:
+def nega_max(depth: int, alpha: int, beta: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str, halfmove_clock: int) -> tuple[int, int]:
     """Performs a fail-hard negamax search with alpha-beta pruning on the given position, returning the best score and
-    move found after the search."""
-    global max_depth, nodes, start_time, time_limit, timeout
-    if time.time() - start_time > time_limit:
+    move found after the search. Positions below the root that repeat an earlier one or fall under the fifty-move rule
+    are scored as draws."""
+    global max_depth, nodes, start_time, time_limit, timeout, tt_hits, tt_misses, tt_cutoffs
+    if nodes >= node_limit or time.time() - start_time > time_limit:
         timeout = True
-        return 0, (0, 0, "", "")
+        return 0, NULL_MOVE
+
+    if BITBASES is not None and depth < max_depth and position.count(".") == 61:  # three pieces left
+        nodes += 1
+        result, plies = probe_bitbases(position)
+        return result * (CHECKMATE_LOWER - (max_depth - depth) - plies), NULL_MOVE
 
     if depth == 0:
-        return quiesce(alpha, beta, position, castling[:], opponent_castling[:], en_passant, king_passant), (0, 0, "", "")
+        return quiesce(alpha, beta, position, castling[:], opponent_castling[:], en_passant, king_passant), NULL_MOVE
 
     key: int = zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-    table_info: tuple[tuple[int, int, str, str], int, int] | None = TRANSPOSITION_TABLE.get(key)
+    if depth < max_depth and key in KEY_HISTORY[max(0, len(KEY_HISTORY) - halfmove_clock):]:  # only positions since the last capture or pawn move can repeat
+        return 0, NULL_MOVE
+    if depth < max_depth and halfmove_clock >= FIFTY_MOVE_PLIES:  # unless the move that reached it gave checkmate
+        if checkmated(position, castling[:], opponent_castling[:], en_passant, king_passant):
+            return -CHECKMATE_LOWER + max_depth - depth, NULL_MOVE
+        return 0, NULL_MOVE
+
+    # Scores that may depend on the fifty-move rule are kept out of the transposition table since it can't tell them apart
+    near_fifty_moves: bool = halfmove_clock + depth >= FIFTY_MOVE_PLIES
+    table_info: tuple[int, int, int] | None = TRANSPOSITION_TABLE.get(key) if not near_fifty_moves else None
+    if table_info is None and not near_fifty_moves and (LOADED_HASH or SHARED_HASH is not None):
+        table_info = snapshot_entry(key, position, castling[:], en_passant)
+        if table_info is not None:
+            TRANSPOSITION_TABLE[key] = table_info
     if table_info is None:
-        table_info = ((0, 0, "", ""), -1, 0)
+        tt_misses += 1
+        table_info = (NULL_MOVE, -1, 0)
+    else:
+        tt_hits += 1
     if table_info[1] >= depth or table_info[2] >= CHECKMATE_LOWER:  # move is from higher depth or position is checkmate
+        tt_cutoffs += 1
         return table_info[2], table_info[0]
 
     nodes += 1
-    legal_moves: list[tuple[int, int, str, str]] = []  # keep track of legal moves for checkmate and stalemate detection
-    move_list: list[tuple[int, int, str, str]] = generate_moves(position, castling[:], en_passant)
+    legal_moves: list[int] = []  # keep track of legal moves for checkmate and stalemate detection
+    move_list: list[int] = order_captures(generate_moves(position, castling[:], en_passant), position)
     for i in range(len(move_list)):  # basic PV move ordering: transposition table move from lower depth goes first
         if move_list[i] == table_info[0]:
             move_list.insert(0, move_list.pop(i))
             break
-    best_move: tuple[int, int, str, str] = (0, 0, "", "")
+    best_move: int = NULL_MOVE
     for move in move_list:
         new_position: tuple[str, list[bool], list[bool], int, int] = make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant)
         new_position = rotate_position(*new_position)
         if king_in_check(new_position[0], castling[:], new_position[4]):  # if the move results in our king being in check (illegal move)
             continue
         legal_moves.append(move)
-        score: int = -nega_max(depth - 1, -beta, -alpha, *new_position, "w" if color == "b" else "b")[0]
+        KEY_HISTORY.append(key)
+        score: int = -nega_max(depth - 1, -beta, -alpha, *new_position, "w" if color == "b" else "b", 0 if move & CAPTURE_MASK or position[move & SQUARE_MASK] == "P" else halfmove_clock + 1)[0]
+        KEY_HISTORY.pop()
         if timeout:
-            return 0, (0, 0, "", "")
+            return 0, NULL_MOVE
 
         if score >= beta:
             return beta, best_move  # fail-hard beta cutoff
@@ -924,41 +1332,50 @@ def nega_max(depth: int, alpha: int, beta: int, position: str, castling: list[bo
     if len(legal_moves) == 0:  # if there are no legal moves, it's either checkmate or stalemate.
         new_position = rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)
         if king_in_check(new_position[0], castling[:], 0):
-            return -CHECKMATE_LOWER + max_depth - depth, (0, 0, "", "")
+            return -CHECKMATE_LOWER + max_depth - depth, NULL_MOVE
 
         else:
-            return 0, (0, 0, "", "")
+            return 0, NULL_MOVE
 
-    if best_move != (0, 0, "", ""):
-        key: int = zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+    if best_move != NULL_MOVE and not near_fifty_moves:
         TRANSPOSITION_TABLE[key] = (best_move, depth, alpha)
     return alpha, best_move
 
 
-def iteratively_deepen(depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> tuple[int, int, str, str]:
+def iteratively_deepen(depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> int:
     """Wraps the negamax search function in an iterative deepening loop, utilizing the transposition table and PV move
-    ordering to improve search efficiency."""
-    global max_depth, nodes, start_time, timeout
-    weighted_entry: tuple[int, int, str, str]
+    ordering to improve search efficiency. Stops once the time limit has passed or `node_budget` nodes have been
+    searched over all depths, though the first depth is always finished so that there is a move to play."""
+    global max_depth, nodes, node_limit, start_time, timeout, eval_probes, eval_hits, pawn_probes, pawn_hits
+    weighted_entry: int
     _, weighted_entry = book_entries(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-    if weighted_entry != (0, 0, "", ""):
+    if weighted_entry != NULL_MOVE:
         send_response(f"info string weighted bookmove")
         return weighted_entry
 
-    # max_entry: tuple[int, int, str, str]
+    # max_entry: int
     # max_entry, _ = book_entries(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
-    # if max_entry != (0, 0, "", ""):
+    # if max_entry != NULL_MOVE:
     #     send_response(f"info string max bookmove")
     #     return max_entry
 
+    if BITBASES is not None and position.count(".") == 61:
+        return bitbase_move(position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+
+    if BACKEND == "bitboard":
+        return bitboard_search(depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+
+    eval_probes, eval_hits, pawn_probes, pawn_hits = 0, 0, 0, 0
     score: int = 0
-    best_move: tuple[int, int, str, str] = (0, 0, "", "")
-    previous_best_move: tuple[int, int, str, str] = (0, 0, "", "")
+    best_move: int = NULL_MOVE
+    previous_best_move: int = NULL_MOVE
     start_time = time.time()
     timeout = False
+    searched: int = 0  # nodes of the finished depths
     for max_depth in range(1, depth + 1):
         nodes = 0
-        score, best_move = nega_max(max_depth, -CHECKMATE_UPPER, CHECKMATE_UPPER, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+        node_limit = sys.maxsize if max_depth == 1 or node_budget == 0 else node_budget - searched
+        score, best_move = nega_max(max_depth, -CHECKMATE_UPPER, CHECKMATE_UPPER, position, castling[:], opponent_castling[:], en_passant, king_passant, color, halfmove_clock)
         if timeout:
             timeout = False
             best_move = previous_best_move
@@ -969,13 +1386,121 @@ def iteratively_deepen(depth: int, position: str, castling: list[bool], opponent
                 pv_string += algebraic_notation(move, color) + " "
             else:
                 pv_string += algebraic_notation(move, ("b" if color == "w" else "w")) + " "
-        send_response(f"info depth {max_depth} score cp {score * (-1 if color == 'b' else 1)} nodes {nodes} time {int(round(time.time() - start_time, 3) * 1000)} pv {pv_string.rstrip()}")
-        if best_move == (0, 0, "", ""):
+        send_response(f"info depth {max_depth} score cp {score} nodes {nodes} time {int(round(time.time() - start_time, 3) * 1000)} pv {pv_string.rstrip()}")
+        if best_move == NULL_MOVE:
             break
         previous_best_move = best_move
+        searched += nodes
+    node_limit = sys.maxsize
+    send_response(f"info string eval cache hits {eval_hits}/{eval_probes} ({eval_hits / max(eval_probes, 1):.1%}) pawn hash hits {pawn_hits}/{pawn_probes} ({pawn_hits / max(pawn_probes, 1):.1%})")
     return best_move
 
 
+def bitboard_search(depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> int:
+    """Searches the given position with the bitboard backend and converts its best move to our representation."""
+    global nodes, qnodes, tt_hits, tt_misses, tt_cutoffs
+    import bitboards
+    if not bitboards.configured:
+        bitboards.configure(sys.modules[__name__])
+    board: bitboards.Board = bitboards.load_fen(generate_fen(position, castling[:], opponent_castling[:], en_passant, king_passant, color))
+    bitboards.snapshot_probe = probe_snapshots if LOADED_HASH or SHARED_HASH is not None else None
+    bitboards.bitbase_probe = BITBASES.probe if BITBASES is not None else None
+    best_move: int = bitboards.iteratively_deepen(depth, board, time_limit, send_response, KEY_HISTORY, halfmove_clock, node_budget)
+    nodes = bitboards.nodes
+    qnodes += bitboards.qnodes
+    tt_hits += bitboards.tt_hits
+    tt_misses += bitboards.tt_misses
+    tt_cutoffs += bitboards.tt_cutoffs
+    return parse_move(bitboards.move_name(best_move), color) if best_move != bitboards.NULL_MOVE else NULL_MOVE
+
+
+def perft_divide(depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> dict[str, int]:
+    """Counts the leaf nodes of the tree of legal moves after each legal move, with the selected backend."""
+    counts: dict[str, int] = {}
+    if BACKEND == "bitboard":
+        import bitboards
+        if not bitboards.configured:
+            bitboards.configure(sys.modules[__name__])
+        board: bitboards.Board = bitboards.load_fen(generate_fen(position, castling[:], opponent_castling[:], en_passant, king_passant, color))
+        for move, new_board in bitboards.legal_moves(board):
+            counts[bitboards.move_name(move)] = bitboards.perft(depth - 1, new_board)
+        return counts
+
+    for move in generate_moves(position, castling[:], en_passant):
+        new_position: tuple[str, list[bool], list[bool], int, int] = make_move(move, position, castling[:], opponent_castling[:], en_passant, king_passant)
+        new_position = rotate_position(*new_position)
+        if king_in_check(new_position[0], castling[:], new_position[4]):
+            continue
+        counts[algebraic_notation(move, color)] = perft(depth - 1, *new_position)
+    return counts
+
+
+#############
+# PROFILING #
+#############
+
+def profile_search(mode: str, depth: int, position: str, castling: list[bool], opponent_castling: list[bool], en_passant: int, king_passant: int, color: str) -> int:
+    """Runs iteratively_deepen() under a deterministic (cProfile) or sampling profiler, then reports the search
+    counters and the time spent in the hot functions as info strings. Deterministic profiles are written to a pstats
+    file and sampling profiles to a collapsed stack file for flame graphs."""
+    global qnodes, tt_hits, tt_misses, tt_cutoffs
+    import cProfile  # imported here since they are only needed for profiling and slow down engine startup
+    import pstats
+    qnodes = 0
+    tt_hits = 0
+    tt_misses = 0
+    tt_cutoffs = 0
+    profile_start: float = time.perf_counter()
+    if mode == "sampling":
+        samples: Counter[str] = Counter()
+        sampling: threading.Event = threading.Event()
+        sampler: threading.Thread = threading.Thread(target=sample_stacks, args=(threading.get_ident(), samples, sampling), daemon=True)
+        sampler.start()
+        best_move: int = iteratively_deepen(depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+        sampling.set()
+        sampler.join()
+    else:
+        profiler: cProfile.Profile = cProfile.Profile()
+        best_move = profiler.runcall(iteratively_deepen, depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+    elapsed: float = time.perf_counter() - profile_start
+
+    interior_nodes: int = tt_hits + tt_misses - tt_cutoffs  # nega_max() counts a node for every probe that isn't cut off
+    send_response(f"info string profile nodes {interior_nodes + qnodes} qnodes {qnodes} tthits {tt_hits} ttmisses {tt_misses} ttcutoffs {tt_cutoffs} time {int(elapsed * 1000)}")
+    if mode == "sampling":
+        total: int = sum(samples.values())
+        for function in PROFILED_FUNCTIONS:
+            inclusive: int = sum(count for stack, count in samples.items() if function in stack.split(";"))
+            exclusive: int = sum(count for stack, count in samples.items() if stack.rsplit(";", 1)[-1] == function)
+            send_response(f"info string profile {function} samples {inclusive} selftime {int(elapsed * 1000 * exclusive / max(total, 1))} cumtime {int(elapsed * 1000 * inclusive / max(total, 1))}")
+        file_name: str = f"{NAME}.collapsed"
+        with open(file_name, "w") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+    else:
+        statistics: pstats.Stats = pstats.Stats(profiler)
+        for function in PROFILED_FUNCTIONS:
+            for (file_path, _, name), (_, calls, self_time, cumulative_time, _) in statistics.stats.items():  # type: ignore
+                if name == function and file_path == __file__:
+                    send_response(f"info string profile {function} calls {calls} selftime {int(self_time * 1000)} cumtime {int(cumulative_time * 1000)}")
+        file_name = f"{NAME}.pstats"
+        statistics.dump_stats(file_name)
+    send_response(f"info string profile written to {file_name}")
+    return best_move
+
+
+def sample_stacks(thread_id: int, samples: Counter[str], stop: threading.Event) -> None:
+    """Samples the call stack of the searching thread until stopped, counting each stack in collapsed form (functions
+    from outermost to innermost separated by semicolons)."""
+    while not stop.wait(SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        functions: list[str] = []
+        while frame is not None:
+            functions.append(frame.f_code.co_name)
+            frame = frame.f_back
+        if functions:
+            samples[";".join(reversed(functions))] += 1
+
+
 #####################
 # UTILITY FUNCTIONS #
 #####################
@@ -993,15 +1518,26 @@ def render_coordinates(index: int) -> str:
     file: int = (index - A1) % 10
     return chr(ord("a") + file) + str(1 - rank)
 
-def algebraic_notation(move: tuple[int, int, str, str], color: str) -> str:
+def parse_move(move: str, color: str) -> int:
+    """Converts a move in long algebraic notation to the internal representation from the given side's point of view.
+    Only the squares and promotion piece are filled in, which is all make_move() needs."""
+    start_square: int = parse_coordinates(move[:2])
+    end_square: int = parse_coordinates(move[2:4])
+    if color == "b":
+        start_square = 119 - start_square
+        end_square = 119 - end_square
+    return start_square | end_square << END_SHIFT | PROMOTION_CODES[move[4:].upper()]
+
+
+def algebraic_notation(move: int, color: str) -> str:
     """Converts a move from the internal representation to long algebraic notation"""
-    start_square: int = move[0]
-    end_square: int = move[1]
-    promotion_piece: str = move[3]
+    start_square: int = move & SQUARE_MASK
+    end_square: int = move >> END_SHIFT & SQUARE_MASK
+    promotion_piece: str = DECODED_PROMOTION_PIECES[move >> PROMOTION_SHIFT & 0x7]
     if color == "b":
         start_square = 119 - start_square
         end_square = 119 - end_square
-    if move == (0, 0, "", ""):
+    if move == NULL_MOVE:
         return "(none)"
 
     return render_coordinates(start_square) + render_coordinates(end_square) + promotion_piece.lower()
@@ -1101,96 +1637,181 @@ def send_response(response: str) -> None:
 
 def main() -> None:
     """The main UCI loop responsible for parsing commands and sending responses."""
-    global max_depth, nodes, start_time, time_limit, timeout, OPENING_BOOKS
+    global max_depth, nodes, node_budget, node_limit, qnodes, start_time, time_limit, timeout, tt_hits, tt_misses, tt_cutoffs, halfmove_clock, OPENING_BOOK, BOOK_MIX, BACKEND, SHARED_HASH, BITBASES
     position: str = ""
     castling: list[bool] = []
     opponent_castling: list[bool] = []
     en_passant: int = 120
     king_passant: int = 120
     color: str = ""
+    # The arguments of the last "position" command, so that a following one which only adds moves can continue from it
+    game_setup: list[str] = []
+    game_moves: list[str] = []
+
+    book_mix: str = "main"  # books (or families of books) to play from, combined with "+"
+
+    # Hash snapshots, relative to the hash-snapshots directory
+    hash_file: str = ""  # saved and loaded by "SaveHash" and "LoadHash", each process has its own by default
+    shared_hash: str = "shared.tt"  # hash_snapshot.SHARED_NAME, mapped on "isready", empty to not use one
+
+    use_bitbases: bool = True  # mapped on "isready" if bitbases.py has generated them
+
+    # With --profile (or --profile=sampling) every search is profiled, otherwise only those started with "profile"
+    profile_mode: str = ""
+    for argument in sys.argv[1:]:
+        if argument == "--profile":
+            profile_mode = "deterministic"
+        elif argument.startswith("--profile="):
+            profile_mode = argument.partition("=")[2]
 
     initialized: bool = False
 
     while True:
-        command: str = sys.stdin.readline().strip()
+        command: str = sys.stdin.readline()
+        if command == "":  # the GUI closed the pipe (or died) without sending "quit"
+            sys.exit()
         tokens: list[str] = command.split()
         if len(tokens) == 0:
             continue
         if tokens[0] == "uci":
             send_response(f"id name {NAME} {VERSION}")
             send_response(f"id author {AUTHOR}")
+            send_response(f"option name BookMix type string default {book_mix}")
+            send_response(f"option name Backend type combo default {BACKENDS[0]} {' '.join(f'var {backend}' for backend in BACKENDS)}")
+            send_response(f"option name HashFile type string default {hash_file or '<empty>'}")
+            send_response("option name SaveHash type button")
+            send_response("option name LoadHash type button")
+            send_response(f"option name SharedHash type string default {shared_hash or '<empty>'}")
+            send_response("option name EvalTables type string default <empty>")
+            send_response(f"option name Bitbases type check default {str(use_bitbases).lower()}")
             send_response("uciok")
         elif tokens[0] == "quit":
             sys.exit()
         elif tokens[0] == "isready":
             if not initialized:
                 initialized = True
-                # Pad the midgame and endgame tables with zeros to make them 10x12
-                for piece in "PNBRQK":
-                    blank_row: list[int] = [0] * 10
-                    new_midgame_table: list[int] = blank_row + blank_row
-                    new_endgame_table: list[int] = blank_row + blank_row
-                    for row in range(0, 64, 8):
-                        new_midgame_table += [0] + MIDGAME_PIECE_SQUARE_TABLES[piece][row:row + 8] + [0]
-                        new_endgame_table += [0] + ENDGAME_PIECE_SQUARE_TABLES[piece][row:row + 8] + [0]
-                    MIDGAME_PIECE_SQUARE_TABLES[piece] = new_midgame_table + blank_row + blank_row
-                    ENDGAME_PIECE_SQUARE_TABLES[piece] = new_endgame_table + blank_row + blank_row
-                # Load opening book data
-                OPENING_BOOKS = [load_book("main" + str(num)) for num in range(1, 8)]  # possible to load each book individually
+                # Open the merged opening book index
+                OPENING_BOOK = book_index.open_index()
+                BOOK_MIX = OPENING_BOOK.mix(book_mix)  # possible to use any combination of books
                 # Global variable initialization
                 max_depth = 0
                 nodes = 0
+                qnodes = 0
+                tt_hits = 0
+                tt_misses = 0
+                tt_cutoffs = 0
+                halfmove_clock = 0
                 start_time = 0
                 time_limit = 0
+                node_budget = 0  # nodes per search over all depths, 0 for no limit
+                node_limit = sys.maxsize  # nodes left for the depth being searched
                 timeout = False
+            # The shared snapshot is mapped again whenever the merge job has replaced it
+            if shared_hash:
+                import hash_snapshot
+                SHARED_HASH = hash_snapshot.open_snapshot(os.path.join(hash_snapshot.SNAPSHOT_DIRECTORY, shared_hash), f"{NAME} {VERSION}", SHARED_HASH)
+            elif SHARED_HASH is not None:
+                SHARED_HASH.close()
+                SHARED_HASH = None
+            if use_bitbases and BITBASES is None:
+                import bitbases
+                BITBASES = bitbases.open_bitbases()
+            elif not use_bitbases and BITBASES is not None:
+                BITBASES.close()
+                BITBASES = None
             send_response("readyok")
+        elif tokens[0] == "setoption":
+            if len(tokens) >= 5 and tokens[1] == "name" and tokens[2].lower() == "bookmix" and tokens[3] == "value":
+                book_mix = tokens[4]
+                if initialized:
+                    BOOK_MIX = OPENING_BOOK.mix(book_mix)
+            elif len(tokens) >= 5 and tokens[1] == "name" and tokens[2].lower() == "backend" and tokens[3] == "value" and tokens[4].lower() in BACKENDS:
+                BACKEND = tokens[4].lower()
+            elif len(tokens) >= 5 and tokens[1] == "name" and tokens[2].lower() == "bitbases" and tokens[3] == "value":
+                use_bitbases = tokens[4].lower() == "true"  # takes effect on the next "isready"
+            elif len(tokens) >= 4 and tokens[1] == "name" and tokens[2].lower() in ("hashfile", "sharedhash") and tokens[3] == "value":
+                value: str = " ".join(tokens[4:])
+                if value == "<empty>":
+                    value = ""
+                if tokens[2].lower() == "hashfile":
+                    hash_file = value
+                else:
+                    shared_hash = value
+            elif len(tokens) >= 5 and tokens[1] == "name" and tokens[2].lower() == "evaltables" and tokens[3] == "value" and tokens[4] != "<empty>":
+                try:
+                    load_tables(tokens[4])
+                    send_response(f"info string loaded evaluation tables from {tokens[4]}")
+                except (ImportError, AttributeError, KeyError, TypeError, ValueError) as error:
+                    send_response(f"info string {error}")
+            elif len(tokens) >= 3 and tokens[1] == "name" and tokens[2].lower() in ("savehash", "loadhash"):
+                import hash_snapshot
+                path: str = os.path.join(hash_snapshot.SNAPSHOT_DIRECTORY, hash_file or f"{NAME}-{os.getpid()}.tt")
+                try:
+                    if tokens[2].lower() == "savehash":
+                        send_response(f"info string saved {save_hash(path)} hash entries to {path}")
+                    else:
+                        send_response(f"info string loaded {load_hash(path)} hash entries from {path}")
+                except (OSError, ValueError) as error:
+                    send_response(f"info string {error}")
+        elif tokens[0] == "ucinewgame":
+            # Engines are reused for many games (app.py keeps a pool of them), so the tables of the last one are dropped
+            TRANSPOSITION_TABLE.clear()
+            if "bitboards" in sys.modules:
+                sys.modules["bitboards"].TRANSPOSITION_TABLE.clear()
+            KEY_HISTORY.clear()
+            game_setup = []
+            game_moves = []
         elif not initialized:
             continue  # ignore most commands until the engine is properly initialized with "isready"
         elif tokens[0] == "position":
-            if len(tokens) >= 2 and tokens[1] == "startpos":
-                position = INITIAL_POSITION
-                castling = INITIAL_CASTLING[:]
-                opponent_castling = INITIAL_OPPONENT_CASTLING[:]
-                en_passant = INITIAL_EN_PASSANT
-                king_passant = INITIAL_KING_PASSANT
-                color = INITIAL_COLOR
-            elif len(tokens) >= 8 and tokens[1] == "fen":
-                fen: str = " ".join(tokens[2:8])
-                position, castling, opponent_castling, en_passant, king_passant, color = load_fen(fen)
-            if "moves" in tokens:
-                moves_index: int = tokens.index("moves") + 1
-                if moves_index < 3:
+            moves_index: int = tokens.index("moves") if "moves" in tokens else len(tokens)
+            setup: list[str] = tokens[1:moves_index]
+            moves: list[str] = tokens[moves_index + 1:]
+            # GUIs resend the whole game before every search, so only replay it when it doesn't continue the last position
+            if setup != game_setup or moves[:len(game_moves)] != game_moves:
+                if setup == ["startpos"]:
+                    position = INITIAL_POSITION
+                    castling = INITIAL_CASTLING[:]
+                    opponent_castling = INITIAL_OPPONENT_CASTLING[:]
+                    en_passant = INITIAL_EN_PASSANT
+                    king_passant = INITIAL_KING_PASSANT
+                    color = INITIAL_COLOR
+                    halfmove_clock = 0
+                elif len(setup) >= 7 and setup[0] == "fen":
+                    fen: str = " ".join(setup[1:7])
+                    position, castling, opponent_castling, en_passant, king_passant, color = load_fen(fen)
+                    halfmove_clock = int(setup[5]) if setup[5].isdigit() else 0
+                else:
                     continue
-                moves: list[str] = tokens[moves_index:]
-                ply: int = 0
-                for ply, move in enumerate(moves):  # note that we don't actually check if the moves are legal
-                    if move[1].isdigit() and move[3].isdigit():  # make sure the move is in long algebraic notation
-                        start_square: int = parse_coordinates(move[:2])
-                        end_square: int = parse_coordinates(move[2:4])
-                        promotion_piece: str = move[4:].upper()
-                        if color == "b":  # if black to move, flip the coordinates
-                            start_square = 119 - start_square
-                            end_square = 119 - end_square
-                        if ply % 2 == 1:  # opponent's move so we flip the coordinates, then rotate the board before and after making the move
-                            start_square = 119 - start_square
-                            end_square = 119 - end_square
-                            position, castling, opponent_castling, en_passant, king_passant = rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)
-                            position, castling, opponent_castling, en_passant, king_passant = make_move((start_square, end_square, ".", promotion_piece), position, castling[:], opponent_castling[:], en_passant, king_passant)
-                            position, castling, opponent_castling, en_passant, king_passant = rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)
-                        else:  # our move so we just make it
-                            position, castling, opponent_castling, en_passant, king_passant = make_move((start_square, end_square, ".", promotion_piece), position, castling[:], opponent_castling[:], en_passant, king_passant)
-                if ply % 2 == 0:  # rotate the board after the last move was made and switch the color
+                KEY_HISTORY.clear()
+                game_setup = setup
+                game_moves = []
+            for move in moves[len(game_moves):]:  # note that we don't actually check if the moves are legal
+                if len(move) >= 4 and move[1].isdigit() and move[3].isdigit():  # make sure the move is in long algebraic notation
+                    # The position is always from the side to move's point of view, so make the move then rotate the board for the opponent
+                    move_code: int = parse_move(move, color)
+                    KEY_HISTORY.append(zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color))
+                    halfmove_clock = 0 if position[move_code & SQUARE_MASK] == "P" or position[move_code >> END_SHIFT & SQUARE_MASK] != "." else halfmove_clock + 1
+                    position, castling, opponent_castling, en_passant, king_passant = make_move(move_code, position, castling[:], opponent_castling[:], en_passant, king_passant)
                     position, castling, opponent_castling, en_passant, king_passant = rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)
-                    if color == "w":
-                        color = "b"
-                    elif color == "b":
-                        color = "w"
-            king_passant = 0
-        elif tokens[0] == "go":
+                    color = "b" if color == "w" else "w"
+                    king_passant = 0
+                game_moves.append(move)
+        elif tokens[0] == "go" or tokens[0] == "profile":  # "profile [deterministic|sampling]" takes the same parameters as "go"
+            mode: str = profile_mode
+            if tokens[0] == "profile":
+                mode = tokens[1] if len(tokens) >= 2 and tokens[1] in PROFILE_MODES else PROFILE_MODES[0]
             if len(position) != 120 or len(castling) != 2 or len(opponent_castling) != 2 or not 0 <= en_passant <= 119 or not 0 <= king_passant <= 119 or color not in ("w", "b"):  # invalid position
                 continue
-            depth: int = 5
+            # Without any limit the search stops at depth 5, otherwise only at the given limits
+            depth: int = MAX_DEPTH if any(limit in tokens for limit in ("movetime", "nodes", "wtime", "btime", "winc", "binc")) else 5
             time_limit = 10  # all times are in seconds
+            node_budget = 0
+            if "nodes" in tokens:
+                nodes_index: int = tokens.index("nodes") + 1
+                if tokens[nodes_index].isdigit():
+                    node_budget = int(tokens[nodes_index])
+                    time_limit = math.inf  # the same work on every machine however long it takes, unless a time limit follows
             if "movetime" in tokens:
                 movetime_index: int = tokens.index("movetime") + 1
                 if tokens[movetime_index].isdigit():
@@ -1228,8 +1849,20 @@ def main() -> None:
                 else:
                     time_limit = white_time / 40 + white_increment
             # Technically, we have to be able to recieve the `stop` command at any time but we'd need concurrency to do so
-            best_move: tuple[int, int, str, str] = iteratively_deepen(depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+            if mode in PROFILE_MODES:
+                best_move: int = profile_search(mode, depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+            else:
+                best_move = iteratively_deepen(depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
             send_response(f"bestmove {algebraic_notation(best_move, color)}")
+        elif tokens[0] == "perft":  # "perft <depth>" counts the leaf nodes after each legal move with the selected backend
+            depth = int(tokens[1]) if len(tokens) >= 2 and tokens[1].isdigit() and int(tokens[1]) > 0 else 1
+            perft_start: float = time.perf_counter()
+            counts: dict[str, int] = perft_divide(depth, position, castling[:], opponent_castling[:], en_passant, king_passant, color)
+            elapsed: float = time.perf_counter() - perft_start
+            for move, count in counts.items():
+                send_response(f"{move}: {count}")
+            send_response(f"Nodes searched: {sum(counts.values())}")
+            send_response(f"info string perft backend {BACKEND} depth {depth} time {int(elapsed * 1000)} nps {int(sum(counts.values()) / max(elapsed, 1e-6))}")
         elif tokens[0] == "eval":
             score: float = evaluate_position(position) / 100
             if color == "b":
@@ -1245,6 +1878,7 @@ def main() -> None:
             send_response(f"FEN: {generate_fen(position, castling[:], opponent_castling[:], en_passant, king_passant, color)}")
             send_response(f"HASH: {hex(zobrist_hash(position, castling[:], opponent_castling[:], en_passant, king_passant, color)).upper()}")
         elif tokens[0] == "flip":
+            game_setup = []  # the position no longer follows from the last "position" command
             position, castling, opponent_castling, en_passant, king_passant = rotate_position(position, castling[:], opponent_castling[:], en_passant, king_passant)
             if color == "w":
                 color = "b"
@@ -0,0 +1,177 @@
+"""A deterministic stand-in for a UCI engine, used to load test app.py without the cost and noise of a real search. It
+thinks for a fixed time, picks its move by a fixed rule and can be told to fail now and then, all through UCI options
+whose defaults come from the environment so that the engines app.py starts can be configured too:
+
+    WEBCHESS_STUB_THINK_TIME    milliseconds to think per move, at most the `go` command's own limit (default 50),
+                                where "go nodes" counts as the time it takes to search them at NODES_PER_SECOND
+    WEBCHESS_STUB_MOVE_CHOICE   "first", "last" or "random" legal move, random moves depend only on the seed and the
+                                position (default "random")
+    WEBCHESS_STUB_FAILURE_RATE  share of searches that fail, from 0 to 1 (default 0), drawn anew by every search and
+                                process so that a search retried on a new process can succeed
+    WEBCHESS_STUB_FAILURE       how they fail: "crash" (exit without answering), "hang" (never answer unless stopped)
+                                or "illegal" (answer with an illegal move) (default "crash")
+    WEBCHESS_STUB_SEED          seed of the move choice and the failures (default 0)
+
+Uses python-chess for move generation, so unlike simPLY_chess it has to be started with site packages (e.g.
+`python -E -m stub_engine` from the `engines` directory)."""
+
+import os
+import random
+import sys
+import threading
+from time import perf_counter
+
+import chess
+
+NAME: str = "WebChess stub"
+AUTHOR: str = "andrewharabor"
+
+MOVE_CHOICES: tuple[str, ...] = ("first", "last", "random")
+FAILURES: tuple[str, ...] = ("crash", "hang", "illegal")
+NODES_PER_SECOND: int = 1000000  # reported with the principal variation so that app.py's metrics have something to record
+
+output_lock: threading.Lock = threading.Lock()
+
+
+class Options:
+    """The engine's settings, read from the environment and changed with "setoption"."""
+
+    def __init__(self) -> None:
+        self.think_time: int = int(os.environ.get("WEBCHESS_STUB_THINK_TIME", "50"))
+        self.move_choice: str = os.environ.get("WEBCHESS_STUB_MOVE_CHOICE", "random")
+        self.failure_rate: float = float(os.environ.get("WEBCHESS_STUB_FAILURE_RATE", "0"))
+        self.failure: str = os.environ.get("WEBCHESS_STUB_FAILURE", "crash")
+        self.seed: int = int(os.environ.get("WEBCHESS_STUB_SEED", "0"))
+
+    def send(self) -> None:
+        send_response(f"option name ThinkTime type spin default {self.think_time} min 0 max 3600000")
+        send_response(f"option name MoveChoice type combo default {self.move_choice} {' '.join(f'var {choice}' for choice in MOVE_CHOICES)}")
+        send_response(f"option name FailureRate type string default {self.failure_rate}")
+        send_response(f"option name Failure type combo default {self.failure} {' '.join(f'var {failure}' for failure in FAILURES)}")
+        send_response(f"option name Seed type spin default {self.seed} min 0 max 2147483647")
+
+    def set(self, name: str, value: str) -> None:
+        try:
+            if name == "thinktime":
+                self.think_time = int(value)
+            elif name == "movechoice" and value in MOVE_CHOICES:
+                self.move_choice = value
+            elif name == "failurerate":
+                self.failure_rate = float(value)
+            elif name == "failure" and value in FAILURES:
+                self.failure = value
+            elif name == "seed":
+                self.seed = int(value)
+        except ValueError:
+            pass
+
+
+def send_response(response: str) -> None:
+    """Sends the given response to the stdout, flushing the buffer. Searches answer from their own thread."""
+    with output_lock:
+        sys.stdout.write(response + "\n")
+        sys.stdout.flush()
+
+
+def parse_position(tokens: list[str]) -> chess.Board | None:
+    """Returns the board described by a "position" command, or None if it isn't valid."""
+    moves_index: int = tokens.index("moves") if "moves" in tokens else len(tokens)
+    try:
+        if tokens[1:2] == ["startpos"]:
+            board: chess.Board = chess.Board()
+        elif tokens[1:2] == ["fen"]:
+            board = chess.Board(" ".join(tokens[2:moves_index]))
+        else:
+            return None
+        for move in tokens[moves_index + 1:]:
+            board.push_uci(move)
+    except ValueError:
+        return None
+    return board
+
+
+def think_time(tokens: list[str], board: chess.Board, options: Options) -> float | None:
+    """Returns the seconds to think for the given "go" command, or None to think until told to stop."""
+    limits: dict[str, int] = {}
+    for name, value in zip(tokens, tokens[1:]):
+        if name in ("movetime", "nodes", "wtime", "btime", "winc", "binc") and value.isdigit():
+            limits[name] = int(value)
+    if "infinite" in tokens or "ponder" in tokens:
+        return None
+    limit: int = options.think_time
+    if "movetime" in limits:
+        limit = min(limit, limits["movetime"])
+    if "nodes" in limits:
+        limit = min(limit, limits["nodes"] * 1000 // NODES_PER_SECOND)
+    clock: str = "wtime" if board.turn == chess.WHITE else "btime"
+    if clock in limits:
+        limit = min(limit, limits[clock] // 20)
+    return limit / 1000
+
+
+def search(board: chess.Board, seconds: float | None, options: Options, stop: threading.Event, number: int) -> None:
+    """Thinks for the given time (or until stopped) and sends the chosen move, unless this search (the process's
+    `number`th) is one of those meant to fail."""
+    start: float = perf_counter()
+    rng: random.Random = random.Random(f"{options.seed} {board.fen()}")  # the same position always gets the same answer
+    moves: list[chess.Move] = sorted(board.legal_moves, key=lambda move: move.uci())
+    failures: random.Random = random.Random(f"{options.seed} {os.getpid()} {number}")  # but not the same failures
+    failure: str | None = options.failure if failures.random() < options.failure_rate else None
+    move: chess.Move | None = None
+    if len(moves) > 0:
+        move = moves[0] if options.move_choice == "first" else moves[-1] if options.move_choice == "last" else rng.choice(moves)
+        send_response(f"info depth 1 score cp 0 nodes 1 nps {NODES_PER_SECOND} time 0 pv {move.uci()}")
+
+    stop.wait(seconds)
+    if failure == "crash":
+        os._exit(1)
+    elif failure == "hang":
+        stop.wait()
+        return
+    elapsed: int = int((perf_counter() - start) * 1000)
+    send_response(f"info depth 1 score cp 0 nodes {max(1, elapsed * NODES_PER_SECOND // 1000)} nps {NODES_PER_SECOND} time {elapsed}")
+    if failure == "illegal":
+        send_response("bestmove a1a1")
+    else:
+        send_response(f"bestmove {move.uci() if move is not None else '(none)'}")
+
+
+def main() -> None:
+    """The UCI loop. Searches run in a thread so that "stop" and "isready" are answered while thinking."""
+    options: Options = Options()
+    board: chess.Board = chess.Board()
+    searching: threading.Thread | None = None
+    searches: int = 0
+    stop: threading.Event = threading.Event()
+
+    for line in sys.stdin:
+        tokens: list[str] = line.split()
+        if len(tokens) == 0:
+            continue
+        if tokens[0] == "uci":
+            send_response(f"id name {NAME}")
+            send_response(f"id author {AUTHOR}")
+            options.send()
+            send_response("uciok")
+        elif tokens[0] == "isready":
+            send_response("readyok")
+        elif tokens[0] == "setoption" and len(tokens) >= 5 and tokens[1] == "name" and tokens[3] == "value":
+            options.set(tokens[2].lower(), tokens[4])
+        elif tokens[0] == "position":
+            board = parse_position(tokens) or board
+        elif tokens[0] == "go":
+            if searching is not None:
+                searching.join()
+            stop = threading.Event()
+            searches += 1
+            searching = threading.Thread(target=search, args=(board.copy(), think_time(tokens, board, options), options, stop, searches), daemon=True)
+            searching.start()
+        elif tokens[0] == "stop":
+            stop.set()
+        elif tokens[0] == "quit":
+            break
+    stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Keeps the games nobody is playing at the moment on disk, so that they cost neither memory nor an engine process. A
+hibernated game is a small header with the game's settings followed by two bytes per move, written atomically to a
+file named by the game's id. Only uses the standard library, like book_index.py and hash_snapshot.py."""
+
+import json
+import os
+import re
+import struct
+import time
+
+from chess import Move
+
+GAMES_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games")
+
+MAGIC: bytes = b"WCGM"
+VERSION: int = 1
+HEADER_STRUCT: struct.Struct = struct.Struct(">4sHH")  # magic, version, length of the settings (JSON) that follow
+MOVE_STRUCT: struct.Struct = struct.Struct(">H")  # from_square | to_square << 6 | promotion << 12 (piece type, 0 for none)
+GAME_ID: re.Pattern = re.compile(r"[A-Za-z0-9_-]{1,64}")  # ids are used as file names, so nothing else is accepted
+
+
+def encode_move(move: Move) -> int:
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code: int) -> Move:
+    return Move(code & 0x3f, code >> 6 & 0x3f, code >> 12 or None)
+
+
+class GameStore:
+    """A directory of hibernated games."""
+
+    def __init__(self, directory: str = GAMES_DIRECTORY) -> None:
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return sum(name.endswith(".game") for name in os.listdir(self.directory))
+
+    def path(self, game_id: str) -> str:
+        if not GAME_ID.fullmatch(game_id):
+            raise ValueError(f"invalid game id {game_id!r}")
+        return os.path.join(self.directory, f"{game_id}.game")
+
+    def save(self, game_id: str, settings: dict, moves: list[Move]) -> int:
+        """Hibernates a game, replacing any earlier copy, and returns the size of its file."""
+        encoded_settings: bytes = json.dumps(settings, separators=(",", ":")).encode()
+        data: bytearray = bytearray(HEADER_STRUCT.pack(MAGIC, VERSION, len(encoded_settings)))
+        data += encoded_settings
+        for move in moves:
+            data += MOVE_STRUCT.pack(encode_move(move))
+
+        path: str = self.path(game_id)
+        temporary: str = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        return len(data)
+
+    def load(self, game_id: str) -> tuple[dict, list[Move]] | None:
+        """Returns the settings and moves of a hibernated game, or None if there is no such game (or it can't be read)."""
+        try:
+            with open(self.path(game_id), "rb") as file:
+                data: bytes = file.read()
+            magic, version, settings_length = HEADER_STRUCT.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION or (len(data) - HEADER_STRUCT.size - settings_length) % MOVE_STRUCT.size != 0:
+                return None
+            settings: dict = json.loads(data[HEADER_STRUCT.size:HEADER_STRUCT.size + settings_length])
+        except (OSError, ValueError, struct.error):
+            return None
+        moves: list[Move] = [decode_move(code) for code, in MOVE_STRUCT.iter_unpack(memoryview(data)[HEADER_STRUCT.size + settings_length:])]
+        return settings, moves
+
+    def remove(self, game_id: str) -> None:
+        try:
+            os.remove(self.path(game_id))
+        except (OSError, ValueError):
+            pass
+
+    def expire(self, max_age: float) -> int:
+        """Removes the games that haven't been played for `max_age` seconds and returns how many there were."""
+        removed: int = 0
+        oldest: float = time.time() - max_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith((".game", ".tmp")) and entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+                    removed += entry.name.endswith(".game")
+            except OSError:  # removed in the meantime
+                continue
+        return removed
@@ -0,0 +1,148 @@
+"""An in-process publish/subscribe hub for watching games live. Each game publishes to its own channel, and every event
+is encoded as a server-sent event once and kept in a short ring buffer that all of the channel's spectators read from
+with their own cursor, so a spectator costs a waiting thread and one write per batch of events rather than any work per
+event. A spectator joins with a snapshot of the game followed by the events since, only the latest of several pending
+thinking updates is sent, and spectators that fall further behind than the ring buffer reaches get a new snapshot
+instead of the events they missed."""
+
+import json
+import threading
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from metrics import Counter, Gauge
+
+HISTORY: int = 64  # events kept per channel for spectators that are behind
+KEEPALIVE_INTERVAL: float = 15  # seconds between comments sent to idle spectators, which also notices those who left
+
+
+def encode_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class Channel:
+    """The events of one game. `snapshot` returns a description of the whole game so far, it is only called when a
+    spectator joins after the game changed (see `update()`), so that games nobody watches don't pay for it."""
+
+    def __init__(self, hub: "Hub", channel_id: str, snapshot: Callable[[], dict]) -> None:
+        self.hub: Hub = hub
+        self.id: str = channel_id
+        self.condition: threading.Condition = threading.Condition()
+        self.events: deque[tuple[int, str, bytes]] = deque(maxlen=HISTORY)  # (sequence number, event, encoded event)
+        self.sequence: int = 0
+        self.snapshot: Callable[[], dict] = snapshot
+        self.encoded_snapshot: bytes | None = None  # encoded when a spectator joins, until the game changes
+        self.thinking: bytes | None = None  # the latest thinking since the last move, sent to spectators joining mid-search
+        self.subscribers: int = 0
+        self.live: bool = True  # a game in memory publishes to it
+        self.closed: bool = False  # the game is over for good
+
+    @contextmanager
+    def update(self) -> Iterator[None]:
+        """Changes to the game are made in this `with` block, so that spectators don't join halfway through them."""
+        with self.condition:
+            yield
+            self.encoded_snapshot = None
+            self.thinking = None
+
+    def publish(self, event: str, data: dict) -> None:
+        """Sends an event to every spectator. Events that change the game follow its `update()`, so a spectator who
+        joins in between gets the change in the snapshot as well, spectators skip moves they already have by their ply."""
+        with self.condition:
+            if self.subscribers == 0:  # nobody to send it to, those who join later get a snapshot
+                return
+            encoded: bytes = encode_event(event, data)
+            if event == "info":
+                self.thinking = encoded
+            self.sequence += 1
+            self.events.append((self.sequence, event, encoded))
+            self.condition.notify_all()
+        self.hub.published.inc(event=event)
+
+    def close(self) -> None:
+        """Ends every spectator's stream, the game won't be played any further."""
+        with self.condition:
+            self.closed = True
+            self.live = False
+            self.condition.notify_all()
+
+    def catch_up(self) -> bytes:
+        # Must be called while holding the condition
+        if self.encoded_snapshot is None:
+            self.encoded_snapshot = encode_event("snapshot", self.snapshot())
+        return self.encoded_snapshot + (self.thinking or b"")
+
+    def stream(self) -> Iterator[bytes]:
+        """The events of one spectator, starting with a snapshot of the game."""
+        with self.condition:
+            self.subscribers += 1
+            cursor: int = self.sequence
+            joined: bytes = self.catch_up()
+        self.hub.spectators.inc(event="joined")
+        try:
+            yield joined
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.sequence > cursor or self.closed, KEEPALIVE_INTERVAL)
+                    if self.sequence > cursor and len(self.events) > 0 and self.events[0][0] > cursor + 1:
+                        # Fell behind further than the ring buffer reaches: start over from the current snapshot
+                        batch: list[bytes] = [self.catch_up()]
+                        self.hub.spectators.inc(event="resynced")
+                    else:
+                        pending: list[tuple[int, str, bytes]] = [entry for entry in self.events if entry[0] > cursor]
+                        # Thinking updates are superseded by any later event, so only the last pending one is sent
+                        batch = [encoded for i, (_, event, encoded) in enumerate(pending) if event != "info" or i == len(pending) - 1]
+                    cursor = self.sequence
+                    closed: bool = self.closed
+                if closed and len(batch) == 0:
+                    yield encode_event("end", {})
+                    return
+                yield b"".join(batch) if len(batch) > 0 else b": keepalive\n\n"
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+            self.hub.discard(self)
+
+
+class Hub:
+    """The channels of every game that is being played or watched."""
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.channels: dict[str, Channel] = {}
+        self.published = Counter("webchess_spectator_events_total", "Events published to spectators, each sent to all of a game's spectators at once.", ("event",))
+        self.spectators = Counter("webchess_spectator_streams_total", "Spectators that joined, and those that fell behind and were sent a new snapshot.", ("event",))
+        Gauge("webchess_spectators", "Spectators currently watching a game.", function=self.count)
+
+    def open(self, channel_id: str, snapshot: Callable[[], dict]) -> Channel:
+        """Returns the channel of a game that is (again) in memory, keeping the spectators that waited for it."""
+        with self.lock:
+            channel: Channel | None = self.channels.get(channel_id)
+            if channel is None or channel.closed:
+                channel = self.channels[channel_id] = Channel(self, channel_id, snapshot)
+        with channel.condition:
+            channel.live = True
+            channel.snapshot = snapshot
+            channel.encoded_snapshot = None
+        return channel
+
+    def get(self, channel_id: str) -> Channel | None:
+        with self.lock:
+            return self.channels.get(channel_id)
+
+    def detach(self, channel: Channel) -> None:
+        """Marks the channel's game as no longer in memory, the channel is kept while it has spectators."""
+        with channel.condition:
+            channel.live = False
+        self.discard(channel)
+
+    def discard(self, channel: Channel) -> None:
+        with self.lock, channel.condition:
+            if not channel.live and channel.subscribers == 0 and self.channels.get(channel.id) is channel:
+                del self.channels[channel.id]
+
+    def count(self) -> int:
+        with self.lock:
+            channels: list[Channel] = list(self.channels.values())
+        return sum(channel.subscribers for channel in channels)
@@ -0,0 +1,121 @@
+"""Packs the twelve piece images of each theme in `static/images` into a single SVG sprite sheet, so that a board needs
+one request for its pieces instead of twelve. Every piece has a `<view>` in the sheet, which makes `sheet.svg#wK` show
+just the white king wherever an image URL is expected (such as chessboard.js's `pieceTheme`). PNG and SVG pieces alike
+are embedded as data URIs, since an SVG shown as an image may not load other files. Sheets are named by a hash of
+their content so that browsers can cache them forever, and are written along with gzip and (if the `brotli` package is
+installed) brotli compressed copies for the server to send as they are. Run directly to (re)build the sheets."""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import struct
+import urllib.parse
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+STATIC_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+IMAGES_DIRECTORY: str = os.path.join(STATIC_DIRECTORY, "images")
+SPRITES_DIRECTORY: str = os.path.join(STATIC_DIRECTORY, "sprites")
+MANIFEST_PATH: str = os.path.join(SPRITES_DIRECTORY, "manifest.json")
+
+PIECES: tuple[str, ...] = ("wK", "wQ", "wR", "wB", "wN", "wp", "bK", "bQ", "bR", "bB", "bN", "bp")  # as named by script.js
+SVG_CELL_SIZE: int = 100  # SVG pieces scale to any size, PNG pieces keep their own
+COMPRESSED_VARIANTS: dict[str, str] = {"gzip": ".gz", "br": ".br"}  # content encoding -> file extension
+
+
+def png_size(data: bytes) -> tuple[int, int]:
+    """Returns the width and height of a PNG image from its header."""
+    return struct.unpack(">II", data[16:24])
+
+
+def theme_pieces(directory: str) -> dict[str, str] | None:
+    """Returns the image of each piece in a theme's directory, or None if the theme is missing any."""
+    if not os.path.isdir(directory):
+        return None
+    images: dict[str, str] = {}
+    for name in os.listdir(directory):
+        piece, extension = os.path.splitext(name)
+        if piece in PIECES and extension in (".png", ".svg"):
+            images[piece] = os.path.join(directory, name)
+    return images if len(images) == len(PIECES) else None
+
+
+def build_sheet(images: dict[str, str]) -> bytes:
+    """Lays the pieces out in a row and returns the SVG sprite sheet."""
+    cells: list[tuple[str, str, int]] = []  # piece, data URI, cell size
+    for piece in PIECES:
+        with open(images[piece], "rb") as file:
+            data: bytes = file.read()
+        if images[piece].endswith(".png"):
+            cells.append((piece, "data:image/png;base64," + base64.b64encode(data).decode(), png_size(data)[0]))
+        else:
+            cells.append((piece, "data:image/svg+xml," + urllib.parse.quote(data.decode().strip(), safe="/:=;,.()-"), SVG_CELL_SIZE))
+    size: int = max(cell[2] for cell in cells)
+    parts: list[str] = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{size * len(cells)}" height="{size}" viewBox="0 0 {size * len(cells)} {size}">']
+    for i, (piece, uri, _) in enumerate(cells):
+        parts.append(f'<view id="{piece}" viewBox="{i * size} 0 {size} {size}"/>')
+        parts.append(f'<image x="{i * size}" y="0" width="{size}" height="{size}" href="{uri}"/>')
+    parts.append("</svg>")
+    return "\n".join(parts).encode()
+
+
+def build_sprites(images_directory: str = IMAGES_DIRECTORY, output: str = SPRITES_DIRECTORY) -> dict[str, str]:
+    """Builds the sprite sheet of every theme and its compressed copies, removes the sheets of earlier builds and
+    returns the manifest, which maps each theme to its sheet's file name."""
+    os.makedirs(output, exist_ok=True)
+    manifest: dict[str, str] = {}
+    for theme in sorted(os.listdir(images_directory)):
+        images: dict[str, str] | None = theme_pieces(os.path.join(images_directory, theme))
+        if images is None:
+            continue
+        sheet: bytes = build_sheet(images)
+        name: str = f"{theme}.{hashlib.sha256(sheet).hexdigest()[:12]}.svg"
+        manifest[theme] = name
+        path: str = os.path.join(output, name)
+        if os.path.exists(path):  # unchanged since the last build
+            continue
+        variants: dict[str, bytes] = {"": sheet, ".gz": gzip.compress(sheet, 9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(sheet)
+        for extension, data in variants.items():
+            with open(path + extension, "wb") as file:
+                file.write(data)
+
+    current: set[str] = {name + extension for name in manifest.values() for extension in ("", *COMPRESSED_VARIANTS.values())}
+    for name in os.listdir(output):
+        if name != os.path.basename(MANIFEST_PATH) and name not in current:
+            os.remove(os.path.join(output, name))
+    temporary: str = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary, MANIFEST_PATH)
+    return manifest
+
+
+def load_manifest(images_directory: str = IMAGES_DIRECTORY) -> dict[str, str]:
+    """Returns the manifest of the sprite sheets, (re)building them first if they are missing or older than one of the
+    piece images."""
+    if os.path.exists(MANIFEST_PATH):
+        built: float = os.path.getmtime(MANIFEST_PATH)
+        if all(
+            os.path.getmtime(os.path.join(root, name)) <= built and os.path.getmtime(root) <= built
+            for root, _, names in os.walk(images_directory) for name in names
+        ):
+            with open(MANIFEST_PATH) as file:
+                return json.load(file)
+    return build_sprites(images_directory)
+
+
+def main() -> None:
+    manifest: dict[str, str] = build_sprites()
+    sizes: list[int] = [os.path.getsize(os.path.join(SPRITES_DIRECTORY, name)) for name in manifest.values()]
+    print(f"{len(manifest)} sprite sheets ({sum(sizes) // 1024} KiB) written to {SPRITES_DIRECTORY}" + ("" if brotli is not None else ", without brotli copies since brotli isn't installed"))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,9 @@ const LICHESS_THEMES = ["california", "cardinal", "cburnett", "celtic", "chess7"
     "leipzig", "libra", "maestro", "merida", "mpchess", "pirouetti", "pixel", "riohacha",
     "spatial", "staunty", "tatiana"];
 
-const IMAGES_PATH = "static/images";
+const IMAGES_PATH = "/static/images";
 var chosenTheme = "neo";
+var spriteSheet = "";
 
 var config;
 var board;
@@ -22,8 +23,9 @@ var game;
 var lightSquareGray = '#a9a9a9'
 var darkSquareGray = '#696969'
 
-function initialize(position, orientation, theme) {
+function initialize(position, orientation, theme, sprite) {
     chosenTheme = theme;
+    spriteSheet = sprite;
 
     config = {
         draggable: true,
@@ -46,6 +48,67 @@ function initialize(position, orientation, theme) {
     return;
 }
 
+function watch(watchId, theme, sprite) {
+    chosenTheme = theme;
+    spriteSheet = sprite;
+
+    config = {
+        draggable: false,
+        pieceTheme: pieceTheme,
+        position: "start",
+        showErrors: "alert",
+    };
+
+    board = Chessboard("board", config);
+    game = new Chess();
+
+    // The stream starts with a snapshot of the game and goes on with its moves and the engine's thinking. EventSource
+    // reconnects by itself after an error, and every connection starts with a new snapshot
+    const events = new EventSource("/watch/" + watchId + "/events");
+    events.addEventListener("snapshot", (event) => {
+        const data = JSON.parse(event.data);
+        game = new Chess();
+        for (const san of data.moves) {
+            game.move(san);
+        }
+        document.getElementById("white-name").innerHTML = data.white;
+        document.getElementById("black-name").innerHTML = data.black;
+        displayThinking(null);
+        watchedMove(data.result !== "*");
+    });
+    events.addEventListener("move", (event) => {
+        const data = JSON.parse(event.data);
+        if (data.ply === game.history().length + 1) {
+            game.move(data.move);
+        } else if (data.ply > game.history().length) {  // missed a move, which a new snapshot makes up for
+            events.close();
+            watch(watchId, theme, sprite);
+            return;
+        }  // otherwise the move was already part of the snapshot
+        displayThinking(null);
+        watchedMove(false);
+    });
+    events.addEventListener("info", (event) => {
+        displayThinking(JSON.parse(event.data));
+    });
+    events.addEventListener("end", () => {
+        events.close();
+        watchedMove(true);
+    });
+
+    return;
+}
+
+function watchedMove(over) {
+    board.position(game.fen());
+    document.getElementById("pgn").innerHTML = game.pgn() || "1.";
+    if (over || game.game_over()) {
+        document.getElementById("status").innerHTML = "Game Over";
+    }
+
+    return;
+}
+
 function onDragStart(source, piece, position, orientation) {
     if (game.game_over() || !orientation.startsWith(game.turn()) || !piece.startsWith(orientation[0])) {
         return false;
@@ -106,6 +169,11 @@ function pieceTheme(piece) {
         piece = piece[0] + piece[1].toUpperCase();
     }
 
+    // Every piece of the theme is in one sprite sheet, showing the piece's view of it
+    if (spriteSheet) {
+        return spriteSheet + "#" + piece;
+    }
+
     return IMAGES_PATH + "/" + chosenTheme + "/" + piece + format;
 }
 
@@ -132,35 +200,123 @@ async function serverTurn(san_move) {
     const rawResponse = await fetch("/move", {
         method: "POST",
         headers: {
-            "Accept": "application/json",
+            "Accept": "text/event-stream, application/json;q=0.9",
             "Content-Type": "application/json"
         },
         body: JSON.stringify({ "move": san_move })
     });
 
     if (rawResponse.status >= 500) {
-        displayError("Server unavailable, try again later");
-        game.undo();
+        const data = await rawResponse.json().catch(() => null);
+        if (data !== null && data.error_code === "engine_failure") {
+            displayError(data.error_msg);
+            game.load(data.fen);
+        } else {
+            displayError("Server unavailable, try again later");
+            game.undo();
+        }
     } else if (rawResponse.status >= 400) {
         const data = await rawResponse.json();
         if (data.error_code === "invalid_move") {
             game.load(data.fen);
             displayError(data.error_msg);
+        } else if (data.error_code === "no_game") {
+            displayError(data.error_msg);
+            game.undo();
         } else {
             displayError("Incompatible client, refresh the page");
         }
-    } else {
-        const data = await rawResponse.json();
-        game.move(data.move);
-        document.getElementById("pgn").innerHTML = game.pgn();
-        if (game.game_over()) {
-            document.getElementById("status").innerHTML = "Game Over";
+    } else if (rawResponse.headers.get("Content-Type").startsWith("text/event-stream")) {
+        try {
+            await readEvents(rawResponse, (event, data) => {
+                if (event === "info") {
+                    displayThinking(data);
+                } else if (event === "move") {
+                    serverMove(data);
+                } else if (event === "error") {
+                    displayThinking(null);
+                    displayError(data.error_msg);
+                    game.load(data.fen);
+                }
+            });
+        } catch (error) {  // the connection was lost before the server's move arrived
+            displayThinking(null);
+            displayError("Server unavailable, try again later");
+            game.undo();
         }
+    } else {
+        serverMove(await rawResponse.json());
     }
 
     window.setTimeout(() => { board.position(game.fen()) }, 100);
 }
 
+function serverMove(data) {
+    game.move(data.move);
+    document.getElementById("pgn").innerHTML = game.pgn();
+    if (game.game_over()) {
+        document.getElementById("status").innerHTML = "Game Over";
+    }
+    displayThinking(null);
+
+    return;
+}
+
+async function readEvents(rawResponse, onEvent) {
+    // Server-sent events arrive on the response to the POST request, so they are parsed by hand instead of with
+    // EventSource (which can only make GET requests)
+    const reader = rawResponse.body.getReader();
+    const decoder = new TextDecoder();
+    var buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+
+        buffer += decoder.decode(value, { stream: true });
+        var boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+            var event = "message";
+            var data = "";
+            for (const line of buffer.slice(0, boundary).split("\n")) {
+                if (line.startsWith("event:")) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith("data:")) {
+                    data += line.slice(5).trim();
+                }
+            }
+            onEvent(event, JSON.parse(data));
+
+            buffer = buffer.slice(boundary + 2);
+            boundary = buffer.indexOf("\n\n");
+        }
+    }
+
+    return;
+}
+
+function displayThinking(info) {
+    var text = "";
+
+    if (info !== null) {
+        if (info.mate !== undefined && info.mate !== null) {
+            text += "#" + info.mate;
+        } else if (info.score !== undefined) {
+            text += (info.score > 0 ? "+" : "") + (info.score / 100).toFixed(2);
+        }
+        if (info.depth !== undefined) {
+            text += " depth " + info.depth;
+        }
+        if (info.pv !== undefined) {
+            text += " " + info.pv;
+        }
+    }
+
+    document.getElementById("thinking").innerHTML = text;
+}
+
 function displayError(msg) {
     document.getElementById("error").innerHTML = msg;
 }
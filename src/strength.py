@@ -0,0 +1,68 @@
+"""Strength levels for the engines app.py plays against. A level is an amount of search per move rather than a
+think-time, so that an engine plays just as well and costs just as much CPU time per move however busy the host is:
+a number of nodes for the engines that stop after "go nodes", and a depth for Komodo, which ignores node limits.
+Engines that can limit their strength themselves (UCI_LimitStrength and UCI_Elo, like Stockfish) are also asked to
+play at the level's Elo. calibrate.py measures the Elo each engine actually plays at on each level and saves it in
+strength.json, from which app.py shows it to the player."""
+
+import json
+import os
+from collections.abc import Mapping
+
+from chess.engine import Limit
+
+RATINGS_FILE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strength.json")
+
+LEVELS: range = range(1, 9)
+
+# The search of each engine on each level, starting with level 1: ("nodes" or "depth", limit per level)
+SEARCH_LIMITS: dict[str, tuple[str, tuple[int, ...]]] = {
+    "simPLY_chess": ("nodes", (100, 300, 600, 1200, 2500, 5000, 10000, 20000)),  # about 1500 nodes per second
+    "komodo": ("depth", (1, 2, 3, 5, 7, 9, 12, 15)),
+    "stockfish": ("nodes", (500, 2000, 8000, 30000, 100000, 300000, 1000000, 3000000)),  # about 1000000 nodes per second
+    "stub": ("nodes", (5000, 10000, 20000, 30000, 40000, 50000, 75000, 100000)),
+}
+
+TARGET_ELO: tuple[int, ...] = (1350, 1500, 1700, 1900, 2100, 2400, 2700, 3000)  # asked of engines with UCI_Elo
+TIME_LIMIT: float = 30  # seconds a search on any level may take before the watchdog steps in
+
+
+def level_limit(engine: str, level: int) -> Limit:
+    """Returns the search limit of the engine (one of app.py's engine names) on the given level."""
+    kind, limits = SEARCH_LIMITS[engine]
+    if kind == "depth":
+        return Limit(depth=limits[level - 1])
+    return Limit(nodes=limits[level - 1])
+
+
+def level_options(options: Mapping, level: int | None) -> dict[str, bool | int]:
+    """Returns the UCI options that make an engine with the given options play at the level's Elo, or at full strength
+    for no level, so that engines reused from an earlier game don't keep that game's strength."""
+    if "UCI_LimitStrength" not in options or "UCI_Elo" not in options:
+        return {}
+    if level is None:
+        return {"UCI_LimitStrength": False}
+    elo: int = TARGET_ELO[level - 1]
+    option = options["UCI_Elo"]
+    if option.min is not None:
+        elo = max(elo, option.min)
+    if option.max is not None:
+        elo = min(elo, option.max)
+    return {"UCI_LimitStrength": True, "UCI_Elo": elo}
+
+
+def load_ratings(path: str = RATINGS_FILE) -> dict[str, dict[str, int]]:
+    """Returns the measured Elo of each engine on each level calibrated so far, by engine and level (as a string)."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_ratings(ratings: dict[str, dict[str, int]], path: str = RATINGS_FILE) -> None:
+    temporary: str = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(ratings, file, indent=4, sort_keys=True)
+        file.write("\n")
+    os.replace(temporary, path)
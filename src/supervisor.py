@@ -0,0 +1,237 @@
+"""Owns every engine process app.py starts. Processes run under memory and CPU time limits, searches that run past their
+time limit are killed by a watchdog, engines that crashed or were killed are started again when their game next needs
+them, the engines of finished (or hibernated) games wait in a small pool for the next game to use them or are asked to
+quit (and killed if they don't) and all of them are shut down when the app exits. The number of live processes and their resident memory are exported as metrics."""
+
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from chess.engine import EngineError, SimpleEngine
+
+from metrics import Counter, Gauge
+
+try:
+    import resource
+except ImportError:  # Windows has no resource limits
+    resource = None  # type: ignore
+
+REAP_INTERVAL: float = 5  # seconds between checks for engines that have exited
+QUIT_TIMEOUT: float = 2  # seconds an engine gets to quit before it is killed
+PAGE_SIZE: int = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class EngineProcess:
+    """An engine process and how it was started, so that it can be started again."""
+
+    __slots__ = ("engine", "command", "cwd", "key", "pid", "name", "killed", "reaped")
+
+    def __init__(self, engine: SimpleEngine, command: list[str] | str, cwd: str | None) -> None:
+        self.engine: SimpleEngine = engine
+        self.command: list[str] | str = command
+        self.cwd: str | None = cwd
+        self.key: tuple = (command if isinstance(command, str) else tuple(command), cwd)  # engines with the same key are interchangeable
+        self.pid: int = engine.transport.get_pid()
+        self.name: str = engine.id.get("name", "unknown")
+        self.killed: bool = False  # by the supervisor, as opposed to crashing or quitting
+        self.reaped: bool = False  # its exit has been recorded
+
+    def alive(self) -> bool:
+        return not self.engine.returncode.done()
+
+    def rss(self) -> int:
+        """Returns the resident memory of the process in bytes, or 0 where /proc isn't available."""
+        try:
+            with open(f"/proc/{self.pid}/statm") as file:
+                return int(file.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def kill(self) -> None:
+        if self.alive():
+            self.killed = True
+            try:
+                self.engine.protocol.loop.call_soon_threadsafe(self.engine.transport.kill)
+            except RuntimeError:  # the engine's event loop has just closed, so the process is gone too
+                pass
+
+
+class Supervisor:
+    """Starts, watches and stops engine processes. `memory_limit` (bytes of address space) and `cpu_limit` (seconds of
+    CPU time over the life of the process) are applied to each of them, 0 meaning no limit, and searches are killed
+    `watchdog_margin` seconds after their time limit has passed. Up to `pool_size` idle engines of each kind are kept
+    for new games."""
+
+    def __init__(self, memory_limit: int, cpu_limit: int, watchdog_margin: float, pool_size: int) -> None:
+        self.memory_limit: int = memory_limit
+        self.cpu_limit: int = cpu_limit
+        self.watchdog_margin: float = watchdog_margin
+        self.pool_size: int = pool_size
+        self.lock: threading.Lock = threading.Lock()
+        self.processes: dict[SimpleEngine, EngineProcess] = {}
+        self.idle: dict[tuple, list[SimpleEngine]] = {}  # engine key -> engines waiting in the pool
+        self.closed: bool = False
+
+        self.exits = Counter("webchess_engine_exits_total", "Engine processes that exited, by engine and reason.", ("engine", "reason"))
+        self.restarts = Counter("webchess_engine_restarts_total", "Engine processes started again after crashing, hanging or being killed.", ("engine",))
+        Gauge("webchess_engines_alive", "Engine processes currently running.", function=self.alive)
+        Gauge("webchess_engine_rss_bytes", "Resident memory of all engine processes.", function=self.rss)
+
+        # Reaps exited engines in the background and shuts the rest down once the main thread is done, before the
+        # interpreter waits for the (non-daemon) threads python-chess runs each engine's event loop in
+        threading.Thread(target=self.run, name="engine supervisor", daemon=True).start()
+
+    def start(self, command: list[str] | str, cwd: str | None = None) -> SimpleEngine:
+        """Starts an engine and puts its process under the resource limits."""
+        engine: SimpleEngine = SimpleEngine.popen_uci(command, cwd=cwd)
+        process: EngineProcess = EngineProcess(engine, command, cwd)
+        self.limit(process.pid)
+        with self.lock:
+            self.processes[engine] = process
+            closed: bool = self.closed
+        if closed:  # started while shutting down
+            self.stop(process)
+        return engine
+
+    def acquire(self, command: list[str] | str, cwd: str | None = None) -> SimpleEngine:
+        """Returns an idle engine started the same way from the pool, or starts a new one."""
+        key: tuple = (command if isinstance(command, str) else tuple(command), cwd)
+        with self.lock:
+            idle: list[SimpleEngine] = self.idle.get(key, [])
+            while len(idle) > 0:
+                engine: SimpleEngine = idle.pop()
+                if not engine.returncode.done():
+                    return engine
+        return self.start(command, cwd)
+
+    def release(self, engine: SimpleEngine) -> None:
+        """Puts the engine of a game that is over (or hibernated) in the pool, or retires it if the pool is full."""
+        with self.lock:
+            process: EngineProcess | None = self.processes.get(engine)
+            if process is not None and process.alive() and not self.closed:
+                idle: list[SimpleEngine] = self.idle.setdefault(process.key, [])
+                if len(idle) < self.pool_size:
+                    idle.append(engine)
+                    return
+        self.retire(engine)
+
+    def limit(self, pid: int) -> None:
+        if resource is None or not hasattr(resource, "prlimit"):
+            return
+        try:
+            if self.memory_limit > 0:
+                resource.prlimit(pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+            if self.cpu_limit > 0:
+                resource.prlimit(pid, resource.RLIMIT_CPU, (self.cpu_limit, self.cpu_limit + 5))  # SIGXCPU first, SIGKILL after the hard limit
+        except (OSError, ValueError):  # the process has already exited, or the limits are above what this process may set
+            pass
+
+    def revive(self, engine: SimpleEngine) -> SimpleEngine:
+        """Returns the engine if its process is still running, or a new process of the same engine otherwise."""
+        if not engine.returncode.done():
+            return engine
+        return self.restart(engine)
+
+    def restart(self, engine: SimpleEngine) -> SimpleEngine:
+        """Stops the engine's process if it is still running and starts a new one in its place."""
+        with self.lock:
+            process: EngineProcess | None = self.processes.pop(engine, None)
+        if process is None:
+            raise EngineError("engine is not supervised")
+        self.stop(process)
+        self.restarts.inc(engine=process.name)
+        return self.start(process.command, process.cwd)
+
+    @contextmanager
+    def watch(self, engine: SimpleEngine, seconds: float) -> Iterator[None]:
+        """Kills the engine if the `with` block (usually a search limited to `seconds`) hasn't finished by the end of the
+        margin."""
+        process: EngineProcess | None = self.processes.get(engine)
+        watchdog: threading.Timer | None = None
+        if process is not None:
+            watchdog = threading.Timer(seconds + self.watchdog_margin, process.kill)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            yield
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+    def retire(self, engine: SimpleEngine) -> None:
+        """Shuts the engine down in the background, once its game is over."""
+        with self.lock:
+            process: EngineProcess | None = self.processes.pop(engine, None)
+        if process is not None:
+            threading.Thread(target=self.stop, args=(process,), name=f"quit engine (pid={process.pid})", daemon=True).start()
+
+    def stop(self, process: EngineProcess) -> None:
+        """Asks the process to quit and kills it if it hasn't within the timeout."""
+        if process.alive():
+            quitting = threading.Thread(target=quit_quietly, args=(process.engine,), daemon=True)
+            quitting.start()
+            quitting.join(QUIT_TIMEOUT)
+            if process.alive():
+                process.kill()
+        try:
+            process.engine.returncode.result(QUIT_TIMEOUT)
+        except (TimeoutError, EngineError):
+            pass
+        self.record_exit(process)
+
+    def record_exit(self, process: EngineProcess) -> None:
+        with self.lock:
+            if process.reaped or process.alive():
+                return
+            process.reaped = True
+        reason: str = "killed" if process.killed else "quit" if process.engine.returncode.result() == 0 else "crashed"
+        self.exits.inc(engine=process.name, reason=reason)
+
+    def reap(self) -> None:
+        """Records the exit of processes that crashed (or were killed). They are kept, so that their game can start the
+        engine again when it next needs it, until they are restarted or retired, unless they were waiting in the pool."""
+        with self.lock:
+            exited: list[EngineProcess] = [process for process in self.processes.values() if not process.alive()]
+            for idle in self.idle.values():
+                for engine in [engine for engine in idle if engine.returncode.done()]:
+                    idle.remove(engine)
+                    del self.processes[engine]
+        for process in exited:
+            self.record_exit(process)
+
+    def shutdown(self) -> None:
+        """Stops every engine at once, waiting for them to quit or be killed."""
+        with self.lock:
+            self.closed = True
+            processes: list[EngineProcess] = list(self.processes.values())
+            self.processes.clear()
+            self.idle.clear()
+        stopping: list[threading.Thread] = [threading.Thread(target=self.stop, args=(process,), daemon=True) for process in processes]
+        for thread in stopping:
+            thread.start()
+        for thread in stopping:
+            thread.join()
+
+    def run(self) -> None:
+        main: threading.Thread = threading.main_thread()
+        while main.is_alive():
+            main.join(REAP_INTERVAL)
+            self.reap()
+        self.shutdown()
+
+    def alive(self) -> int:
+        with self.lock:
+            return sum(process.alive() for process in self.processes.values())
+
+    def rss(self) -> int:
+        with self.lock:
+            processes: list[EngineProcess] = list(self.processes.values())
+        return sum(process.rss() for process in processes)
+
+
+def quit_quietly(engine: SimpleEngine) -> None:
+    try:
+        engine.quit()
+    except (EngineError, TimeoutError):
+        pass
@@ -0,0 +1,342 @@
+# /// script
+# requires-python = ">=3.14"
+# dependencies = ["chess>=1.11.2", "numpy"]
+# ///
+# NumPy: https://numpy.org/doc/stable/
+# Texel's tuning method: https://www.chessprogramming.org/Texel%27s_Tuning_Method
+
+"""Tunes the evaluation of simPLY_chess (piece values, piece square tables, king tropism and pawn structure, for the
+middlegame and the endgame) on positions labelled with the result of the game they were played in, by Texel's method: the weights are
+fitted so that a sigmoid of the evaluation predicts the results as well as possible. Every position is turned into a
+sparse row of the terms evaluate_position() sums up, once and in worker processes, after which the weights are fitted
+by minibatch gradient descent (Adam) on those rows with NumPy alone. The fitted weights are written to a table module
+in the engines directory, which the engine plays with after `setoption name EvalTables value <module>`.
+
+Positions are read from EPD-like files, one FEN per line followed by the result as "1-0", "0-1", "1/2-1/2" (quoted or
+not, e.g. `... w - - c9 "1/2-1/2";`) or a number from 0 to 1, from white's point of view, or from PGN files, whose
+positions are labelled with their game's result. NumPy is only needed here, `uv run texel.py` installs it."""
+
+import argparse
+import math
+import os
+import random
+import re
+import sys
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ENGINE_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engines")
+sys.path.insert(0, ENGINE_DIRECTORY)
+
+import simPLY_chess as engine  # noqa: E402
+
+PIECES: str = "PNBRQK"
+PIECE_NAMES: tuple[str, ...] = ("PAWN", "KNIGHT", "BISHOP", "ROOK", "QUEEN", "KING")
+
+# Columns of the feature rows, the same for the middlegame and endgame weights: the material of each piece but the
+# king (whose values cancel out), the piece square tables of every piece, the king tropism of each piece but the king,
+# and the doubled, isolated and (by rank) passed pawns
+MATERIAL: int = 0
+TABLES: int = 5
+TROPISM: int = TABLES + 6 * 64
+DOUBLED_PAWNS: int = TROPISM + 5
+ISOLATED_PAWNS: int = DOUBLED_PAWNS + 1
+PASSED_PAWNS: int = ISOLATED_PAWNS + 1
+FEATURES: int = PASSED_PAWNS + 8
+
+RESULT: re.Pattern = re.compile(r'"?(1-0|0-1|1/2-1/2|[01](?:\.\d+)?)"?;?\s*$')
+RESULTS: dict[str, float] = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+CHUNK_SIZE: int = 20000  # positions per task of the worker processes
+PGN_SKIP_PLIES: int = 8  # opening moves of PGN games left out, as they mostly come from books
+
+
+class Dataset:
+    """Feature rows of labelled positions, in compressed sparse row form: the columns and values of position i are
+    `columns[offsets[i]:offsets[i + 1]]` and `values[...]`. Every position also has its game phase (0 for the
+    middlegame, 1 for the endgame), mop-up bonus and result, the latter two from the side to move's point of view."""
+
+    def __init__(self, offsets: np.ndarray, columns: np.ndarray, values: np.ndarray, phases: np.ndarray, mop_ups: np.ndarray, results: np.ndarray) -> None:
+        self.offsets: np.ndarray = offsets
+        self.columns: np.ndarray = columns
+        self.values: np.ndarray = values
+        self.phases: np.ndarray = phases
+        self.mop_ups: np.ndarray = mop_ups
+        self.results: np.ndarray = results
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    @staticmethod
+    def concatenate(parts: list["Dataset"]) -> "Dataset":
+        ends: np.ndarray = np.cumsum([0] + [len(part.columns) for part in parts])
+        offsets: np.ndarray = np.concatenate([np.zeros(1, np.int64)] + [part.offsets[1:] + end for part, end in zip(parts, ends)])
+        return Dataset(offsets, *(np.concatenate([getattr(part, name) for part in parts]) for name in ("columns", "values", "phases", "mop_ups", "results")))
+
+    def batch(self, start: int, stop: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the rows (counted from `start`), columns and values of the entries of positions `start` to `stop`."""
+        rows: np.ndarray = np.repeat(np.arange(stop - start), np.diff(self.offsets[start:stop + 1]))
+        first, last = self.offsets[start], self.offsets[stop]
+        return rows, self.columns[first:last], self.values[first:last]
+
+
+##########################
+# POSITIONS AND FEATURES #
+##########################
+
+def parse_result(text: str) -> float | None:
+    result: float | None = RESULTS.get(text)
+    if result is None:
+        try:
+            result = float(text)
+        except ValueError:
+            return None
+    return result if 0 <= result <= 1 else None
+
+
+def read_positions(path: str) -> Iterator[tuple[str, float]]:
+    """Yields the FEN and result (from white's point of view) of every labelled position in the file."""
+    if path.endswith(".pgn"):
+        import chess.pgn  # only needed for PGN files
+        with open(path) as file:
+            while (game := chess.pgn.read_game(file)) is not None:
+                result: float | None = parse_result(game.headers.get("Result", "*"))
+                if result is None:
+                    continue
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    board.push(move)
+                    if ply + 1 >= PGN_SKIP_PLIES and not board.is_check():  # positions in check are rarely quiet
+                        yield board.fen(), result
+        return
+
+    with open(path) as file:
+        for line in file:
+            match: re.Match | None = RESULT.search(line)
+            if match is None:
+                continue
+            fields: list[str] = line[:match.start()].split()
+            result = parse_result(match.group(1))
+            if len(fields) >= 2 and result is not None:
+                yield " ".join(fields[:4] + ["0", "1"]), result
+
+
+def table_index(square: int) -> int:
+    """Converts a square of the 10x12 board to its index in the 8x8 piece square tables."""
+    return (square // 10 - 2) * 8 + square % 10 - 1
+
+
+def extract(positions: list[tuple[str, float]]) -> Dataset:
+    """Turns positions into the feature rows of the terms evaluate_position() adds up, from the side to move's point of
+    view. Runs in the worker processes."""
+    offsets: list[int] = [0]
+    columns: list[int] = []
+    values: list[float] = []
+    phases: list[float] = []
+    mop_ups: list[int] = []
+    results: list[float] = []
+    for fen, result in positions:
+        try:
+            position, _, _, _, _, color = engine.load_fen(fen)
+        except (ValueError, IndexError, KeyError):
+            continue
+        if "K" not in position or "k" not in position:
+            continue
+        king_square: int = position.find("K")
+        opponent_king_square: int = position.find("k")
+        row: dict[int, float] = {}
+        for square, piece in enumerate(position):
+            if piece.isupper():  # ally piece
+                sign, index, king = 1, table_index(square), opponent_king_square
+            elif piece.islower():  # opponent piece, read from its own side of the table
+                sign, index, king = -1, table_index((11 - (square // 10)) * 10 + (square % 10)), king_square
+            else:
+                continue
+            kind: int = PIECES.index(piece.upper())
+            row[TABLES + kind * 64 + index] = row.get(TABLES + kind * 64 + index, 0) + sign
+            if kind != 5:
+                row[MATERIAL + kind] = row.get(MATERIAL + kind, 0) + sign
+                row[TROPISM + kind] = row.get(TROPISM + kind, 0) + sign / engine.manhattan_distance(square, king)
+        doubled, isolated, passed = engine.pawn_counts(position)
+        for column, count in ((DOUBLED_PAWNS, doubled), (ISOLATED_PAWNS, isolated), *((PASSED_PAWNS + rank, count) for rank, count in enumerate(passed))):
+            if count:
+                row[column] = count
+        columns.extend(row)
+        values.extend(row.values())
+        offsets.append(len(columns))
+        phases.append(engine.game_phase(position) / 256)
+        mop_ups.append(engine.MOP_UP_SCORE * (14 - engine.manhattan_distance(king_square, opponent_king_square)) // 14)
+        results.append(result if color == "w" else 1 - result)
+    return Dataset(np.array(offsets, np.int64), np.array(columns, np.int16), np.array(values, np.float32), np.array(phases, np.float32), np.array(mop_ups, np.float32), np.array(results, np.float32))
+
+
+def load_dataset(paths: list[str], workers: int, limit: int | None, seed: int) -> Dataset:
+    """Reads, shuffles and extracts the positions of every file."""
+    positions: list[tuple[str, float]] = [position for path in paths for position in read_positions(path)]
+    random.Random(seed).shuffle(positions)  # so that every batch mixes positions of many games
+    positions = positions[:limit]
+    chunks: list[list[tuple[str, float]]] = [positions[i:i + CHUNK_SIZE] for i in range(0, len(positions), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return Dataset.concatenate(list(executor.map(extract, chunks)))
+
+
+###########
+# WEIGHTS #
+###########
+
+def engine_weights() -> np.ndarray:
+    """Returns the engine's current weights as a 2 x FEATURES array, the middlegame row first."""
+    weights: np.ndarray = np.zeros((2, FEATURES))
+    for i, phase in enumerate(("MIDGAME", "ENDGAME")):
+        piece_values: dict[str, int] = getattr(engine, f"{phase}_PIECE_VALUES")
+        tropism_values: dict[str, int] = getattr(engine, f"{phase}_TROPISM_VALUES")
+        for kind, (piece, name) in enumerate(zip(PIECES, PIECE_NAMES)):
+            weights[i, TABLES + kind * 64:TABLES + kind * 64 + 64] = getattr(engine, f"{phase}_{name}_TABLE")
+            if piece != "K":
+                weights[i, MATERIAL + kind] = piece_values[piece]
+                weights[i, TROPISM + kind] = tropism_values[piece]
+        weights[i, DOUBLED_PAWNS] = getattr(engine, f"{phase}_DOUBLED_PAWN_VALUE")
+        weights[i, ISOLATED_PAWNS] = getattr(engine, f"{phase}_ISOLATED_PAWN_VALUE")
+        weights[i, PASSED_PAWNS:PASSED_PAWNS + 8] = getattr(engine, f"{phase}_PASSED_PAWN_VALUES")
+    return weights
+
+
+def evaluate(data: Dataset, weights: np.ndarray, start: int, stop: int) -> tuple[np.ndarray, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Returns the evaluation of positions `start` to `stop` with the given weights, and the batch they came from."""
+    batch: tuple[np.ndarray, np.ndarray, np.ndarray] = data.batch(start, stop)
+    rows, columns, values = batch
+    midgame: np.ndarray = np.bincount(rows, values * weights[0, columns], minlength=stop - start)
+    endgame: np.ndarray = np.bincount(rows, values * weights[1, columns], minlength=stop - start)
+    endgame += np.sign(endgame) * data.mop_ups[start:stop]  # the mop-up bonus goes to the side ahead in the endgame
+    phases: np.ndarray = data.phases[start:stop]
+    return (1 - phases) * midgame + phases * endgame, batch
+
+
+def sigmoid(scores: np.ndarray, k: float) -> np.ndarray:
+    """The expected result of positions with the given evaluations."""
+    return 1 / (1 + np.power(10, -k * scores / 400))
+
+
+def loss(data: Dataset, weights: np.ndarray, k: float, start: int, stop: int, batch_size: int) -> float:
+    """The mean squared error of the expected results of positions `start` to `stop`."""
+    total: float = 0
+    for first in range(start, stop, batch_size):
+        last: int = min(first + batch_size, stop)
+        scores, _ = evaluate(data, weights, first, last)
+        total += float(np.sum((data.results[first:last] - sigmoid(scores, k)) ** 2))
+    return total / max(stop - start, 1)
+
+
+def fit_k(data: Dataset, weights: np.ndarray, stop: int, batch_size: int) -> float:
+    """Finds the scaling constant of the sigmoid that fits the current weights best, by golden section search."""
+    low, high = 0.1, 4.0
+    ratio: float = (math.sqrt(5) - 1) / 2
+    for _ in range(30):
+        left, right = high - ratio * (high - low), low + ratio * (high - low)
+        if loss(data, weights, left, 0, stop, batch_size) < loss(data, weights, right, 0, stop, batch_size):
+            high = right
+        else:
+            low = left
+    return (low + high) / 2
+
+
+def tune(data: Dataset, weights: np.ndarray, k: float, stop: int, epochs: int, batch_size: int, learning_rate: float, seed: int) -> np.ndarray:
+    """Fits the weights to the first `stop` positions by minibatch gradient descent with Adam, reporting the loss on
+    them and on the held out positions after every epoch."""
+    weights = weights.copy()
+    first_moment: np.ndarray = np.zeros_like(weights)
+    second_moment: np.ndarray = np.zeros_like(weights)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step: int = 0
+    rng: np.random.Generator = np.random.default_rng(seed)
+    starts: np.ndarray = np.arange(0, stop, batch_size)
+    scale: float = k * math.log(10) / 400
+    for epoch in range(1, epochs + 1):
+        epoch_start: float = time.perf_counter()
+        for first in rng.permutation(starts):
+            last: int = min(first + batch_size, stop)
+            scores, (rows, columns, values) = evaluate(data, weights, first, last)
+            expected: np.ndarray = sigmoid(scores, k)
+            # d(loss)/d(score) of each position, then spread over the weights of its terms by phase
+            gradient: np.ndarray = -2 * (data.results[first:last] - expected) * expected * (1 - expected) * scale / (last - first)
+            phases: np.ndarray = data.phases[first:last]
+            weighted: np.ndarray = values * gradient[rows]
+            gradients: np.ndarray = np.stack((
+                np.bincount(columns, weighted * (1 - phases[rows]), minlength=FEATURES),
+                np.bincount(columns, weighted * phases[rows], minlength=FEATURES),
+            ))
+            step += 1
+            first_moment = beta1 * first_moment + (1 - beta1) * gradients
+            second_moment = beta2 * second_moment + (1 - beta2) * gradients ** 2
+            weights -= learning_rate * (first_moment / (1 - beta1 ** step)) / (np.sqrt(second_moment / (1 - beta2 ** step)) + epsilon)
+        validation: str = f", validation loss {loss(data, weights, k, stop, len(data), batch_size):.6f}" if stop < len(data) else ""
+        print(f"Epoch {epoch}: loss {loss(data, weights, k, 0, stop, batch_size):.6f}{validation} ({time.perf_counter() - epoch_start:.1f}s)", flush=True)
+    return weights
+
+
+def write_module(path: str, weights: np.ndarray, comment: str) -> None:
+    """Writes the weights as a table module for the engine's EvalTables option."""
+    rounded: np.ndarray = np.rint(weights).astype(int)
+    lines: list[str] = [f'"""Evaluation weights of simPLY_chess {comment}, written by texel.py."""', ""]
+    for i, phase in enumerate(("MIDGAME", "ENDGAME")):
+        lines.append(f"{phase}_PIECE_VALUES: dict[str, int] = {{{', '.join(f'{piece!r}: {rounded[i, MATERIAL + kind]}' for kind, piece in enumerate(PIECES[:5]))}}}")
+        lines.append(f"{phase}_TROPISM_VALUES: dict[str, int] = {{{', '.join(f'{piece!r}: {rounded[i, TROPISM + kind]}' for kind, piece in enumerate(PIECES[:5]))}}}")
+        lines.append(f"{phase}_DOUBLED_PAWN_VALUE: int = {rounded[i, DOUBLED_PAWNS]}")
+        lines.append(f"{phase}_ISOLATED_PAWN_VALUE: int = {rounded[i, ISOLATED_PAWNS]}")
+        lines.append(f"{phase}_PASSED_PAWN_VALUES: list[int] = [{', '.join(str(value) for value in rounded[i, PASSED_PAWNS:PASSED_PAWNS + 8])}]")
+        lines.append("")
+        for kind, name in enumerate(PIECE_NAMES):
+            table: np.ndarray = rounded[i, TABLES + kind * 64:TABLES + kind * 64 + 64]
+            lines.append(f"{phase}_{name}_TABLE: list[int] = [")
+            lines.extend("    " + ", ".join(f"{value:4d}" for value in table[row:row + 8]) + "," for row in range(0, 64, 8))
+            lines.append("]")
+            lines.append("")
+    temporary: str = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        file.write("\n".join(lines))
+    os.replace(temporary, path)
+
+
+########
+# MAIN #
+########
+
+def main() -> None:
+    """Tunes the engine's evaluation on the given positions and writes the result to a table module."""
+    parser = argparse.ArgumentParser(description="Tune the evaluation of simPLY_chess on positions labelled with game results.")
+    parser.add_argument("positions", nargs="+", help="EPD-like files (FEN and result per line) or PGN files")
+    parser.add_argument("--output", default="tuned_tables", help="name of the table module written to the engines directory")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16384, help="positions per gradient step")
+    parser.add_argument("--learning-rate", type=float, default=1.0, help="about the most a weight moves per step, in centipawns")
+    parser.add_argument("--k", type=float, help="scaling constant of the sigmoid (default: fitted to the engine's current weights)")
+    parser.add_argument("--validation", type=float, default=0.05, help="share of the positions held out to check for overfitting")
+    parser.add_argument("--limit", type=int, help="use at most this many positions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes extracting the features")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start: float = time.perf_counter()
+    data: Dataset = load_dataset(args.positions, args.workers, args.limit, args.seed)
+    if len(data) == 0:
+        parser.error("no labelled positions found")
+    print(f"{len(data)} positions, {len(data.columns)} terms, read in {time.perf_counter() - start:.1f}s", flush=True)
+
+    training: int = max(1, int(len(data) * (1 - args.validation)))
+    weights: np.ndarray = engine_weights()
+    k: float = args.k if args.k is not None else fit_k(data, weights, training, args.batch_size)
+    initial_loss: float = loss(data, weights, k, 0, training, args.batch_size)
+    print(f"K {k:.4f}, initial loss {initial_loss:.6f}", flush=True)
+
+    weights = tune(data, weights, k, training, args.epochs, args.batch_size, args.learning_rate, args.seed)
+    final_loss: float = loss(data, weights, k, 0, training, args.batch_size)
+    path: str = os.path.join(ENGINE_DIRECTORY, f"{args.output}.py")
+    write_module(path, weights, f"fitted to {training} positions (loss {initial_loss:.6f} to {final_loss:.6f}, K {k:.4f})")
+    print(f"Written to {path} in {time.perf_counter() - start:.1f}s, play with it after `setoption name EvalTables value {args.output}`")
+
+
+if __name__ == "__main__":
+    main()
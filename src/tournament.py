@@ -0,0 +1,441 @@
+# python-chess: https://python-chess.readthedocs.io/en/latest/
+# SPRT: https://www.chessprogramming.org/Sequential_Probability_Ratio_Test
+# Elo: https://www.chessprogramming.org/Match_Statistics
+
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import time
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from glob import glob
+from pathlib import Path
+
+from chess import BLACK, WHITE, Board, Color
+from chess.engine import EngineError, EngineTerminatedError, Info, Limit, SimpleEngine
+from chess.pgn import Game
+from chess.polyglot import open_reader  # type: ignore
+
+ENGINES: dict[str, str] = {
+    "simPLY_chess": r"engines/simPLY_chess.py",
+    "komodo": r"engines/komodo14",
+    "stockfish": r"engines/stockfish16",
+}
+
+OPENING_BOOKS: str = r"engines/opening-books/*.bin"
+
+
+@dataclass(frozen=True)
+class TimeControl:
+    base: float | None = None  # seconds on the clock at the start of the game
+    increment: float = 0  # seconds added after every move
+    movetime: float | None = None  # fixed seconds per move
+    nodes: int | None = None
+    depth: int | None = None
+
+    @staticmethod
+    def parse(text: str) -> "TimeControl":
+        """Parses a time control of the form "base+increment" (e.g. "10+0.1") or "movetime=0.5", "nodes=20000",
+        "depth=6"."""
+        if "=" in text:
+            kind, value = text.split("=", 1)
+            if kind == "movetime":
+                return TimeControl(movetime=float(value))
+            elif kind == "nodes":
+                return TimeControl(nodes=int(value))
+            elif kind == "depth":
+                return TimeControl(depth=int(value))
+            raise ValueError(f"Unknown time control: {text}")
+        base, _, increment = text.partition("+")
+        return TimeControl(base=float(base), increment=float(increment or 0))
+
+    def limit(self, white_clock: float, black_clock: float) -> Limit:
+        """Returns the search limit for the next move given the remaining clock times."""
+        if self.base is not None:
+            return Limit(white_clock=white_clock, black_clock=black_clock, white_inc=self.increment, black_inc=self.increment)
+        return Limit(time=self.movetime, nodes=self.nodes, depth=self.depth)
+
+
+@dataclass(frozen=True)
+class Adjudication:
+    resign_score: int = 1000  # centipawns, both engines must agree for `resign_moves` consecutive moves each
+    resign_moves: int = 3
+    draw_score: int = 10  # centipawns, both engines must agree for `draw_moves` consecutive moves each
+    draw_moves: int = 8
+    draw_move_number: int = 40  # draw adjudication only starts after this full move number
+    max_moves: int = 200  # full moves before the game is declared drawn
+
+
+@dataclass(frozen=True)
+class Player:
+    """An engine playing with its own time control or UCI options rather than the match's time control and its
+    defaults, such as an engine on one of its strength levels."""
+    engine: str  # engine name or path
+    time_control: TimeControl | None = None
+    options: tuple[tuple[str, bool | int | str], ...] = ()
+
+
+@dataclass(frozen=True)
+class GameJob:
+    index: int
+    white: str
+    black: str
+    opening: tuple[str, ...]  # moves in UCI notation
+    time_control: TimeControl
+    adjudication: Adjudication
+    players: dict[str, Player] = field(default_factory=dict)  # white and black by name, if they aren't just engines
+
+
+@dataclass(frozen=True)
+class GameResult:
+    index: int
+    white: str
+    black: str
+    result: str  # "1-0", "0-1" or "1/2-1/2"
+    termination: str
+    pgn: str
+    plies: int
+    seconds: float
+
+
+@dataclass
+class MatchScore:
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+    terminations: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, result: GameResult, engine: str) -> None:
+        """Records a finished game from the point of view of the given engine."""
+        if result.result == "1/2-1/2":
+            self.draws += 1
+        elif (result.result == "1-0") == (result.white == engine):
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.terminations[result.termination] = self.terminations.get(result.termination, 0) + 1
+
+
+###########################
+# ENGINE AND GAME HELPERS #
+###########################
+
+def engine_command(engine: str) -> tuple[list[str], str | None]:
+    """Resolves an engine name or path to the command used to start it and the directory to start it in. Python
+    engines are run with the current interpreter so that every worker uses the same environment, and as modules from
+    their own directory so that their bytecode is cached instead of being compiled again for every game. Raises
+    FileNotFoundError if there is no such engine, such as a named engine whose binary isn't installed."""
+    path = ENGINES.get(engine, engine)
+    if not os.path.isfile(path) and shutil.which(path) is None:
+        raise FileNotFoundError(f"engine {engine} not found at {path}")
+    if path.endswith(".py"):
+        directory, file_name = os.path.split(os.path.abspath(path))
+        return [sys.executable, "-E", "-S", "-m", file_name.removesuffix(".py")], directory
+    return [path], None
+
+
+def book_openings(book_paths: list[str], count: int, plies: int, seed: int) -> list[tuple[str, ...]]:
+    """Generates up to `count` distinct openings by taking weighted random walks of at most `plies` half moves through
+    the given PolyGlot books."""
+    rng = random.Random(seed)
+    readers = [open_reader(path) for path in book_paths]
+    openings: list[tuple[str, ...]] = []
+    seen: set[tuple[str, ...]] = set()
+    try:
+        for _ in range(count * 10):  # give up eventually if the books are too small to produce enough openings
+            if len(openings) >= count:
+                break
+            board = Board()
+            for _ in range(plies):
+                entries = [entry for reader in readers for entry in reader.find_all(board)]
+                if len(entries) == 0:
+                    break
+                entry = rng.choices(entries, weights=[entry.weight + 1 for entry in entries])[0]
+                board.push(entry.move)
+            opening = tuple(move.uci() for move in board.move_stack)
+            if len(opening) > 0 and opening not in seen:
+                seen.add(opening)
+                openings.append(opening)
+    finally:
+        for reader in readers:
+            reader.close()
+    return openings
+
+
+def relative_score(info: dict, color: Color) -> int | None:
+    """Returns the score from an engine's info in centipawns from the point of view of the given color."""
+    score = info.get("score")
+    if score is None:
+        return None
+    return score.pov(color).score(mate_score=100000)
+
+
+def play_game(job: GameJob) -> GameResult:
+    """Plays a single game between two engines starting from the job's opening and returns the result. Runs inside a
+    worker process; each game starts its own engine processes so nothing outlives the game."""
+    start = time.monotonic()
+    board = Board()
+    for move in job.opening:
+        board.push_uci(move)
+    players: dict[Color, Player] = {WHITE: job.players.get(job.white, Player(job.white)), BLACK: job.players.get(job.black, Player(job.black))}
+    time_controls: dict[Color, TimeControl] = {color: player.time_control or job.time_control for color, player in players.items()}
+    adjudication = job.adjudication
+    clocks: dict[Color, float] = {color: tc.base or 0 for color, tc in time_controls.items()}
+    losing_streak: dict[Color, int] = {WHITE: 0, BLACK: 0}  # consecutive moves each engine reported a lost position
+    winning_streak: dict[Color, int] = {WHITE: 0, BLACK: 0}  # consecutive moves each engine reported a won position
+    draw_streak: int = 0
+    result: str = "*"
+    termination: str = "unterminated"
+    names: dict[Color, str] = {WHITE: job.white, BLACK: job.black}
+
+    with ExitStack() as stack:
+        engines: dict[Color, SimpleEngine] = {}
+        for color in (WHITE, BLACK):
+            try:  # an engine that can't start (or crashes while starting) loses the game like one that crashes later
+                command, directory = engine_command(players[color].engine)
+                engines[color] = stack.enter_context(SimpleEngine.popen_uci(command, cwd=directory))
+                engines[color].configure(dict(players[color].options))
+            except (OSError, EngineError):
+                result, termination = ("0-1" if color == WHITE else "1-0"), "engine failure"
+                break
+        names = {color: engines[color].id.get("name", name) if color in engines and name not in job.players else name for color, name in names.items()}
+        while result == "*":
+            outcome = board.outcome(claim_draw=True)
+            if outcome is not None:
+                result = outcome.result()
+                termination = outcome.termination.name.lower()
+                break
+            if board.fullmove_number > adjudication.max_moves:
+                result, termination = "1/2-1/2", "max moves"
+                break
+
+            turn: Color = board.turn
+            tc = time_controls[turn]
+            move_start = time.monotonic()
+            try:
+                play = engines[turn].play(board, tc.limit(clocks[WHITE], clocks[BLACK]), game=job.index, info=Info.SCORE)
+            except (EngineError, EngineTerminatedError):
+                result, termination = ("0-1" if turn == WHITE else "1-0"), "engine failure"
+                break
+            if tc.base is not None:
+                clocks[turn] += tc.increment - (time.monotonic() - move_start)
+                if clocks[turn] < 0:
+                    result, termination = ("0-1" if turn == WHITE else "1-0"), "time forfeit"
+                    break
+            if play.move is None or play.move not in board.legal_moves:
+                result, termination = ("0-1" if turn == WHITE else "1-0"), "illegal move"
+                break
+
+            score = relative_score(play.info, turn)
+            board.push(play.move)
+
+            losing_streak[turn] = losing_streak[turn] + 1 if score is not None and score <= -adjudication.resign_score else 0
+            winning_streak[turn] = winning_streak[turn] + 1 if score is not None and score >= adjudication.resign_score else 0
+            if score is not None and abs(score) <= adjudication.draw_score and board.fullmove_number > adjudication.draw_move_number:
+                draw_streak += 1
+            else:
+                draw_streak = 0
+
+            losing = [color for color in (WHITE, BLACK) if losing_streak[color] >= adjudication.resign_moves and winning_streak[not color] >= adjudication.resign_moves]
+            if len(losing) > 0:
+                result, termination = ("0-1" if losing[0] == WHITE else "1-0"), "adjudication"
+            elif draw_streak >= 2 * adjudication.draw_moves:
+                result, termination = "1/2-1/2", "adjudication"
+
+    game = Game.from_board(board)
+    game.headers["Event"] = "WebChess tournament"
+    game.headers["Round"] = str(job.index + 1)
+    game.headers["White"] = names[WHITE]
+    game.headers["Black"] = names[BLACK]
+    game.headers["Result"] = result
+    game.headers["Termination"] = termination
+    game.headers["Opening"] = " ".join(job.opening)
+    return GameResult(job.index, job.white, job.black, result, termination, str(game), board.ply(), time.monotonic() - start)
+
+
+##############
+# STATISTICS #
+##############
+
+def expected_score(elo: float) -> float:
+    """Converts an Elo difference to the expected score."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score: float) -> float:
+    """Converts a score (between 0 and 1) to an Elo difference."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_statistics(match: MatchScore) -> tuple[float, float]:
+    """Returns the mean score and the per-game score variance of the match."""
+    games = match.games
+    score = (match.wins + match.draws / 2) / games
+    variance = (match.wins * (1 - score) ** 2 + match.draws * (0.5 - score) ** 2 + match.losses * score ** 2) / games
+    return score, variance
+
+
+def elo_estimate(match: MatchScore) -> tuple[float, float, float]:
+    """Returns the Elo difference with its 95% confidence interval as (elo, lower, upper)."""
+    if match.games == 0:
+        return 0, -math.inf, math.inf
+    score, variance = score_statistics(match)
+    margin = 1.959964 * math.sqrt(variance / match.games)
+    return elo_difference(score), elo_difference(score - margin), elo_difference(score + margin)
+
+
+def likelihood_of_superiority(match: MatchScore) -> float:
+    """Returns the probability that the first engine is stronger, ignoring draws."""
+    if match.wins + match.losses == 0:
+        return 0.5
+    return 0.5 * (1 + math.erf((match.wins - match.losses) / math.sqrt(2 * (match.wins + match.losses))))
+
+
+def sprt_llr(match: MatchScore, elo0: float, elo1: float) -> float:
+    """Returns the log-likelihood ratio of H1 (elo = elo1) against H0 (elo = elo0) using the normal approximation of
+    the generalized SPRT."""
+    if match.games == 0:
+        return 0
+    score, variance = score_statistics(match)
+    if variance == 0:
+        return 0
+    score0 = expected_score(elo0)
+    score1 = expected_score(elo1)
+    return match.games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float, beta: float) -> tuple[float, float]:
+    """Returns the lower and upper log-likelihood ratio bounds of the SPRT."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def report(match: MatchScore, engine1: str, engine2: str, llr: float | None, bounds: tuple[float, float]) -> str:
+    """Formats the current match standings."""
+    elo, lower, upper = elo_estimate(match)
+    lines = [
+        f"Score of {engine1} vs {engine2}: {match.wins} - {match.losses} - {match.draws} [{(match.wins + match.draws / 2) / max(match.games, 1):.3f}] {match.games}",
+        f"Elo difference: {elo:.1f} [{lower:.1f}, {upper:.1f}] (95%), LOS: {likelihood_of_superiority(match) * 100:.1f}%",
+    ]
+    if llr is not None:
+        lines.append(f"SPRT: llr {llr:.2f} [{bounds[0]:.2f}, {bounds[1]:.2f}]")
+    if len(match.terminations) > 0:
+        lines.append("Terminations: " + ", ".join(f"{name} {count}" for name, count in sorted(match.terminations.items())))
+    return "\n".join(lines)
+
+
+########
+# MAIN #
+########
+
+def main() -> None:
+    """Plays a match between two engines and reports the Elo difference, stopping early once the SPRT concludes."""
+    parser = argparse.ArgumentParser(description="Play a match between two UCI engines.")
+    parser.add_argument("engine1", help="engine name (simPLY_chess, komodo, stockfish) or path, the engine under test")
+    parser.add_argument("engine2", help="engine name or path, the baseline")
+    parser.add_argument("--games", type=int, default=100, help="maximum number of games, rounded up to an even number")
+    parser.add_argument("--concurrency", type=int, default=2, help="number of games played in parallel")
+    parser.add_argument("--tc", default="10+0.1", help='time control: "base+inc" in seconds, "movetime=S", "nodes=N" or "depth=D"')
+    parser.add_argument("--book", action="append", help="PolyGlot book for openings (default: all bundled books)")
+    parser.add_argument("--book-plies", type=int, default=8, help="maximum opening length in half moves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pgn", default="tournament.pgn", help="file the games are appended to")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"), help="stop early once the SPRT accepts a hypothesis")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--resign-score", type=int, default=Adjudication.resign_score)
+    parser.add_argument("--resign-moves", type=int, default=Adjudication.resign_moves)
+    parser.add_argument("--draw-score", type=int, default=Adjudication.draw_score)
+    parser.add_argument("--draw-moves", type=int, default=Adjudication.draw_moves)
+    parser.add_argument("--draw-move-number", type=int, default=Adjudication.draw_move_number)
+    parser.add_argument("--max-moves", type=int, default=Adjudication.max_moves)
+    parser.add_argument("--option1", action="append", default=[], metavar="NAME=VALUE", help="UCI option of engine1, repeatable")
+    parser.add_argument("--option2", action="append", default=[], metavar="NAME=VALUE", help="UCI option of engine2, repeatable")
+    args = parser.parse_args()
+
+    for engine in (args.engine1, args.engine2):
+        try:
+            engine_command(engine)
+        except FileNotFoundError as error:
+            parser.error(str(error))
+
+    time_control = TimeControl.parse(args.tc)
+    adjudication = Adjudication(args.resign_score, args.resign_moves, args.draw_score, args.draw_moves, args.draw_move_number, args.max_moves)
+    openings = book_openings(args.book or sorted(glob(OPENING_BOOKS)), (args.games + 1) // 2, args.book_plies, args.seed)
+    if len(openings) == 0:
+        openings = [()]
+
+    # Engines with options play under names that show them, so that an engine can play itself with other settings
+    players: dict[str, Player] = {}
+    names: list[str] = []
+    for engine, settings in ((args.engine1, args.option1), (args.engine2, args.option2)):
+        options = tuple(tuple(setting.split("=", 1)) for setting in settings)
+        if any(len(option) != 2 for option in options):
+            parser.error("options must be given as NAME=VALUE")
+        name = f"{engine} ({', '.join(settings)})" if options else engine
+        if options:
+            players[name] = Player(engine, options=options)
+        names.append(name)
+    engine1, engine2 = names
+
+    jobs: list[GameJob] = []
+    for pair in range((args.games + 1) // 2):  # every opening is played twice with colors reversed
+        opening = openings[pair % len(openings)]
+        jobs.append(GameJob(2 * pair, engine1, engine2, opening, time_control, adjudication, players))
+        jobs.append(GameJob(2 * pair + 1, engine2, engine1, opening, time_control, adjudication, players))
+
+    match = MatchScore()
+    bounds = sprt_bounds(args.alpha, args.beta)
+    llr: float | None = None
+    pending: set[Future[GameResult]] = set()
+    with ProcessPoolExecutor(max_workers=args.concurrency) as executor, Path(args.pgn).open("a") as pgn_file:
+        queue = iter(jobs)
+        for job in queue:  # keep a small backlog so that an early SPRT stop doesn't leave many games to cancel
+            pending.add(executor.submit(play_game, job))
+            if len(pending) >= 2 * args.concurrency:
+                break
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            failure: BaseException | None = None
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as error:  # a worker crashed: stop with the standings of the games played so far
+                    failure = error
+                    continue
+                match.add(result, engine1)
+                pgn_file.write(result.pgn + "\n\n")
+                pgn_file.flush()
+            if failure is not None:
+                print(report(match, engine1, engine2, llr, bounds), end="\n\n", flush=True)
+                print(f"Match stopped: {type(failure).__name__}: {failure}", flush=True)
+                for future in pending:
+                    future.cancel()
+                break
+            if args.sprt is not None:
+                llr = sprt_llr(match, args.sprt[0], args.sprt[1])
+            print(report(match, engine1, engine2, llr, bounds), end="\n\n", flush=True)
+            if llr is not None and not bounds[0] < llr < bounds[1]:
+                print(f"SPRT: {'H1' if llr >= bounds[1] else 'H0'} accepted", flush=True)
+                for future in pending:
+                    future.cancel()
+                break
+            for job in queue:
+                pending.add(executor.submit(play_game, job))
+                if len(pending) >= 2 * args.concurrency:
+                    break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# OpenTelemetry OTLP/HTTP JSON format: https://opentelemetry.io/docs/specs/otlp/#json-protobuf-encoding
+
+"""Minimal, dependency free request tracing. A trace is a tree of timed spans that is exported as a whole once its root
+span ends, either as JSON lines to a local file or as OTLP/HTTP JSON to a collector. Traces are sampled at a fixed rate,
+but slow and failed ones are always kept. Run directly to show the traces in a JSONL file or to run a stub collector."""
+
+import argparse
+import json
+import pathlib
+import queue
+import random
+import sys
+import threading
+import urllib.request
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time_ns
+from types import TracebackType
+
+SERVICE_NAME: str = "webchess"
+EXPORT_QUEUE_SIZE: int = 1000  # traces waiting to be sent to a collector, further traces are dropped
+
+
+class Span:
+    """A timed operation within a trace. Spans are ended by leaving their `with` block or by calling `end()`."""
+
+    def __init__(self, tracer: "Tracer", name: str, trace: "Trace", parent_id: str | None, attributes: dict[str, object]) -> None:
+        self.tracer: Tracer = tracer
+        self.name: str = name
+        self.trace: Trace = trace
+        self.span_id: str = f"{random.getrandbits(64):016x}"
+        self.parent_id: str | None = parent_id
+        self.attributes: dict[str, object] = attributes
+        self.start: int = time_ns()
+        self.end_time: int | None = None
+        self.error: str | None = None
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exception_type: type[BaseException] | None, exception: BaseException | None, _: TracebackType | None) -> None:
+        if exception is not None and not isinstance(exception, GeneratorExit):
+            self.error = f"{exception_type.__name__}: {exception}"  # type: ignore
+        self.end()
+
+    @property
+    def duration(self) -> float:
+        """Seconds between the start and the end of the span (or now if it hasn't ended)."""
+        return ((self.end_time or time_ns()) - self.start) / 1e9
+
+    def child(self, name: str, **attributes: object) -> "Span":
+        """Starts a span nested within this one."""
+        return Span(self.tracer, name, self.trace, self.span_id, attributes)
+
+    def set(self, **attributes: object) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        if self.end_time is not None:
+            return
+        self.end_time = time_ns()
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.tracer.finish(self.trace, self)
+
+    def record(self) -> dict:
+        """The span as one line of the JSONL sink."""
+        record: dict = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start / 1e9,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+    def otlp(self) -> dict:
+        """The span in the OTLP/HTTP JSON encoding."""
+        span: dict = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if self.parent_id is None else 1,  # SPAN_KIND_SERVER for the request, SPAN_KIND_INTERNAL otherwise
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 1},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """The spans of one request, kept until the root span ends and the trace is either exported or dropped."""
+
+    def __init__(self, sampled: bool) -> None:
+        self.trace_id: str = f"{random.getrandbits(128):032x}"
+        self.sampled: bool = sampled
+        self.spans: list[Span] = []
+
+
+def otlp_value(value: object) -> dict:
+    """Encodes an attribute value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonlSink:
+    """Appends every span of a trace to a local file, one JSON object per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path: pathlib.Path = pathlib.Path(path)
+        self.lock: threading.Lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        lines: str = "".join(json.dumps(span.record(), default=str) + "\n" for span in spans)
+        with self.lock, open(self.path, "a") as file:
+            file.write(lines)
+
+
+class OtlpSink:
+    """Sends traces to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces) from a background thread, so
+    requests never wait on the collector. Traces are dropped when the collector can't keep up."""
+
+    def __init__(self, endpoint: str, timeout: float = 2) -> None:
+        self.endpoint: str = endpoint
+        self.timeout: float = timeout
+        self.queue: queue.Queue[list[Span]] = queue.Queue(EXPORT_QUEUE_SIZE)
+        threading.Thread(target=self.send_forever, name="otlp-exporter", daemon=True).start()
+
+    def export(self, spans: list[Span]) -> None:
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            pass
+
+    def send_forever(self) -> None:
+        while True:
+            spans: list[Span] = self.queue.get()
+            body: dict = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span.otlp() for span in spans]}],
+            }]}
+            request = urllib.request.Request(self.endpoint, json.dumps(body, default=str).encode(), {"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except OSError as error:
+                print(f"Could not export trace to {self.endpoint}: {error}", file=sys.stderr)
+
+
+class Tracer:
+    """Starts traces and exports the ones that are sampled. `sample_rate` is the share of traces kept at random, while
+    traces slower than `slow_threshold` seconds or ending in an error are always kept. Without a sink nothing is kept."""
+
+    def __init__(self, sink: JsonlSink | OtlpSink | None = None, sample_rate: float = 1.0, slow_threshold: float | None = None) -> None:
+        self.sink: JsonlSink | OtlpSink | None = sink
+        self.sample_rate: float = sample_rate
+        self.slow_threshold: float | None = slow_threshold
+
+    def start(self, name: str, **attributes: object) -> Span:
+        """Starts the root span of a new trace."""
+        return Span(self, name, Trace(random.random() < self.sample_rate), None, attributes)
+
+    def finish(self, trace: Trace, root: Span) -> None:
+        if self.sink is None:
+            return
+        slow: bool = self.slow_threshold is not None and root.duration >= self.slow_threshold
+        failed: bool = any(span.error is not None for span in trace.spans)
+        if trace.sampled or slow or failed:
+            self.sink.export(trace.spans)
+
+
+def tracer_from_config(sink: str, sample_rate: float = 1.0, slow_threshold: float | None = None) -> Tracer:
+    """Creates a tracer exporting to an http(s) collector endpoint or to a JSONL file, or a disabled one if the sink is
+    empty."""
+    if sink == "":
+        return Tracer()
+    if sink.startswith(("http://", "https://")):
+        return Tracer(OtlpSink(sink), sample_rate, slow_threshold)
+    return Tracer(JsonlSink(sink), sample_rate, slow_threshold)
+
+
+def read_traces(path: pathlib.Path) -> dict[str, list[dict]]:
+    """Groups the spans in a JSONL file by trace, in the order the traces were written."""
+    traces: dict[str, list[dict]] = {}
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                span: dict = json.loads(line)
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def span_tree(spans: list[dict]) -> Iterator[str]:
+    """Formats a trace as an indented tree of spans with their durations and attributes."""
+    children: dict[str | None, list[dict]] = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+
+    def lines(span: dict, depth: int) -> Iterator[str]:
+        attributes: str = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+        error: str = f" ERROR {span['error']}" if "error" in span else ""
+        yield f"{'  ' * depth}{span['name']} {span['duration'] * 1000:.2f} ms {attributes}{error}".rstrip()
+        for child in sorted(children.get(span["span_id"], []), key=lambda child: child["start"]):
+            yield from lines(child, depth + 1)
+
+    for root in children.get(None, []):
+        yield from lines(root, 0)
+
+
+def collect(port: int, output: pathlib.Path) -> None:
+    """Runs a stub OTLP/HTTP collector that accepts JSON encoded traces and appends their spans to a JSONL file."""
+    sink: JsonlSink = JsonlSink(str(output))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            body: dict = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            lines: list[str] = []
+            for resource_spans in body.get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        start: int = int(span["startTimeUnixNano"])
+                        record: dict = {
+                            "trace_id": span["traceId"],
+                            "span_id": span["spanId"],
+                            "parent_id": span.get("parentSpanId"),
+                            "name": span["name"],
+                            "start": start / 1e9,
+                            "duration": (int(span["endTimeUnixNano"]) - start) / 1e9,
+                            "attributes": {attribute["key"]: next(iter(attribute["value"].values())) for attribute in span.get("attributes", [])},
+                        }
+                        if span.get("status", {}).get("code") == 2:
+                            record["error"] = span["status"].get("message", "")
+                        lines.append(json.dumps(record) + "\n")
+            with sink.lock, open(sink.path, "a") as file:
+                file.write("".join(lines))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+    print(f"Collecting traces on http://localhost:{port}/v1/traces into {output}")
+    ThreadingHTTPServer(("", port), Handler).serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shows recorded traces or runs a stub OTLP/HTTP trace collector.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="print the traces in a JSONL file as span trees")
+    show_parser.add_argument("path", type=pathlib.Path)
+    show_parser.add_argument("--slowest", type=int, default=0, help="only show this many of the slowest traces")
+    collect_parser = subparsers.add_parser("collect", help="accept OTLP/HTTP JSON traces and append them to a JSONL file")
+    collect_parser.add_argument("output", type=pathlib.Path)
+    collect_parser.add_argument("--port", type=int, default=4318)
+    arguments = parser.parse_args()
+
+    if arguments.command == "collect":
+        collect(arguments.port, arguments.output)
+        return
+
+    traces: list[list[dict]] = list(read_traces(arguments.path).values())
+    if arguments.slowest > 0:
+        roots: list[tuple[float, list[dict]]] = [(max(span["duration"] for span in spans), spans) for spans in traces]
+        traces = [spans for _, spans in sorted(roots, key=lambda root: root[0], reverse=True)[:arguments.slowest]]
+    for spans in traces:
+        print("\n".join(span_tree(spans)) + "\n")
+
+
+if __name__ == "__main__":
+    main()